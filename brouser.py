@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, Menu, scrolledtext
 import threading
 import json
+import bisect
 import os
 import re
 from urllib.parse import urlparse, quote_plus
@@ -27,6 +28,10 @@ except ImportError:
     HTML_VIEW_AVAILABLE = False
     print("tkhtmlview not installed. Using basic display.")
 
+# Find-in-page limits
+MAX_FIND_MATCHES = 100000
+FIND_DEBOUNCE_MS = 120
+
 class EnhancedBrowser:
     def __init__(self, root):
         self.root = root
@@ -86,6 +91,9 @@ class EnhancedBrowser:
         # Create navigation bar
         self.create_navigation_bar()
         
+        # Create find bar (hidden until Ctrl+F)
+        self.create_find_bar()
+        
         # Create tabbed interface
         self.create_tabs()
         
@@ -176,6 +184,8 @@ class EnhancedBrowser:
         edit_menu.add_command(label="Cut", command=self.edit_cut)
         edit_menu.add_command(label="Copy", command=self.edit_copy)
         edit_menu.add_command(label="Paste", command=self.edit_paste)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Find in Page", command=self.show_find_bar, accelerator="Ctrl+F")
         menubar.add_cascade(label="Edit", menu=edit_menu)
         
         # View menu
@@ -303,6 +313,7 @@ class EnhancedBrowser:
         self.root.bind("<Control-w>", self.close_current_tab)
         self.root.bind("<Control-r>", self.refresh)
         self.root.bind("<Control-l>", lambda e: self.url_entry.focus())
+        self.root.bind("<Control-f>", self.show_find_bar)
 
         # Add tab bindings
         self.tab_notebook.bind("<Button-2>", self.close_tab_middle_click)  # Middle click to close
@@ -352,6 +363,11 @@ class EnhancedBrowser:
         # Add right-click menu
         content_display.bind("<Button-3>", self.show_popup_menu)
         
+        # Track scrolling so find highlights follow the viewport
+        content_display.configure(
+            yscrollcommand=lambda first, last: self.on_content_scroll(tab_id, first, last)
+        )
+        
         # Add the tab
         tab_name = "New Tab"
         self.tab_notebook.add(tab_frame, text=tab_name)
@@ -365,12 +381,17 @@ class EnhancedBrowser:
             "title": tab_name,
             "history": [],
             "position": -1,
-            "close_button": close_button
+            "close_button": close_button,
+            "find_index": None,
+            "find_generation": 0
         }
         
         self.current_tab = tab_id
         self.current_tab_id += 1
         
+        # Index the welcome text so find works before the first navigation
+        self.build_find_index(self.tab_contents[tab_id])
+        
         if url:
             self.url_var.set(url)
             self.navigate()
@@ -548,6 +569,9 @@ class EnhancedBrowser:
             tab_content["content"].config(state=tk.NORMAL)
             tab_content["content"].delete(1.0, tk.END)
             tab_content["content"].insert(tk.END, error_msg)
+        
+        # Rebuild the find index for the new page in the background
+        self.build_find_index(tab_content)
     
     def update_tab_title(self, title):
         tab_content = self.get_current_tab_content()
@@ -695,6 +719,250 @@ class EnhancedBrowser:
         except:
             pass
     
+    def create_find_bar(self):
+        self.find_frame = ttk.Frame(self.main_frame)
+        
+        ttk.Label(self.find_frame, text="Find:").pack(side=tk.LEFT, padx=(5, 2))
+        
+        self.find_var = tk.StringVar()
+        self.find_entry = ttk.Entry(self.find_frame, textvariable=self.find_var, width=30)
+        self.find_entry.pack(side=tk.LEFT, padx=2)
+        self.find_entry.bind("<Return>", lambda e: self.find_next())
+        self.find_entry.bind("<Shift-Return>", lambda e: self.find_previous())
+        self.find_entry.bind("<Escape>", self.hide_find_bar)
+        
+        # Search as you type (debounced)
+        self.find_var.trace_add("write", lambda *args: self.schedule_find())
+        
+        ttk.Button(self.find_frame, text="▲", width=3, command=self.find_previous).pack(side=tk.LEFT, padx=2)
+        ttk.Button(self.find_frame, text="▼", width=3, command=self.find_next).pack(side=tk.LEFT, padx=2)
+        
+        self.find_count_var = tk.StringVar()
+        ttk.Label(self.find_frame, textvariable=self.find_count_var).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(self.find_frame, text="×", width=2, command=self.hide_find_bar).pack(side=tk.RIGHT, padx=2)
+        
+        self.find_visible = False
+        self.find_after_id = None
+        self.highlight_after_id = None
+        # Matches are character offsets into the page text, kept sorted
+        self.find_state = {"query": None, "matches": [], "current": -1, "truncated": False, "generation": 0}
+    
+    def show_find_bar(self, event=None):
+        if not self.find_visible:
+            self.find_frame.pack(fill=tk.X, padx=5, before=self.tab_notebook)
+            self.find_visible = True
+        self.find_entry.focus_set()
+        self.find_entry.select_range(0, tk.END)
+        if self.find_var.get():
+            self.find_state["query"] = None
+            self.schedule_find()
+        return "break"
+    
+    def hide_find_bar(self, event=None):
+        if self.find_visible:
+            self.find_frame.pack_forget()
+            self.find_visible = False
+        self.find_state["generation"] += 1
+        self.find_state.update({"query": None, "matches": [], "current": -1, "truncated": False})
+        self.find_count_var.set("")
+        tab_content = self.get_current_tab_content()
+        if tab_content:
+            tab_content["content"].tag_remove("find_match", "1.0", tk.END)
+            tab_content["content"].tag_remove("find_current", "1.0", tk.END)
+        return "break"
+    
+    def build_find_index(self, tab_content):
+        """Index the page text once per load so searches never touch the widget"""
+        tab_content["find_generation"] += 1
+        generation = tab_content["find_generation"]
+        tab_content["find_index"] = None
+        if tab_content is self.get_current_tab_content():
+            self.find_state["generation"] += 1
+            self.find_state.update({"query": None, "matches": [], "current": -1, "truncated": False})
+        
+        # Widget access must stay on the Tk thread; the heavy work does not
+        text = tab_content["content"].get("1.0", "end-1c")
+        
+        def index_text():
+            lowered = text.lower()
+            if len(lowered) != len(text):
+                # A few characters expand when lowercased; keep offsets aligned
+                lowered = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+            line_starts = [0]
+            pos = text.find("\n")
+            while pos != -1:
+                line_starts.append(pos + 1)
+                pos = text.find("\n", pos + 1)
+            index = {"text": lowered, "line_starts": line_starts}
+            self.root.after(0, lambda: self.on_find_index_ready(tab_content, generation, index))
+        
+        thread = threading.Thread(target=index_text)
+        thread.daemon = True
+        thread.start()
+    
+    def on_find_index_ready(self, tab_content, generation, index):
+        if tab_content["find_generation"] != generation:
+            return  # A newer page load superseded this index
+        tab_content["find_index"] = index
+        if self.find_visible and tab_content is self.get_current_tab_content():
+            self.find_state["query"] = None
+            self.schedule_find()
+    
+    def schedule_find(self):
+        if self.find_after_id:
+            self.root.after_cancel(self.find_after_id)
+        self.find_after_id = self.root.after(FIND_DEBOUNCE_MS, self.run_find)
+    
+    def run_find(self):
+        self.find_after_id = None
+        tab_content = self.get_current_tab_content()
+        if not tab_content:
+            return
+        
+        query = self.find_var.get().lower()
+        index = tab_content["find_index"]
+        if not query:
+            self.find_state["generation"] += 1
+            self.find_state.update({"query": "", "matches": [], "current": -1, "truncated": False})
+            self.find_count_var.set("")
+            self.refresh_find_highlights()
+            return
+        if index is None:
+            self.find_count_var.set("Indexing page...")
+            return
+        
+        # Refine the previous result set when the query was only extended
+        previous = self.find_state
+        candidates = None
+        if (previous["query"] and query.startswith(previous["query"])
+                and not previous["truncated"]):
+            candidates = previous["matches"]
+        
+        previous["generation"] += 1
+        generation = previous["generation"]
+        
+        def search():
+            text = index["text"]
+            matches = []
+            truncated = False
+            if candidates is not None:
+                matches = [pos for pos in candidates if text.startswith(query, pos)]
+            else:
+                pos = text.find(query)
+                while pos != -1:
+                    if len(matches) >= MAX_FIND_MATCHES:
+                        truncated = True
+                        break
+                    matches.append(pos)
+                    pos = text.find(query, pos + 1)
+            self.root.after(0, lambda: self.on_find_results(tab_content, generation, query, matches, truncated))
+        
+        thread = threading.Thread(target=search)
+        thread.daemon = True
+        thread.start()
+    
+    def on_find_results(self, tab_content, generation, query, matches, truncated):
+        if self.find_state["generation"] != generation:
+            return  # The user kept typing; a newer search is on its way
+        if tab_content["find_index"] is None or tab_content is not self.get_current_tab_content():
+            return
+        self.find_state.update({"query": query, "matches": matches, "truncated": truncated})
+        
+        # Start from the first match at or below the top of the viewport
+        current = -1
+        if matches:
+            top = self.find_offset_from_index(tab_content, tab_content["content"].index("@0,0"))
+            current = bisect.bisect_left(matches, top) % len(matches)
+        self.find_state["current"] = current
+        self.show_current_match()
+    
+    def find_next(self):
+        self.step_find(1)
+    
+    def find_previous(self):
+        self.step_find(-1)
+    
+    def step_find(self, step):
+        matches = self.find_state["matches"]
+        if self.find_state["query"] != self.find_var.get().lower():
+            self.run_find()
+            return
+        if not matches:
+            return
+        self.find_state["current"] = (self.find_state["current"] + step) % len(matches)
+        self.show_current_match()
+    
+    def show_current_match(self):
+        tab_content = self.get_current_tab_content()
+        if not tab_content:
+            return
+        matches = self.find_state["matches"]
+        current = self.find_state["current"]
+        
+        if not matches:
+            self.find_count_var.set("No matches")
+        else:
+            total = f"{len(matches)}+" if self.find_state["truncated"] else str(len(matches))
+            self.find_count_var.set(f"{current + 1} of {total}")
+            content = tab_content["content"]
+            start = self.find_index_from_offset(tab_content, matches[current])
+            end = self.find_index_from_offset(tab_content, matches[current] + len(self.find_state["query"]))
+            content.tag_remove("find_current", "1.0", tk.END)
+            content.tag_add("find_current", start, end)
+            content.see(start)
+        self.refresh_find_highlights()
+    
+    def on_content_scroll(self, tab_id, first, last):
+        tab_content = self.tab_contents.get(tab_id)
+        if not tab_content:
+            return
+        tab_content["content"].vbar.set(first, last)
+        if self.find_visible and self.find_state["matches"] and not self.highlight_after_id:
+            self.highlight_after_id = self.root.after_idle(self.refresh_find_highlights)
+    
+    def refresh_find_highlights(self):
+        """Tag only the matches inside the viewport so huge pages stay responsive"""
+        self.highlight_after_id = None
+        tab_content = self.get_current_tab_content()
+        if not tab_content or tab_content["find_index"] is None:
+            return
+        content = tab_content["content"]
+        content.tag_remove("find_match", "1.0", tk.END)
+        
+        matches = self.find_state["matches"]
+        query_len = len(self.find_state["query"] or "")
+        if not matches or not query_len:
+            return
+        
+        content.tag_configure("find_match", background="#fff176", foreground="#000000")
+        content.tag_configure("find_current", background="#ff9800", foreground="#000000")
+        content.tag_raise("find_current", "find_match")
+        
+        first = self.find_offset_from_index(tab_content, content.index("@0,0"))
+        last = self.find_offset_from_index(
+            tab_content, content.index(f"@{content.winfo_width()},{content.winfo_height()} lineend")
+        )
+        lo = bisect.bisect_left(matches, first - query_len)
+        hi = bisect.bisect_right(matches, last)
+        for pos in matches[lo:hi]:
+            content.tag_add(
+                "find_match",
+                self.find_index_from_offset(tab_content, pos),
+                self.find_index_from_offset(tab_content, pos + query_len)
+            )
+    
+    def find_index_from_offset(self, tab_content, offset):
+        line_starts = tab_content["find_index"]["line_starts"]
+        line = bisect.bisect_right(line_starts, offset)
+        return f"{line}.{offset - line_starts[line - 1]}"
+    
+    def find_offset_from_index(self, tab_content, index):
+        line_starts = tab_content["find_index"]["line_starts"]
+        line, column = (int(part) for part in index.split("."))
+        line = min(line, len(line_starts))
+        return line_starts[line - 1] + column
+    
     def zoom_in(self):
         self.settings["font_size"] += 1
         self.status_var.set(f"Zoom level: {self.settings['font_size']}")
@@ -1215,6 +1483,7 @@ Keyboard Shortcuts:
 - Ctrl+T: New Tab
 - Ctrl+W: Close Tab
 - Ctrl+R: Refresh
+- Ctrl+F: Find in page (Enter / Shift+Enter for next / previous, Esc to close)
 - Ctrl+H: History
 - Ctrl+B: Bookmarks
 - F1: Help
@@ -1296,6 +1565,10 @@ Keyboard Shortcuts:
         tab_content = self.get_current_tab_content()
         if tab_content:
             self.url_var.set(tab_content["url"])
+            # Re-run an open search against the newly selected page
+            if self.find_visible:
+                self.find_state["query"] = None
+                self.schedule_find()
 
 # Main function to run the browser
 def main():
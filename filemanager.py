@@ -1,7 +1,4293 @@
+import bisect
+import colorsys
+import errno
+import hashlib
+import json
+import mmap
+import multiprocessing
 import os
+import re
+import queue
+import select
 import shutil
+import sqlite3
+import stat
+import struct
+import sys
+import tarfile
+import tempfile
+import threading
+import time
 import tkinter as tk
+import zipfile
+from array import array
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import lru_cache
+from itertools import compress
 from tkinter import ttk, filedialog, messagebox
+from urllib.parse import quote, unquote
+
+# Reflink clones need ioctl, which Windows doesn't have
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Pillow decodes images for thumbnails; without it only Tk's own formats (PNG, GIF) are previewed
+try:
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# inotify is reached through libc with ctypes; other platforms poll directory mtimes
+try:
+    import ctypes
+    if not sys.platform.startswith("linux"):
+        raise ImportError("inotify is Linux only")
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.inotify_init1
+    INOTIFY_AVAILABLE = True
+except (ImportError, OSError, AttributeError):
+    INOTIFY_AVAILABLE = False
+
+# Background directory loading
+LOAD_BATCH_SIZE = 500
+LOAD_POLL_MS = 30
+LOAD_FRAME_BUDGET = 0.025  # Seconds of Treeview inserts per poll before yielding to Tk
+
+# Virtual list view
+DEFAULT_VIEW_ROWS = 25
+WHEEL_SCROLL_ROWS = 3
+RENDER_CACHE_SIZE = 8192  # Formatted sizes, types and timestamps kept per kind
+DRAG_THRESHOLD = 5  # Pixels the pointer must move before a press becomes a drag
+
+# Tabs: the per-tab part of FileManager's state, swapped in and out on tab switches
+PANE_STATE_KEYS = ('current_path', 'history', 'future', 'model', 'has_parent_row', 'view_top',
+                   'selected_name', 'selected_position', 'selected_names', 'anchor_position',
+                   'search_query')
+
+# Directory listing cache and change watching
+LISTING_CACHE_SIZE = 32
+WATCH_POLL_MS = 200
+WATCH_POLL_INTERVAL = 2.0  # Seconds between mtime checks for directories inotify can't watch
+PATCH_LIMIT = 1000  # Beyond this many changed names a directory is re-read instead of patched
+COMPACT_MIN_DEAD_ROWS = 256  # Dead listing rows are dropped once there are this many and a quarter as many as live ones
+
+# Recursive directory sizes
+SIZE_SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # I/O bound, so more threads than cores
+SIZE_POLL_MS = 200
+SIZE_CACHE_TTL = 60  # Seconds a directory record is trusted; files resized in place don't change its mtime
+
+# Copy/move engine
+TRANSFER_WORKERS = 8
+TRANSFER_POLL_MS = 200
+KERNEL_COPY_CHUNK = 16 * 1024 * 1024  # Per copy_file_range/sendfile call; also the pause/cancel granularity
+BUFFERED_COPY_CHUNK = 1024 * 1024
+FICLONE = 0x40049409
+# Kernel copy paths report these when they can't handle a pair of files; fall back to the next one
+COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF}
+
+# Tree compare and sync
+SYNC_MTIME_WINDOW = 2.0  # Seconds; FAT and some network mounts store mtimes coarsely
+SYNC_HASH_WORKERS = 4
+SYNC_HASH_CHUNK = 1024 * 1024
+DELTA_MIN_SIZE = 8 * 1024 * 1024  # Changed files at least this big are patched in place block by block
+DELTA_BLOCK_SIZE = 1024 * 1024
+SYNC_POLL_MS = 200
+SYNC_DISPLAY_LIMIT = 20000
+
+# Duplicate finder
+DUPES_WORKERS = os.cpu_count() or 1
+DUPES_PARTIAL_BLOCK = 16 * 1024  # Bytes hashed from each end of a file in the partial pass
+DUPES_BATCH_FILES = 64
+DUPES_BATCH_BYTES = 256 * 1024 * 1024
+DUPES_POLL_MS = 200
+
+# Archives
+ZIP_EXTENSIONS = ('.zip', '.jar', '.whl', '.epub')
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz', '.tbz2', '.tar.xz', '.txz')
+ARCHIVE_CACHE_SIZE = 8  # Archive listings kept in memory
+
+# Batch operation queue
+BATCH_POLL_MS = 200
+
+# Benchmark suite (python filemanager.py --benchmark)
+BENCHMARK_SIZES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+BENCHMARK_FILE_BYTES = 1024  # Synthetic files are 0..this many bytes
+BENCHMARK_DEEP_FILES = 8  # Files per directory in a deep tree
+BENCHMARK_DEEP_FANOUT = 2  # Subdirectories per directory in a deep tree
+BENCHMARK_LARGE_FILE_MB = 256
+
+# Trash
+TRASH_POLL_MS = 500
+PURGE_NICE = 19  # The purger thread runs at the lowest CPU priority
+PURGE_BATCH = 256  # Unlinks between pauses
+PURGE_PAUSE = 0.02  # Seconds; keeps a huge purge from saturating the disk
+
+# Filename search index
+FILENAME_INDEX_FILE = None  # Set below once CACHE_DIR is known
+INDEX_PRUNE_NAMES = {".cache", ".git", ".hg", ".svn", "node_modules", "__pycache__"}
+INDEX_POLL_INTERVAL = 60.0  # Directories beyond the inotify budget are re-checked this often
+INDEX_MAX_WATCHES = 8192
+INDEX_COMMIT_EVERY = 200  # Directories per transaction while building, so searches see progress
+SEARCH_RESULT_LIMIT = 100000
+
+# Content search
+GREP_WORKERS = os.cpu_count() or 1  # CPU bound once the page cache is warm
+GREP_BATCH_FILES = 256  # Files per worker task, so small files don't cost one IPC round trip each
+GREP_BATCH_BYTES = 64 * 1024 * 1024
+GREP_SNIFF_BYTES = 8192  # A NUL byte in this prefix marks the file as binary, as grep does
+GREP_MAX_LINE_MATCHES = 1000  # Per file
+GREP_MAX_RESULTS = 50000
+GREP_SNIPPET_CHARS = 200
+GREP_POLL_MS = 100
+
+# Preview pane
+PREVIEW_WORKERS = 4
+PREVIEW_CACHE_SIZE = 256  # Built previews kept in memory, keyed by path and mtime
+PREVIEW_IMAGE_CACHE_SIZE = 64  # Decoded Tk images
+PREVIEW_DEBOUNCE_MS = 80  # Holding an arrow key only previews where the cursor stops
+PREVIEW_POLL_MS = 50
+PREVIEW_TEXT_BYTES = 16 * 1024
+PREVIEW_HEX_BYTES = 1024
+PREVIEW_DIRECT_IMAGE_BYTES = 2 * 1024 * 1024  # Largest PNG/GIF Tk decodes itself when Pillow is missing
+THUMBNAIL_SIZE = 256  # freedesktop "large" thumbnails
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff', '.ico'}
+TK_IMAGE_EXTENSIONS = {'.png', '.gif'}
+
+# Disk usage analyzer
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "tk-filemanager")
+SIZE_INDEX_FILE = os.path.join(CACHE_DIR, "size-index.json")
+FILENAME_INDEX_FILE = os.path.join(CACHE_DIR, "filename-index.sqlite3")
+# Home trash, per the freedesktop trash spec; other filesystems use $topdir/.Trash-$uid
+HOME_TRASH_DIR = os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "Trash")
+# Shared with other desktop applications, per the freedesktop thumbnail spec
+THUMBNAIL_DIR = os.path.join(os.path.dirname(CACHE_DIR), "thumbnails", "large")
+HASH_CACHE_FILE = os.path.join(CACHE_DIR, "hash-cache.sqlite3")
+ARCHIVE_INDEX_DIR = os.path.join(CACHE_DIR, "archive-index")
+TREEMAP_MAX_ITEMS = 150
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+def iter_directory(path):
+    """Yield (name, is_dir, size, mtime) for each entry using a single stat per entry"""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                # DirEntry caches the result, so type, size and mtime share one syscall
+                st = entry.stat()
+            except OSError:
+                try:
+                    # Broken symlink or entry vanished; describe the link itself
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+            yield entry.name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime
+
+
+def scan_directory(path):
+    """Return the directory listing of path as a list of (name, is_dir, size, mtime)"""
+    return list(iter_directory(path))
+
+
+def stat_entry(path, name):
+    """Stat one directory entry the way iter_directory does, or return None if it is gone"""
+    full_path = os.path.join(path, name)
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        try:
+            st = os.lstat(full_path)
+        except OSError:
+            return None
+    return name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def format_size(size_bytes):
+    """Convert size in bytes to human-readable format"""
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    elif size_bytes < 1024 ** 2:
+        return f"{size_bytes / 1024:.1f} KB"
+    elif size_bytes < 1024 ** 3:
+        return f"{size_bytes / (1024 ** 2):.1f} MB"
+    else:
+        return f"{size_bytes / (1024 ** 3):.1f} GB"
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def format_file_type(extension):
+    """Type column text for a file extension ('' for none)"""
+    if not extension:
+        return "File"
+    return extension[1:].upper() + " File"
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def format_seconds(seconds):
+    """Format a whole-second timestamp; files saved together share an entry"""
+    return datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+
+SORT_COLUMNS = ('name', 'size', 'type', 'modified')
+
+
+def listing_sort_orders(entries):
+    """Ascending display order of entries for every sortable column
+
+    Directories come first and ties are broken by name. Runs on the loader
+    thread, so clicking a column heading later is only a lookup.
+    """
+    name_keys = [entry[0].lower() for entry in entries]
+    dir_flags = bytearray(entry[1] for entry in entries)
+    by_name = sorted(range(len(entries)), key=name_keys.__getitem__)
+    column_keys = {
+        'size': [entry[2] for entry in entries],
+        'modified': [entry[3] for entry in entries],
+        'type': [os.path.splitext(key)[1] for key in name_keys],
+    }
+    # Stable sorts: by name, then by the column, then directories to the front
+    orders = {'name': array('q', sorted(by_name, key=dir_flags.__getitem__, reverse=True))}
+    for column, keys in column_keys.items():
+        rows = sorted(by_name, key=keys.__getitem__)
+        orders[column] = array('q', sorted(rows, key=dir_flags.__getitem__, reverse=True))
+    return orders
+
+
+class ListingModel:
+    """Column store for one directory listing plus the order rows are displayed in
+
+    Each column's ascending order is kept in sort_cache and patched along
+    with the listing, so sorting is a lookup (descending is the same order
+    reversed within directories and files) and the filter box only narrows
+    row indices. Rows are not moved or reused while patching: a removed or
+    changed entry leaves a dead row behind, which keeps every cached order
+    valid. Once dead rows pile up the columns are compacted and the cached
+    orders dropped.
+    """
+
+    def __init__(self, sort_column='name', sort_reverse=False):
+        self.names = []
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.dir_flags = bytearray()
+        self.name_keys = []  # Lowercased names, for sorting and filtering
+        self.dead_rows = 0
+        self.dead_dirs = 0
+        # Display position -> row index into the columns above
+        self.order = array('q')
+        # Name -> row index, built on first lookup
+        self.name_index = None
+        self.sort_column = sort_column
+        self.sort_reverse = sort_reverse
+        self.filter_text = ''
+        # Column -> ascending order of row indices (may include dead rows)
+        self.sort_cache = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def total_count(self):
+        """Number of entries, including those hidden by the filter"""
+        return len(self.names) - self.dead_rows
+
+    def append_batch(self, entries):
+        """Add (name, is_dir, size, mtime) entries to the end of the listing"""
+        start = len(self.names)
+        for name, is_dir, size, mtime in entries:
+            self.names.append(name)
+            self.name_keys.append(name.lower())
+            self.dir_flags.append(is_dir)
+            self.sizes.append(size)
+            self.mtimes.append(mtime)
+        if self.filter_text:
+            self.order.extend(i for i in range(start, len(self.names)) if self.filter_text in self.name_keys[i])
+        else:
+            self.order.extend(range(start, len(self.names)))
+        self.name_index = None
+        self.sort_cache = {}
+
+    def set_orders(self, orders):
+        """Adopt precomputed per-column orders and display the current sort"""
+        self.sort_cache = dict(orders)
+        self.apply_view()
+
+    def sort(self, column, reverse=False):
+        """Display rows sorted by one of SORT_COLUMNS"""
+        if column == self.sort_column and reverse == self.sort_reverse:
+            return
+        self.sort_column = column
+        self.sort_reverse = reverse
+        self.apply_view()
+
+    def set_filter(self, text):
+        """Only display rows whose name contains text (case-insensitive)"""
+        text = text.lower()
+        if text == self.filter_text:
+            return
+        previous = self.filter_text
+        self.filter_text = text
+        if previous and previous in text and len(self.order) * 4 < len(self.names):
+            # Narrowing a short list: every match is already in the current order
+            name_keys = self.name_keys
+            self.order = array('q', [i for i in self.order if text in name_keys[i]])
+        elif previous and previous in text:
+            self.order = self.filtered(self.order)
+        else:
+            self.apply_view()
+
+    def filtered(self, order):
+        """Keep the rows of order whose name contains the filter text"""
+        text = self.filter_text
+        # One pass over the names, then a C-level pick; much cheaper than indexing per row
+        keep = [text in key for key in self.name_keys]
+        return array('q', compress(order, map(keep.__getitem__, order)))
+
+    def apply_view(self):
+        """Rebuild the display order from the cached sort order and the filter"""
+        names = self.names
+        order = self.sorted_rows(self.sort_column)
+        if self.dead_rows:
+            order = array('q', [i for i in order if names[i] is not None])
+        if self.sort_reverse:
+            dirs = self.dir_count()
+            order = order[dirs - 1::-1] + order[:dirs - 1:-1] if dirs else order[::-1]
+        if self.filter_text:
+            order = self.filtered(order)
+        if order is self.sort_cache.get(self.sort_column):
+            # The display order is edited in place; keep the cached one intact
+            order = array('q', order)
+        self.order = order
+
+    def column_key(self, column):
+        """Return a row index -> sort key function for column"""
+        if column == 'size':
+            return self.sizes.__getitem__
+        if column == 'modified':
+            return self.mtimes.__getitem__
+        if column == 'type':
+            return lambda index: os.path.splitext(self.name_keys[index])[1]
+        return self.name_keys.__getitem__
+
+    def ascending_key(self, column):
+        """The full key sort_cache[column] is ordered by"""
+        column_key = self.column_key(column)
+        return lambda index: (not self.dir_flags[index], column_key(index), self.name_keys[index])
+
+    def sorted_rows(self, column):
+        """Ascending order of rows by column, directories first"""
+        order = self.sort_cache.get(column)
+        if order is None:
+            rows = [i for i, name in enumerate(self.names) if name is not None]
+            rows.sort(key=self.name_keys.__getitem__)
+            if column != 'name':
+                # Stable, so equal keys stay in name order
+                keys = [self.column_key(column)(i) if self.names[i] is not None else 0
+                        for i in range(len(self.names))]
+                rows.sort(key=keys.__getitem__)
+            rows.sort(key=self.dir_flags.__getitem__, reverse=True)
+            order = array('q', rows)
+            self.sort_cache[column] = order
+        return order
+
+    def row(self, position):
+        """Return (name, is_dir, size, mtime) for a display position"""
+        index = self.order[position]
+        return self.names[index], bool(self.dir_flags[index]), self.sizes[index], self.mtimes[index]
+
+    def row_precedes(self, a, b):
+        """True if row a is displayed before row b under the current sort"""
+        if self.dir_flags[a] != self.dir_flags[b]:
+            return self.dir_flags[a] > self.dir_flags[b]
+        key = self.column_key(self.sort_column)
+        key_a, key_b = (key(a), self.name_keys[a]), (key(b), self.name_keys[b])
+        return key_b < key_a if self.sort_reverse else key_a < key_b
+
+    def find(self, name):
+        """Return the row index holding name, or None"""
+        if self.name_index is None:
+            self.name_index = {n: i for i, n in enumerate(self.names) if n is not None}
+        return self.name_index.get(name)
+
+    def position_of(self, name):
+        """Return the display position of name, or None if it is not listed"""
+        index = self.find(name)
+        if index is None:
+            return None
+        try:
+            return self.order.index(index)
+        except ValueError:
+            return None
+
+    def positions(self):
+        """Return a row index -> display position map, in one pass over the display order"""
+        return {index: position for position, index in enumerate(self.order)}
+
+    def remove(self, name, compact=True):
+        """Drop name from the listing; its column slot is left as a dead row"""
+        index = self.find(name)
+        if index is None:
+            return
+        del self.name_index[name]
+        # The keys stay as they were, so the row's place in sort_cache is still in order
+        self.names[index] = None
+        self.dead_rows += 1
+        self.dead_dirs += self.dir_flags[index]
+        try:
+            del self.order[self.order.index(index)]
+        except ValueError:
+            pass  # Hidden by the filter
+        if compact:
+            self.compact()
+
+    def upsert(self, entry):
+        """Insert or update one entry, keeping the display and cached orders sorted"""
+        name, is_dir, size, mtime = entry
+        index = self.find(name)
+        if (index is not None and bool(self.dir_flags[index]) == is_dir
+                and self.sizes[index] == size and self.mtimes[index] == mtime):
+            return
+        if index is not None:
+            self.remove(name, compact=False)
+        
+        index = len(self.names)
+        self.names.append(name)
+        self.name_keys.append(name.lower())
+        self.dir_flags.append(is_dir)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.name_index[name] = index
+        for column, order in self.sort_cache.items():
+            bisect.insort(order, index, key=self.ascending_key(column))
+        if not self.filter_text or self.filter_text in self.name_keys[index]:
+            # Binary search with the sort's own comparison, which may be descending
+            low, high = 0, len(self.order)
+            while low < high:
+                middle = (low + high) // 2
+                if self.row_precedes(self.order[middle], index):
+                    low = middle + 1
+                else:
+                    high = middle
+            self.order.insert(low, index)
+        self.compact()
+
+    def compact(self):
+        """Drop dead rows once they reach a quarter of the live ones, keeping the display order"""
+        live = len(self.names) - self.dead_rows
+        if self.dead_rows < max(COMPACT_MIN_DEAD_ROWS, live // 4):
+            return
+        keep = [i for i, name in enumerate(self.names) if name is not None]
+        new_index = array('q', bytes(8 * len(self.names)))
+        for new, old in enumerate(keep):
+            new_index[old] = new
+        self.names = [self.names[i] for i in keep]
+        self.name_keys = [self.name_keys[i] for i in keep]
+        self.sizes = array('q', [self.sizes[i] for i in keep])
+        self.mtimes = array('d', [self.mtimes[i] for i in keep])
+        self.dir_flags = bytearray(self.dir_flags[i] for i in keep)
+        self.order = array('q', [new_index[i] for i in self.order])
+        self.dead_rows = 0
+        self.dead_dirs = 0
+        self.name_index = None
+        # Rebuilt on demand from the compacted columns
+        self.sort_cache = {}
+
+    def dir_count(self):
+        return self.dir_flags.count(1) - self.dead_dirs
+
+class DirectoryWatcher:
+    """Report changes in watched directories as (path, names) tuples on a queue
+
+    names is a set of changed entry names, or None when the whole directory
+    has to be treated as changed (queue overflow, directory moved or deleted,
+    or an mtime change seen by the polling fallback).
+    """
+
+    def __init__(self, poll_interval=WATCH_POLL_INTERVAL, max_watches=None):
+        self.poll_interval = poll_interval
+        self.max_watches = max_watches
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.watch_descriptors = {}  # path -> inotify watch descriptor
+        self.watched_paths = {}  # inotify watch descriptor -> path
+        self.polled = {}  # path -> st_mtime_ns, for paths inotify could not watch
+        self.fd = None
+        if INOTIFY_AVAILABLE:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+        
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def is_live(self, path):
+        """True if changes to path arrive as inotify events rather than by polling"""
+        return path in self.watch_descriptors
+
+    def watch(self, path):
+        with self.lock:
+            if path in self.watch_descriptors or path in self.polled:
+                return
+            if self.fd is not None and (self.max_watches is None
+                                        or len(self.watch_descriptors) < self.max_watches):
+                wd = libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+                if wd >= 0:
+                    self.watch_descriptors[path] = wd
+                    self.watched_paths[wd] = path
+                    return
+            # No inotify, or out of watches: fall back to polling the directory mtime
+            try:
+                self.polled[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+
+    def unwatch(self, path):
+        with self.lock:
+            self.polled.pop(path, None)
+            wd = self.watch_descriptors.pop(path, None)
+            if wd is not None:
+                self.watched_paths.pop(wd, None)
+                libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self):
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            if self.fd is not None:
+                readable, _, _ = select.select([self.fd], [], [], self.poll_interval)
+                if readable:
+                    self.read_inotify_events()
+            else:
+                time.sleep(self.poll_interval)
+            
+            if time.monotonic() >= next_poll:
+                self.poll_mtimes()
+                next_poll = time.monotonic() + self.poll_interval
+
+    def read_inotify_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        
+        # Coalesce everything in this read into one set of names per directory
+        changes = {}
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+            offset += 16 + length
+            
+            if mask & IN_Q_OVERFLOW:
+                with self.lock:
+                    for path in self.watch_descriptors:
+                        changes[path] = None
+                continue
+            
+            with self.lock:
+                path = self.watched_paths.get(wd)
+                if mask & IN_IGNORED and path is not None:
+                    self.watched_paths.pop(wd, None)
+                    self.watch_descriptors.pop(path, None)
+            if path is None:
+                continue
+            
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED) or not name:
+                changes[path] = None
+            elif path not in changes or changes[path] is not None:
+                changes.setdefault(path, set()).add(os.fsdecode(name))
+        
+        for path, names in changes.items():
+            self.events.put((path, names))
+
+    def poll_mtimes(self):
+        with self.lock:
+            polled = list(self.polled.items())
+        for path, mtime in polled:
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                current = None
+            if current != mtime:
+                with self.lock:
+                    if path in self.polled:
+                        self.polled[path] = current
+                self.events.put((path, None))
+
+
+class FilenameIndex:
+    """Persistent, live index of every path under a root, like locate
+
+    Paths are stored in SQLite with an FTS5 trigram index over them, so
+    substring (LIKE) and glob queries are answered from the index instead
+    of a directory walk. Each indexed directory's mtime is recorded; a
+    rebuild only re-lists directories whose mtime changed. After the first
+    pass, inotify (or mtime polling past the watch budget) keeps it current.
+    """
+
+    def __init__(self, root, filename=FILENAME_INDEX_FILE):
+        self.root = os.path.normpath(root)
+        self.filename = filename
+        self.status = "starting"
+        self.indexed_dirs = 0
+        self.trigram = True
+        self.watcher = DirectoryWatcher(poll_interval=INDEX_POLL_INTERVAL, max_watches=INDEX_MAX_WATCHES)
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def connect(self):
+        conn = sqlite3.connect(self.filename, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create_schema(self, conn):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS paths (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, parent TEXT NOT NULL,
+                is_dir INTEGER NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS paths_parent ON paths(parent);
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL);
+        """)
+        try:
+            conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS path_fts USING fts5(
+                    path, tokenize='trigram', content='paths', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS paths_ai AFTER INSERT ON paths BEGIN
+                    INSERT INTO path_fts(rowid, path) VALUES (new.id, new.path);
+                END;
+                CREATE TRIGGER IF NOT EXISTS paths_ad AFTER DELETE ON paths BEGIN
+                    INSERT INTO path_fts(path_fts, rowid, path) VALUES ('delete', old.id, old.path);
+                END;
+            """)
+        except sqlite3.OperationalError:
+            # SQLite older than 3.34 has no trigram tokenizer; queries scan the paths table instead
+            self.trigram = False
+        conn.commit()
+
+    def run(self):
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            conn = self.connect()
+            self.create_schema(conn)
+            self.status = "indexing"
+            self.refresh_tree(conn, self.root)
+            conn.commit()
+            self.status = "ready"
+        except (OSError, sqlite3.Error) as e:
+            self.status = f"unavailable ({e})"
+            return
+        
+        while True:
+            # Block for the first change, then drain whatever else is queued
+            changes = {}
+            path, names = self.watcher.events.get()
+            while True:
+                if names is None or changes.get(path, set()) is None:
+                    changes[path] = None
+                else:
+                    changes.setdefault(path, set()).update(names)
+                try:
+                    path, names = self.watcher.events.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                for path, names in changes.items():
+                    self.apply_changes(conn, path, names)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+
+    def refresh_tree(self, conn, top):
+        """Bring the index for the tree under top up to date, re-listing only changed directories"""
+        stack = [top]
+        pending = 0
+        while stack:
+            dir_path = stack.pop()
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                self.remove_subtree(conn, dir_path)
+                continue
+            
+            row = conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (dir_path,)).fetchone()
+            if row is None or row[0] != mtime_ns:
+                self.rescan_dir(conn, dir_path, mtime_ns)
+            self.watcher.watch(dir_path)
+            self.indexed_dirs += 1
+            
+            for (child,) in conn.execute("SELECT path FROM paths WHERE parent = ? AND is_dir = 1", (dir_path,)):
+                if os.path.basename(child) not in INDEX_PRUNE_NAMES:
+                    stack.append(child)
+            
+            pending += 1
+            if pending >= INDEX_COMMIT_EVERY:
+                conn.commit()
+                pending = 0
+
+    def rescan_dir(self, conn, dir_path, mtime_ns):
+        """Re-list one directory and apply the difference to the index"""
+        try:
+            listing = {os.path.join(dir_path, name): (is_dir, size, mtime)
+                       for name, is_dir, size, mtime in iter_directory(dir_path)}
+        except OSError:
+            listing = {}
+        existing = {path for (path,) in conn.execute("SELECT path FROM paths WHERE parent = ?", (dir_path,))}
+        
+        for path in existing - listing.keys():
+            self.remove_subtree(conn, path)
+        for path, (is_dir, size, mtime) in listing.items():
+            self.upsert(conn, path, dir_path, is_dir, size, mtime, path in existing)
+        conn.execute("INSERT OR REPLACE INTO dirs(path, mtime_ns) VALUES (?, ?)", (dir_path, mtime_ns))
+
+    def upsert(self, conn, path, parent, is_dir, size, mtime, exists):
+        if exists:
+            # The path itself is unchanged, so the FTS index needs no update
+            conn.execute("UPDATE paths SET is_dir = ?, size = ?, mtime = ? WHERE path = ?",
+                         (int(is_dir), size, mtime, path))
+        else:
+            conn.execute("INSERT INTO paths(path, parent, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                         (path, parent, int(is_dir), size, mtime))
+
+    def remove_subtree(self, conn, path):
+        """Drop path and everything below it"""
+        # Everything under path/ sorts between path + '/' and path + '0' ('0' follows '/')
+        low, high = path + os.sep, path + chr(ord(os.sep) + 1)
+        for (dir_path,) in conn.execute("SELECT path FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                                        (path, low, high)).fetchall():
+            self.watcher.unwatch(dir_path)
+        conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+        conn.execute("DELETE FROM paths WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+
+    def apply_changes(self, conn, dir_path, names):
+        """Apply watcher events for one directory"""
+        if names is None:
+            self.refresh_tree(conn, dir_path)
+            return
+        for name in names:
+            path = os.path.join(dir_path, name)
+            entry = stat_entry(dir_path, name)
+            if entry is None:
+                self.remove_subtree(conn, path)
+                continue
+            _, is_dir, size, mtime = entry
+            exists = conn.execute("SELECT 1 FROM paths WHERE path = ?", (path,)).fetchone() is not None
+            self.upsert(conn, path, dir_path, is_dir, size, mtime, exists)
+            if is_dir and name not in INDEX_PRUNE_NAMES:
+                self.refresh_tree(conn, path)
+
+    def search(self, query, under=None, limit=SEARCH_RESULT_LIMIT, cancel=None):
+        """Yield batches of (path, is_dir, size, mtime) matching query
+
+        A query with *, ? or [ is a glob, matched against the file name
+        alone, where * and ? never match a separator. A glob containing a
+        separator is matched against the end of the full path instead (the
+        whole path if it is absolute), and there * does cross folders.
+        Anything else is a case-insensitive substring of the full path.
+        """
+        conn = self.connect()
+        try:
+            column = "f.path" if self.trigram else "p.path"
+            source = "path_fts f JOIN paths p ON p.id = f.rowid" if self.trigram else "paths p"
+            if any(c in query for c in "*?[") and os.sep in query:
+                pattern = query if os.path.isabs(query) else "*" + os.sep + query
+                condition, args = f"{column} GLOB ?", [pattern]
+            elif any(c in query for c in "*?["):
+                # The */ prefix lets the trigram index narrow the rows, but GLOB's * and ? also match
+                # a separator, so the file name is matched on its own as well
+                conn.create_function("basename", 1, os.path.basename, deterministic=True)
+                condition, args = f"{column} GLOB ? AND basename(p.path) GLOB ?", ["*" + os.sep + query, query]
+            else:
+                escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                condition, args = f"{column} LIKE ? ESCAPE '\\'", [f"%{escaped}%"]
+            if under:
+                under = os.path.normpath(under)
+                condition += " AND p.path >= ? AND p.path < ?"
+                args += [under + os.sep, under + chr(ord(os.sep) + 1)]
+            
+            cursor = conn.execute(
+                f"SELECT p.path, p.is_dir, p.size, p.mtime FROM {source} WHERE {condition} LIMIT ?",
+                args + [limit])
+            while True:
+                if cancel is not None and cancel.is_set():
+                    return
+                rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+                if not rows:
+                    return
+                yield [(path, bool(is_dir), size, mtime) for path, is_dir, size, mtime in rows]
+        finally:
+            conn.close()
+
+
+def make_process_pool(workers):
+    """Process pool whose workers don't inherit the Tk process"""
+    # forkserver keeps Tk and the GUI threads out of the workers
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+class WorkerPool:
+    """Process pool running function(batch, *args) on batches of files, surviving worker crashes
+
+    The workers mmap the files they read, and a file truncated while it is
+    mapped kills its worker with SIGBUS, which breaks the whole pool. The
+    pool is then rebuilt and the batches that were in flight are re-run one
+    file at a time, with nothing else running, so only a file that crashes
+    a worker on its own is lost. wait() reports it as (batch, None).
+    """
+
+    def __init__(self, workers, function):
+        self.workers = workers
+        self.function = function
+        self.pool = make_process_pool(workers)
+        self.pending = {}  # future -> (batch, args)
+        self.suspects = deque()  # (file, args) to re-run alone after a crash
+        self.held = deque()  # (batch, args) submitted while suspects were running
+        self.running_suspect = False  # The one batch in flight is a suspect run alone
+
+    def __len__(self):
+        """Batches submitted and not yet returned by wait()"""
+        return len(self.pending) + len(self.suspects) + len(self.held)
+
+    def submit(self, batch, *args):
+        if self.suspects:
+            self.held.append((batch, args))
+        else:
+            self.start(batch, args)
+
+    def start(self, batch, args):
+        self.pending[self.pool.submit(self.function, batch, *args)] = (batch, args)
+
+    def wait(self, timeout=None):
+        """Wait for batches to finish and return [(batch, result)]"""
+        if not self.pending:
+            self.start_next()
+            if not self.pending:
+                return []
+        done, _ = wait(self.pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        finished = []
+        broken = []
+        for future in done:
+            batch, args = self.pending.pop(future)
+            try:
+                finished.append((batch, future.result()))
+            except BrokenProcessPool:
+                broken.append((batch, args))
+        if broken:
+            if self.running_suspect:
+                finished.append((broken[0][0], None))
+            else:
+                # Every batch in flight fails with the pool, not just the one that crashed it
+                for batch, args in broken + list(self.pending.values()):
+                    self.suspects.extend((path, args) for path in batch)
+            self.pending.clear()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = make_process_pool(self.workers)
+        self.start_next()
+        return finished
+
+    def start_next(self):
+        """Run the next suspect alone, or once they are cleared, the held batches"""
+        if self.pending:
+            return
+        self.running_suspect = bool(self.suspects)
+        if self.suspects:
+            path, args = self.suspects.popleft()
+            self.start([path], args)
+            return
+        while self.held:
+            self.start(*self.held.popleft())
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def grep_file(path, pattern, literal):
+    """Return [(line number, line text)] for lines of path matching pattern
+
+    pattern is bytes for a literal case-sensitive search (matched with
+    mmap.find) or a compiled bytes regex. Returns None for binary files.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if b'\0' in mm[:GREP_SNIFF_BYTES]:
+                return None
+            
+            matches = []
+            line_number = 1
+            counted_to = 0
+            position = 0
+            while len(matches) < GREP_MAX_LINE_MATCHES:
+                if literal:
+                    start = mm.find(pattern, position)
+                    if start < 0:
+                        break
+                else:
+                    match = pattern.search(mm, position)
+                    if match is None:
+                        break
+                    start = match.start()
+                
+                line_start = mm.rfind(b'\n', 0, start) + 1
+                line_end = mm.find(b'\n', start)
+                if line_end < 0:
+                    line_end = size
+                line_number += mm[counted_to:line_start].count(b'\n')
+                counted_to = line_start
+                
+                text = mm[line_start:min(line_end, line_start + GREP_SNIPPET_CHARS)]
+                matches.append((line_number, text.decode('utf-8', 'replace').rstrip('\r')))
+                # One hit per line, like grep; carry on from the next line
+                position = line_end + 1
+                if position >= size:
+                    break
+            return matches
+
+
+def grep_files(paths, pattern, literal):
+    """Search a batch of files in a worker process
+
+    Returns (results, bytes scanned, binary files skipped, unreadable files)
+    where results holds (path, matches) for files with at least one match.
+    """
+    results = []
+    scanned = 0
+    binary = 0
+    errors = 0
+    for path in paths:
+        try:
+            matches = grep_file(path, pattern, literal)
+        except (OSError, ValueError):
+            errors += 1
+            continue
+        if matches is None:
+            binary += 1
+            continue
+        try:
+            scanned += os.path.getsize(path)
+        except OSError:
+            pass
+        if matches:
+            results.append((path, matches))
+    return results, scanned, binary, errors
+
+
+class ContentSearch:
+    """Searches file contents under a directory with a pool of worker processes
+
+    A walker thread batches regular files and feeds them to the pool,
+    keeping a couple of batches per worker in flight; matches are put on
+    the results queue as (path, [(line, text)]) and counters in progress.
+    """
+
+    def __init__(self, root, query, ignore_case=False, regex=False, workers=GREP_WORKERS):
+        self.root = root
+        self.workers = workers
+        self.progress = {"files": 0, "bytes": 0, "binary": 0, "errors": 0, "matches": 0,
+                         "started": time.monotonic(), "finished": None}
+        self.results = queue.Queue()
+        self.cancel_event = threading.Event()
+        
+        if regex or ignore_case:
+            source = query.encode('utf-8') if regex else re.escape(query.encode('utf-8'))
+            # Compiled in the caller so a bad expression is reported before anything starts
+            self.pattern = re.compile(source, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+            self.literal = False
+        else:
+            self.pattern = query.encode('utf-8')
+            self.literal = True
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_finished(self):
+        return self.progress["finished"] is not None
+
+    def rate(self):
+        """Bytes searched per second"""
+        end = self.progress["finished"] or time.monotonic()
+        elapsed = end - self.progress["started"]
+        return self.progress["bytes"] / elapsed if elapsed > 0 else 0
+
+    def iter_batches(self):
+        """Walk the tree, yielding lists of regular file paths"""
+        batch = []
+        batch_bytes = 0
+        stack = [self.root]
+        while stack and not self.cancel_event.is_set():
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                batch.append(entry.path)
+                                batch_bytes += entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            self.progress["errors"] += 1
+                            continue
+                        if len(batch) >= GREP_BATCH_FILES or batch_bytes >= GREP_BATCH_BYTES:
+                            yield batch
+                            batch = []
+                            batch_bytes = 0
+            except OSError:
+                self.progress["errors"] += 1
+        if batch:
+            yield batch
+
+    def collect(self, finished):
+        progress = self.progress
+        for batch, result in finished:
+            if result is None:
+                # The file crashed its worker (truncated while mapped)
+                progress["errors"] += len(batch)
+                continue
+            results, scanned, binary, errors = result
+            progress["bytes"] += scanned
+            progress["binary"] += binary
+            progress["errors"] += errors
+            for path, matches in results:
+                progress["matches"] += len(matches)
+                self.results.put((path, matches))
+
+    def run(self):
+        pool = WorkerPool(self.workers, grep_files)
+        try:
+            for batch in self.iter_batches():
+                pool.submit(batch, self.pattern, self.literal)
+                self.progress["files"] += len(batch)
+                if len(pool) >= self.workers * 2:
+                    self.collect(pool.wait())
+                if self.cancel_event.is_set():
+                    break
+            
+            while len(pool) and not self.cancel_event.is_set():
+                self.collect(pool.wait(timeout=0.2))
+        except Exception as e:
+            self.results.put((None, str(e)))
+        finally:
+            pool.shutdown()
+            self.progress["finished"] = time.monotonic()
+
+
+def read_png_text(path):
+    """Return the tEXt chunks of a PNG file as a dict"""
+    text = {}
+    with open(path, 'rb') as f:
+        if f.read(8) != b'\x89PNG\r\n\x1a\n':
+            return text
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, kind = struct.unpack('>I4s', header)
+            if kind == b'IDAT':
+                # Metadata the spec cares about always comes before the image data
+                break
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)  # CRC
+            if kind == b'tEXt' and b'\0' in data:
+                key, value = data.split(b'\0', 1)
+                text[key.decode('latin-1')] = value.decode('latin-1')
+    return text
+
+
+def hex_dump(data):
+    """Format bytes as offset, hex and ASCII columns"""
+    lines = []
+    for offset in range(0, len(data), 16):
+        chunk = data[offset:offset + 16]
+        hex_part = ' '.join(f"{b:02x}" for b in chunk)
+        ascii_part = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+        lines.append(f"{offset:08x}  {hex_part:<47}  {ascii_part}")
+    return '\n'.join(lines)
+
+
+class PreviewLoader:
+    """Builds file previews on a worker pool, with a bounded in-memory LRU in front
+
+    A preview is ('text', str), ('hex', str), ('image', png path) or
+    ('message', str). Image previews are freedesktop thumbnails: looked up
+    by the MD5 of the file URI and reused while their Thumb::MTime matches.
+    """
+
+    def __init__(self, workers=PREVIEW_WORKERS, cache_size=PREVIEW_CACHE_SIZE):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (path, mtime) -> preview
+        self.pending = {}  # (path, mtime) -> future
+        self.lock = threading.Lock()
+
+    def get(self, path, mtime):
+        """Return the cached preview, or None"""
+        key = (path, mtime)
+        with self.lock:
+            preview = self.cache.get(key)
+            if preview is not None:
+                self.cache.move_to_end(key)
+            return preview
+
+    def request(self, path, mtime, size):
+        """Start building a preview unless it is cached or already being built; returns the future"""
+        key = (path, mtime)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pool.submit(self.build, path, mtime, size)
+                self.pending[key] = future
+            return future
+
+    def build(self, path, mtime, size):
+        try:
+            preview = self.make_preview(path, mtime, size)
+        except OSError as e:
+            preview = ('message', f"No preview: {e.strerror or e}")
+        except Exception as e:
+            preview = ('message', f"No preview: {e}")
+        key = (path, mtime)
+        with self.lock:
+            self.pending.pop(key, None)
+            self.cache[key] = preview
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return preview
+
+    def make_preview(self, path, mtime, size):
+        extension = os.path.splitext(path)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            return self.make_image_preview(path, mtime, size, extension)
+        
+        with open(path, 'rb') as f:
+            head = f.read(PREVIEW_TEXT_BYTES)
+        if b'\0' in head:
+            return ('hex', hex_dump(head[:PREVIEW_HEX_BYTES]))
+        text = head.decode('utf-8', 'replace')
+        if size > len(head):
+            # Don't show a character cut in half at the end of the head
+            text = text[:text.rfind('\n') + 1] or text
+        return ('text', text)
+
+    def make_image_preview(self, path, mtime, size, extension):
+        uri = 'file://' + quote(os.path.abspath(path))
+        thumbnail = os.path.join(THUMBNAIL_DIR, hashlib.md5(uri.encode('utf-8')).hexdigest() + '.png')
+        try:
+            text = read_png_text(thumbnail)
+            if text.get('Thumb::URI') == uri and text.get('Thumb::MTime') == str(int(mtime)):
+                return ('image', thumbnail)
+        except OSError:
+            pass
+        
+        if PIL_AVAILABLE:
+            self.write_thumbnail(path, thumbnail, uri, mtime, size)
+            return ('image', thumbnail)
+        if extension in TK_IMAGE_EXTENSIONS and size <= PREVIEW_DIRECT_IMAGE_BYTES:
+            return ('image', path)
+        return ('message', "Install Pillow to preview this image")
+
+    def write_thumbnail(self, path, thumbnail, uri, mtime, size):
+        """Scale path down and store it in the shared thumbnail cache"""
+        with Image.open(path) as image:
+            # JPEG can decode straight at a reduced scale, which is most of the speedup
+            image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            info = PngInfo()
+            info.add_text('Thumb::URI', uri)
+            info.add_text('Thumb::MTime', str(int(mtime)))
+            info.add_text('Thumb::Size', str(size))
+            
+            os.makedirs(THUMBNAIL_DIR, mode=0o700, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=THUMBNAIL_DIR, suffix='.png')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    image.save(f, 'PNG', pnginfo=info)
+                os.replace(temp_path, thumbnail)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+
+
+class ListingCache:
+    """Bounded LRU of directory listings kept current by a DirectoryWatcher"""
+
+    def __init__(self, watcher, capacity=LISTING_CACHE_SIZE):
+        self.watcher = watcher
+        self.capacity = capacity
+        self.entries = OrderedDict()  # path -> (model, directory st_mtime_ns)
+
+    def get(self, path):
+        """Return the cached model for path, or None if it is missing or stale"""
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        model, mtime = entry
+        if not self.watcher.is_live(path):
+            # Without inotify the directory mtime is the only freshness signal
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    self.invalidate(path)
+                    return None
+            except OSError:
+                self.invalidate(path)
+                return None
+        self.entries.move_to_end(path)
+        return model
+
+    def peek(self, path):
+        """Return the cached model for path without touching the LRU order"""
+        entry = self.entries.get(path)
+        return entry[0] if entry else None
+
+    def put(self, path, model, mtime):
+        self.entries[path] = (model, mtime)
+        self.entries.move_to_end(path)
+        self.watcher.watch(path)
+        while len(self.entries) > self.capacity:
+            evicted, _ = self.entries.popitem(last=False)
+            self.watcher.unwatch(evicted)
+
+    def invalidate(self, path):
+        if self.entries.pop(path, None) is not None:
+            self.watcher.unwatch(path)
+
+
+class DirectorySizeScanner:
+    """du-style recursive size scanner with a per-directory cache keyed on mtime
+
+    Each directory is read once with os.scandir and summarised in a record:
+    bytes and count of its own files, its subdirectory names, and the
+    (dev, inode, size) of files with more than one hard link so they are
+    only counted once per scan. A directory whose mtime is unchanged and
+    that was read within SIZE_CACHE_TTL is not read again; only its
+    subdirectories are revisited. A file growing or shrinking in place
+    leaves its directory's mtime alone, so older records are read again.
+    """
+
+    def __init__(self, workers=SIZE_SCAN_WORKERS):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.cache = {}  # directory path -> record
+        self.index_loaded = False
+
+    def scan_one(self, dir_path):
+        """Summarise one directory, returning (dir_path, record, error)"""
+        try:
+            mtime = os.stat(dir_path).st_mtime_ns
+            with self.lock:
+                record = self.cache.get(dir_path)
+            now = time.time()
+            if record is not None and record["mtime"] == mtime and now - record["checked"] < SIZE_CACHE_TTL:
+                return dir_path, record, None
+            
+            record = {"mtime": mtime, "checked": now, "bytes": 0, "count": 0, "subdirs": [], "links": [],
+                      "errors": 0}
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        # Symbolic links are neither followed nor counted
+                        if entry.is_dir(follow_symlinks=False):
+                            record["subdirs"].append(entry.name)
+                            continue
+                        if entry.is_symlink():
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        record["errors"] += 1
+                        continue
+                    record["count"] += 1
+                    if st.st_nlink > 1:
+                        record["links"].append((st.st_dev, st.st_ino, st.st_size))
+                    else:
+                        record["bytes"] += st.st_size
+            with self.lock:
+                self.cache[dir_path] = record
+            return dir_path, record, None
+        except OSError as e:
+            return dir_path, None, e
+
+    def scan(self, path, progress=None, cancel=None):
+        """Total the tree under path; progress is a dict updated in place while scanning"""
+        if progress is None:
+            progress = {}
+        progress.update({"bytes": 0, "files": 0, "dirs": 0, "errors": 0,
+                         "error_samples": [], "done": False, "cancelled": False})
+        seen_links = set()
+        visited = set()
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(self.scan_one, path)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if cancel is not None and cancel.is_set():
+                    for future in pending:
+                        future.cancel()
+                    progress["cancelled"] = True
+                    return progress
+                
+                for future in done:
+                    dir_path, record, error = future.result()
+                    visited.add(dir_path)
+                    if error is not None:
+                        progress["errors"] += 1
+                        if len(progress["error_samples"]) < 5:
+                            progress["error_samples"].append(f"{dir_path}: {error.strerror or error}")
+                        continue
+                    
+                    total = record["bytes"]
+                    for dev, ino, size in record["links"]:
+                        if (dev, ino) not in seen_links:
+                            seen_links.add((dev, ino))
+                            total += size
+                    progress["bytes"] += total
+                    progress["files"] += record["count"]
+                    progress["dirs"] += 1
+                    progress["errors"] += record["errors"]
+                    
+                    for name in record["subdirs"]:
+                        pending.add(pool.submit(self.scan_one, os.path.join(dir_path, name)))
+        
+        self.prune(path, visited)
+        progress["done"] = True
+        return progress
+
+    def prune(self, path, visited):
+        """Forget cached directories under path that a complete scan no longer reached"""
+        prefix = os.path.join(path, "")
+        with self.lock:
+            stale = [d for d in self.cache if (d == path or d.startswith(prefix)) and d not in visited]
+            for dir_path in stale:
+                del self.cache[dir_path]
+
+    def rollup(self, path):
+        """Return {directory: bytes in its whole subtree} for the cached tree under path"""
+        totals = {}
+        seen_links = set()
+        with self.lock:
+            cache = dict(self.cache)
+        
+        # Iterative post-order walk so deep trees don't hit the recursion limit
+        stack = [(path, False)]
+        while stack:
+            dir_path, children_done = stack.pop()
+            record = cache.get(dir_path)
+            if record is None:
+                totals[dir_path] = 0
+                continue
+            if not children_done:
+                stack.append((dir_path, True))
+                for name in record["subdirs"]:
+                    stack.append((os.path.join(dir_path, name), False))
+                continue
+            
+            total = record["bytes"]
+            for dev, ino, size in record["links"]:
+                if (dev, ino) not in seen_links:
+                    seen_links.add((dev, ino))
+                    total += size
+            for name in record["subdirs"]:
+                total += totals.get(os.path.join(dir_path, name), 0)
+            totals[dir_path] = total
+        return totals
+
+    def own_bytes(self, path):
+        """Bytes of the files directly inside path, from the cache"""
+        with self.lock:
+            record = self.cache.get(path)
+        if record is None:
+            return 0
+        return record["bytes"] + sum(size for _, _, size in record["links"])
+
+    def load(self, filename=SIZE_INDEX_FILE):
+        """Read a saved size index so the next scan only revisits changed directories"""
+        self.index_loaded = True
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != 2:
+            return
+        records = {}
+        for dir_path, (mtime, checked, size, count, subdirs, links, errors) in data["dirs"].items():
+            records[dir_path] = {"mtime": mtime, "checked": checked, "bytes": size, "count": count,
+                                 "subdirs": subdirs, "links": [tuple(link) for link in links], "errors": errors}
+        with self.lock:
+            records.update(self.cache)
+            self.cache = records
+
+    def save(self, filename=SIZE_INDEX_FILE):
+        """Write the size index atomically"""
+        with self.lock:
+            dirs = {d: [r["mtime"], r["checked"], r["bytes"], r["count"], r["subdirs"], r["links"], r["errors"]]
+                    for d, r in self.cache.items()}
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        temp_name = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_name, 'w') as f:
+            json.dump({"version": 2, "dirs": dirs}, f)
+        os.replace(temp_name, filename)
+
+
+def squarify(values, x, y, width, height):
+    """Squarified treemap layout of positive values sorted descending; returns (x, y, w, h) per value"""
+    rects = []
+    total = sum(values)
+    if total <= 0 or width <= 0 or height <= 0:
+        return rects
+    
+    def worst(row, side):
+        row_sum = sum(row)
+        return max(side * side * max(row) / (row_sum * row_sum), row_sum * row_sum / (side * side * min(row)))
+    
+    scale = width * height / total
+    areas = [value * scale for value in values]
+    i = 0
+    while i < len(areas):
+        side = min(width, height)
+        row = [areas[i]]
+        i += 1
+        while i < len(areas) and worst(row + [areas[i]], side) <= worst(row, side):
+            row.append(areas[i])
+            i += 1
+        
+        # Lay the row along the short side, then shrink the remaining box
+        row_sum = sum(row)
+        if width >= height:
+            thickness = row_sum / height
+            offset = y
+            for area in row:
+                rects.append((x, offset, thickness, area / thickness))
+                offset += area / thickness
+            x += thickness
+            width -= thickness
+        else:
+            thickness = row_sum / width
+            offset = x
+            for area in row:
+                rects.append((offset, y, area / thickness, thickness))
+                offset += area / thickness
+            y += thickness
+            height -= thickness
+    return rects
+
+
+class TransferCancelled(Exception):
+    """Raised inside a TransferJob's workers when the job is cancelled"""
+
+
+class TransferJob:
+    """Copy or move (source, destination) pairs on worker threads
+
+    Small files are copied in parallel. File data goes through the cheapest
+    path the kernel offers: a reflink clone, then copy_file_range, then
+    sendfile, then a plain read/write loop. Every file is written to a
+    temporary name and renamed into place, so a cancelled job never leaves
+    a half-written file behind; files and directories the job created are
+    removed on cancel. Moves within one filesystem are a single rename.
+    
+    With delta=True, large files that already exist at the destination
+    are compared block by block and only the differing blocks rewritten.
+    """
+
+    def __init__(self, items, move=False, workers=TRANSFER_WORKERS, delta=False):
+        self.items = list(items)
+        self.move = move
+        self.delta = delta
+        self.unchanged_bytes = 0  # Bytes delta copies found already in place
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = threading.Event()
+        self.status = "pending"
+        self.total_bytes = 0
+        self.done_bytes = 0
+        self.total_files = 0
+        self.done_files = 0
+        self.current = ""
+        self.errors = []
+        self.created_files = []
+        self.created_dirs = []
+        self.started = None
+        self.finished = None
+        self.paused_time = 0.0
+        self.paused_since = None
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def pause(self):
+        if self.running.is_set():
+            self.paused_since = time.monotonic()
+            self.running.clear()
+
+    def resume(self):
+        if not self.running.is_set():
+            self.paused_time += time.monotonic() - self.paused_since
+            self.paused_since = None
+            self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()
+
+    def is_finished(self):
+        return self.status in ("done", "cancelled", "failed")
+
+    def elapsed(self):
+        """Seconds spent transferring, not counting pauses"""
+        if self.started is None:
+            return 0.0
+        now = self.paused_since or self.finished or time.monotonic()
+        return max(0.0, now - self.started - self.paused_time)
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.done_bytes / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        if rate <= 0:
+            return None
+        return (self.total_bytes - self.done_bytes) / rate
+
+    def checkpoint(self):
+        """Block while paused; raise if the job was cancelled"""
+        if not self.running.is_set():
+            self.running.wait()
+        if self.cancelled.is_set():
+            raise TransferCancelled()
+
+    def add_progress(self, count):
+        with self.lock:
+            self.done_bytes += count
+
+    def run(self):
+        self.started = time.monotonic()
+        self.status = "preparing"
+        try:
+            dirs, files, links, sources = self.plan()
+            self.status = "running"
+            
+            # A directory that can't be made (say a file of that name is in the way) is skipped with its contents
+            failed_dirs = set()
+            for dst in dirs:
+                self.checkpoint()
+                if self.is_under(dst, failed_dirs):
+                    failed_dirs.add(dst)
+                    continue
+                try:
+                    if not os.path.isdir(dst):
+                        os.makedirs(dst)
+                        self.created_dirs.append(dst)
+                except OSError as e:
+                    self.errors.append(f"{dst}: {e.strerror or e}")
+                    failed_dirs.add(dst)
+            if failed_dirs:
+                files = [item for item in files if not self.is_under(item[1], failed_dirs)]
+                links = [(src, dst) for src, dst in links if not self.is_under(dst, failed_dirs)]
+                sources = [(src, dst) for src, dst in sources if dst not in failed_dirs]
+                self.total_files = len(files) + len(links)
+                self.total_bytes = sum(size for _, _, size in files)
+            
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(self.copy_file, src, dst, size) for src, dst, size in files]
+                for future, (src, dst, size) in zip(futures, files):
+                    try:
+                        future.result()
+                    except TransferCancelled:
+                        raise
+                    except OSError as e:
+                        self.errors.append(f"{src}: {e.strerror or e}")
+            
+            for src, dst in links:
+                self.checkpoint()
+                try:
+                    if os.path.lexists(dst):
+                        os.remove(dst)
+                    os.symlink(os.readlink(src), dst)
+                    self.created_files.append(dst)
+                    self.done_files += 1
+                except OSError as e:
+                    self.errors.append(f"{src}: {e.strerror or e}")
+            
+            # Directory timestamps last, since filling them in bumped their mtimes
+            for src, dst in reversed(sources):
+                try:
+                    shutil.copystat(src, dst)
+                except OSError:
+                    pass
+            
+            if self.move and not self.errors:
+                self.current = "Removing sources"
+                for src, _ in self.items:
+                    if os.path.lexists(src):
+                        if os.path.isdir(src) and not os.path.islink(src):
+                            shutil.rmtree(src)
+                        else:
+                            os.remove(src)
+            self.finish("done")
+        except TransferCancelled:
+            self.cleanup()
+            self.finish("cancelled")
+        except Exception as e:
+            self.errors.append(str(e))
+            self.cleanup()
+            self.finish("failed")
+
+    def finish(self, status):
+        # Stamp the end first, so anyone seeing the final status also sees a fixed elapsed()
+        self.finished = time.monotonic()
+        self.status = status
+
+    @staticmethod
+    def is_under(path, directories):
+        """True if one of the parent directories of path is in directories"""
+        parent = os.path.dirname(path)
+        while parent not in directories:
+            if os.path.dirname(parent) == parent:
+                return False
+            parent = os.path.dirname(parent)
+        return True
+
+    def plan(self):
+        """Expand the items into directories to create, files and symlinks to copy"""
+        dirs, files, links, sources = [], [], [], []
+        for src, dst in self.items:
+            self.checkpoint()
+            if os.path.isdir(src) and not os.path.islink(src):
+                if os.path.commonpath([os.path.abspath(src), os.path.abspath(dst)]) == os.path.abspath(src):
+                    raise OSError(errno.EINVAL, f"Cannot copy '{src}' into itself")
+            
+            if self.move:
+                try:
+                    # Same filesystem: one rename, no data copied
+                    os.replace(src, dst)
+                    continue
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.ENOTEMPTY, errno.EEXIST, errno.EISDIR, errno.ENOTDIR):
+                        raise
+            
+            if os.path.islink(src):
+                links.append((src, dst))
+            elif os.path.isdir(src):
+                stack = [(src, dst)]
+                while stack:
+                    src_dir, dst_dir = stack.pop()
+                    dirs.append(dst_dir)
+                    sources.append((src_dir, dst_dir))
+                    with os.scandir(src_dir) as entries:
+                        for entry in entries:
+                            target = os.path.join(dst_dir, entry.name)
+                            if entry.is_symlink():
+                                links.append((entry.path, target))
+                            elif entry.is_dir():
+                                stack.append((entry.path, target))
+                            elif entry.is_file():
+                                files.append((entry.path, target, entry.stat().st_size))
+                            else:
+                                # FIFOs, sockets and devices: opening a FIFO would block a worker forever
+                                self.errors.append(f"{entry.path}: Special file; skipped")
+            elif os.path.isfile(src):
+                files.append((src, dst, os.path.getsize(src)))
+            else:
+                self.errors.append(f"{src}: Special file; skipped")
+        
+        self.total_files = len(files) + len(links)
+        self.total_bytes = sum(size for _, _, size in files)
+        return dirs, files, links, sources
+
+    def copy_file(self, src, dst, size):
+        self.checkpoint()
+        self.current = src
+        if self.delta and size >= DELTA_MIN_SIZE and os.path.isfile(dst) and not os.path.islink(dst):
+            self.delta_copy(src, dst, size)
+            return
+        directory, name = os.path.split(dst)
+        temp = os.path.join(directory, f".{name}.part-{os.getpid()}-{threading.get_ident()}")
+        existed = os.path.lexists(dst)
+        copied = 0
+        try:
+            with open(src, 'rb') as fsrc, open(temp, 'wb') as fdst:
+                copied = self.copy_data(fsrc, fdst, size)
+            if copied < size:
+                raise OSError(errno.EIO, f"Only {copied} of {size} bytes could be read", src)
+            shutil.copystat(src, temp)
+            os.replace(temp, dst)
+        except BaseException:
+            # Take the partial file and its progress back out
+            self.add_progress(-copied)
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+        with self.lock:
+            if not existed:
+                self.created_files.append(dst)
+            self.done_files += 1
+
+    def delta_copy(self, src, dst, size):
+        """Bring dst in line with src by rewriting only the blocks that differ
+
+        The update is in place, like rsync --inplace: a cancelled copy
+        leaves dst partly updated but with its old mtime, so the next
+        compare still sees it as changed.
+        """
+        buffer = bytearray(DELTA_BLOCK_SIZE)
+        view = memoryview(buffer)
+        offset = 0
+        with open(src, 'rb') as fsrc, open(dst, 'r+b') as fdst:
+            dst_fd = fdst.fileno()
+            while True:
+                self.checkpoint()
+                count = fsrc.readinto(buffer)
+                if not count:
+                    break
+                if os.pread(dst_fd, count, offset) != view[:count]:
+                    os.pwrite(dst_fd, view[:count], offset)
+                else:
+                    with self.lock:
+                        self.unchanged_bytes += count
+                offset += count
+                self.add_progress(count)
+            os.ftruncate(dst_fd, offset)
+        shutil.copystat(src, dst)
+        with self.lock:
+            self.done_files += 1
+
+    def copy_data(self, fsrc, fdst, size):
+        """Copy the open file fsrc into fdst, returning the number of bytes copied"""
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        # Copy-on-write filesystems (btrfs, XFS) can share the extents outright
+        if fcntl is not None and size:
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+                self.add_progress(size)
+                return size
+            except OSError:
+                pass
+        
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while True:
+                    self.checkpoint()
+                    count = os.copy_file_range(src_fd, dst_fd, KERNEL_COPY_CHUNK)
+                    if count == 0:
+                        # procfs, sysfs, some FUSE filesystems and older kernels across filesystems
+                        # report 0 without copying anything; only trust it once data has moved
+                        if copied:
+                            return copied
+                        break
+                    copied += count
+                    self.add_progress(count)
+            except OSError as e:
+                if e.errno not in COPY_FALLBACK_ERRNOS:
+                    raise
+        
+        if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+            try:
+                while True:
+                    self.checkpoint()
+                    count = os.sendfile(dst_fd, src_fd, copied, KERNEL_COPY_CHUNK)
+                    if count == 0:
+                        if copied:
+                            return copied
+                        break
+                    copied += count
+                    self.add_progress(count)
+            except OSError as e:
+                if e.errno not in COPY_FALLBACK_ERRNOS:
+                    raise
+        
+        # Plain buffered copy, resuming wherever the kernel paths stopped
+        fsrc.seek(copied)
+        fdst.seek(copied)
+        buffer = bytearray(BUFFERED_COPY_CHUNK)
+        view = memoryview(buffer)
+        while True:
+            self.checkpoint()
+            count = fsrc.readinto(buffer)
+            if not count:
+                return copied
+            fdst.write(view[:count])
+            copied += count
+            self.add_progress(count)
+
+    def cleanup(self):
+        """Remove whatever this job created before it was stopped"""
+        for path in reversed(self.created_files):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        for path in reversed(self.created_dirs):
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+
+
+def open_directory_fd(path):
+    """Open a directory for *_dir_fd calls, or return None where they aren't supported"""
+    if os.unlink not in os.supports_dir_fd or os.rename not in os.supports_dir_fd:
+        return None
+    return os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+
+
+def group_by_directory(paths):
+    """Group full paths into {directory: [names]} preserving order"""
+    groups = OrderedDict()
+    for path in paths:
+        directory, name = os.path.split(path)
+        groups.setdefault(directory, []).append(name)
+    return groups
+
+
+class BatchOperation:
+    """One step in the BatchQueue; subclasses implement run() and progress()"""
+
+    # Transfer jobs have their own dialog; other operations report errors via the queue
+    report_errors = True
+
+    def __init__(self, description):
+        self.description = description
+        self.errors = []
+
+    def run(self):
+        raise NotImplementedError
+
+    def progress(self):
+        """Return (items done, items total)"""
+        raise NotImplementedError
+
+
+class TransferOperation(BatchOperation):
+    """Queue wrapper around a TransferJob"""
+
+    report_errors = False
+
+    def __init__(self, job, description):
+        super().__init__(description)
+        self.job = job
+
+    def run(self):
+        self.job.run()
+        self.errors = self.job.errors
+
+    def progress(self):
+        return self.job.done_files, self.job.total_files
+
+
+class DeleteOperation(BatchOperation):
+    """Delete many paths, one directory descriptor per parent directory"""
+
+    def __init__(self, paths):
+        super().__init__(f"Deleting {len(paths)} item(s)")
+        self.paths = list(paths)
+        self.done = 0
+
+    def run(self):
+        for directory, names in group_by_directory(self.paths).items():
+            try:
+                dir_fd = open_directory_fd(directory)
+            except OSError as e:
+                self.errors.append(f"{directory}: {e.strerror or e}")
+                self.done += len(names)
+                continue
+            try:
+                for name in names:
+                    self.delete_one(directory, name, dir_fd)
+                    self.done += 1
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
+
+    def delete_one(self, directory, name, dir_fd):
+        # Relative to the directory descriptor when possible: no path walk per item
+        target = name if dir_fd is not None else os.path.join(directory, name)
+        try:
+            st = os.stat(target, dir_fd=dir_fd, follow_symlinks=False)
+            if stat.S_ISDIR(st.st_mode):
+                if dir_fd is not None and sys.version_info >= (3, 11):
+                    shutil.rmtree(target, dir_fd=dir_fd)
+                else:
+                    shutil.rmtree(os.path.join(directory, name))
+            else:
+                os.unlink(target, dir_fd=dir_fd)
+        except OSError as e:
+            self.errors.append(f"{os.path.join(directory, name)}: {e.strerror or e}")
+
+    def progress(self):
+        return self.done, len(self.paths)
+
+
+def mount_point(path):
+    """Return the top directory of the filesystem holding path"""
+    path = os.path.realpath(path)
+    device = os.lstat(path).st_dev
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path or os.lstat(parent).st_dev != device:
+            return path
+        path = parent
+
+
+def mounted_directories():
+    """Mount points listed in /proc/mounts (empty where that doesn't exist)"""
+    try:
+        with open("/proc/mounts") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    # Spaces and other specials are written as octal escapes
+    return [re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), line.split()[1])
+            for line in lines if len(line.split()) > 1]
+
+
+class TrashPurger:
+    """Deletes expunged trash contents on a low-priority, throttled background thread"""
+
+    def __init__(self):
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.removed = 0
+        self.busy = False
+
+    def purge(self, path):
+        """Remove path (file or whole tree) in the background"""
+        self.pending.put(path)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        try:
+            # Linux nice values are per thread, so only the purger is deprioritised
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PURGE_NICE)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            path = self.pending.get()
+            self.busy = True
+            try:
+                self.remove_tree(path)
+            except OSError:
+                pass
+            self.busy = self.pending.qsize() > 0
+
+    def remove_tree(self, path):
+        if not stat.S_ISDIR(os.lstat(path).st_mode):
+            os.unlink(path)
+            self.throttle()
+            return
+        for _, dirs, files, root_fd in os.fwalk(path, topdown=False):
+            for name in files:
+                self.remove_entry(name, root_fd, False)
+            for name in dirs:
+                self.remove_entry(name, root_fd, True)
+        os.rmdir(path)
+
+    def remove_entry(self, name, dir_fd, is_dir):
+        try:
+            if is_dir:
+                os.rmdir(name, dir_fd=dir_fd)
+            else:
+                os.unlink(name, dir_fd=dir_fd)
+        except NotADirectoryError:
+            os.unlink(name, dir_fd=dir_fd)  # A symlink to a directory
+        except OSError:
+            pass
+        self.throttle()
+
+    def throttle(self):
+        self.removed += 1
+        if self.removed % PURGE_BATCH == 0:
+            time.sleep(PURGE_PAUSE)
+
+
+class Trash:
+    """freedesktop.org trash: trashing is one rename, however big the item
+
+    Each item is renamed into files/ of the trash on its own filesystem,
+    after an info/<name>.trashinfo file recording where it came from has
+    been created with O_EXCL (which also reserves the name). Emptying and
+    permanent deletes rename into expunged/, which the purger clears.
+    """
+
+    def __init__(self, home_trash=HOME_TRASH_DIR):
+        self.home_trash = home_trash
+        self.purger = TrashPurger()
+
+    def start(self):
+        """Finish purges an earlier session left behind"""
+        for trash_dir in self.trash_dirs():
+            expunged = os.path.join(trash_dir, "expunged")
+            try:
+                for name in os.listdir(expunged):
+                    self.purger.purge(os.path.join(expunged, name))
+            except OSError:
+                pass
+
+    def home_device(self):
+        path = self.home_trash
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return os.stat(path).st_dev
+
+    def trash_dir_for(self, path):
+        """Return (trash directory, top directory or None for the home trash) for path"""
+        if os.lstat(path).st_dev == self.home_device():
+            return self.home_trash, None
+        
+        topdir = mount_point(os.path.dirname(os.path.abspath(path)))
+        uid = os.getuid()
+        shared = os.path.join(topdir, ".Trash")
+        try:
+            st = os.lstat(shared)
+            # Only an admin-created, sticky, non-symlink .Trash may be used
+            if stat.S_ISDIR(st.st_mode) and st.st_mode & stat.S_ISVTX:
+                return os.path.join(shared, str(uid)), topdir
+        except OSError:
+            pass
+        return os.path.join(topdir, f".Trash-{uid}"), topdir
+
+    def trash_dirs(self):
+        """Every trash directory of this user that currently exists"""
+        dirs = [self.home_trash] if os.path.isdir(self.home_trash) else []
+        uid = os.getuid()
+        for topdir in mounted_directories():
+            for trash_dir in (os.path.join(topdir, ".Trash", str(uid)), os.path.join(topdir, f".Trash-{uid}")):
+                if trash_dir not in dirs and os.path.isdir(trash_dir) and not os.path.islink(trash_dir):
+                    dirs.append(trash_dir)
+        return dirs
+
+    def prepare(self, trash_dir):
+        for sub in ("files", "info", "expunged"):
+            os.makedirs(os.path.join(trash_dir, sub), mode=0o700, exist_ok=True)
+
+    def trash(self, path):
+        """Move path to the trash; returns (trash directory, trashed name)"""
+        # Resolve the parent (not path itself, which may be a symlink) so Path= is relative to the real topdir
+        path = os.path.abspath(path)
+        path = os.path.join(os.path.realpath(os.path.dirname(path)), os.path.basename(path))
+        trash_dir, topdir = self.trash_dir_for(path)
+        self.prepare(trash_dir)
+        original = os.path.relpath(path, topdir) if topdir else path
+        info = (f"[Trash Info]\nPath={quote(original)}\n"
+                f"DeletionDate={datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}\n")
+        
+        base = os.path.basename(path)
+        for attempt in range(1, 10000):
+            name = base if attempt == 1 else f"{base}.{attempt}"
+            info_path = os.path.join(trash_dir, "info", name + ".trashinfo")
+            try:
+                fd = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(info)
+            files_path = os.path.join(trash_dir, "files", name)
+            if os.path.lexists(files_path):
+                # Stale file without an info entry; leave it and try the next name
+                os.unlink(info_path)
+                continue
+            try:
+                os.rename(path, files_path)
+            except OSError:
+                os.unlink(info_path)
+                raise
+            return trash_dir, name
+        raise OSError(errno.EEXIST, "No free name in the trash")
+
+    def entries(self):
+        """List trashed items as dicts with trash_dir, name, path and deleted"""
+        entries = []
+        for trash_dir in self.trash_dirs():
+            info_dir = os.path.join(trash_dir, "info")
+            try:
+                info_names = os.listdir(info_dir)
+            except OSError:
+                continue
+            topdir = self.topdir_of(trash_dir)
+            for info_name in info_names:
+                if not info_name.endswith(".trashinfo"):
+                    continue
+                fields = self.read_info(os.path.join(info_dir, info_name))
+                if "Path" not in fields:
+                    continue
+                original = unquote(fields["Path"])
+                if topdir is not None and not os.path.isabs(original):
+                    original = os.path.join(topdir, original)
+                entries.append({"trash_dir": trash_dir, "name": info_name[:-len(".trashinfo")],
+                                "path": original, "deleted": fields.get("DeletionDate", "").replace("T", " ")})
+        return entries
+
+    def topdir_of(self, trash_dir):
+        """Directory that relative Path= entries in trash_dir start from (None for the home trash)"""
+        if trash_dir == self.home_trash:
+            return None
+        if os.path.basename(trash_dir).startswith(".Trash-"):
+            return os.path.dirname(trash_dir)  # $topdir/.Trash-$uid
+        return os.path.dirname(os.path.dirname(trash_dir))  # $topdir/.Trash/$uid
+
+    def read_info(self, info_path):
+        fields = {}
+        try:
+            with open(info_path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    key, sep, value = line.rstrip("\n").partition("=")
+                    if sep:
+                        fields.setdefault(key, value)
+        except OSError:
+            pass
+        return fields
+
+    def restore(self, trash_dir, name, path):
+        """Move a trashed item back to path"""
+        if os.path.lexists(path):
+            raise FileExistsError(errno.EEXIST, "Something with that name already exists", path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.rename(os.path.join(trash_dir, "files", name), path)
+        try:
+            os.unlink(os.path.join(trash_dir, "info", name + ".trashinfo"))
+        except FileNotFoundError:
+            pass
+
+    def expunge(self, trash_dir, name):
+        """Permanently delete a trashed item; it vanishes at once and is purged in the background"""
+        self.prepare(trash_dir)
+        target = os.path.join(trash_dir, "expunged", os.urandom(8).hex())
+        try:
+            os.rename(os.path.join(trash_dir, "files", name), target)
+            self.purger.purge(target)
+        except FileNotFoundError:
+            pass
+        try:
+            os.unlink(os.path.join(trash_dir, "info", name + ".trashinfo"))
+        except FileNotFoundError:
+            pass
+
+    def discard(self, path):
+        """Permanently delete path without keeping it in the trash"""
+        trash_dir, _ = self.trash_dir_for(path)
+        self.prepare(trash_dir)
+        target = os.path.join(trash_dir, "expunged", os.urandom(8).hex())
+        os.rename(path, target)
+        self.purger.purge(target)
+
+
+class TrashOperation(BatchOperation):
+    """Move paths to the trash, or delete them permanently through its purger"""
+
+    def __init__(self, trash, paths, permanent=False):
+        verb = "Deleting" if permanent else "Moving to Trash"
+        super().__init__(f"{verb} {len(paths)} item(s)")
+        self.trash = trash
+        self.paths = list(paths)
+        self.permanent = permanent
+        self.trashed = []  # (trash directory, trashed name, original path), for undo
+        self.done = 0
+
+    def run(self):
+        for path in self.paths:
+            try:
+                if self.permanent:
+                    self.discard(path)
+                else:
+                    trash_dir, name = self.trash.trash(path)
+                    self.trashed.append((trash_dir, name, path))
+            except OSError as e:
+                verb = "delete" if self.permanent else "move to Trash (Shift+Delete deletes permanently)"
+                self.errors.append(f"{path}: could not {verb}: {e.strerror or e}")
+            self.done += 1
+
+    def discard(self, path):
+        try:
+            self.trash.discard(path)
+        except OSError:
+            # No writable trash on that filesystem; delete in place on this thread instead
+            fallback = DeleteOperation([path])
+            fallback.run()
+            self.errors.extend(fallback.errors)
+
+    def progress(self):
+        return self.done, len(self.paths)
+
+
+class RestoreOperation(BatchOperation):
+    """Move trashed items back where they came from"""
+
+    def __init__(self, trash, items):
+        super().__init__(f"Restoring {len(items)} item(s)")
+        self.trash = trash
+        self.items = list(items)  # (trash directory, trashed name, original path)
+        self.done = 0
+
+    def run(self):
+        for trash_dir, name, path in self.items:
+            try:
+                self.trash.restore(trash_dir, name, path)
+            except OSError as e:
+                self.errors.append(f"{path}: {e.strerror or e}")
+            self.done += 1
+
+    def progress(self):
+        return self.done, len(self.items)
+
+
+class TouchOperation(BatchOperation):
+    """Copy timestamps and permissions from source to destination files with equal contents"""
+
+    def __init__(self, pairs):
+        super().__init__(f"Updating timestamps of {len(pairs)} item(s)")
+        self.pairs = list(pairs)
+        self.done = 0
+
+    def run(self):
+        for src, dst in self.pairs:
+            try:
+                shutil.copystat(src, dst, follow_symlinks=False)
+            except OSError as e:
+                self.errors.append(f"{dst}: {e.strerror or e}")
+            self.done += 1
+
+    def progress(self):
+        return self.done, len(self.pairs)
+
+
+def file_digest(path):
+    """BLAKE2b of a file's contents (hashlib drops the GIL, so threads hash in parallel)"""
+    digest = hashlib.blake2b()
+    buffer = bytearray(SYNC_HASH_CHUNK)
+    view = memoryview(buffer)
+    with open(path, 'rb') as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                return digest.digest()
+            digest.update(view[:count])
+
+
+class TreeComparison:
+    """Diff a source tree against a target tree, rsync-style
+
+    Files count as equal when size and mtime (within SYNC_MTIME_WINDOW)
+    match. With use_hash, files of equal size but different mtime are
+    hashed on a thread pool: equal contents are reported as 'touched'
+    (only the timestamp needs copying) instead of 'changed'. Differences
+    are (relative path, status, source entry, target entry) with status
+    'new', 'changed', 'touched' or 'extra'; a new or extra directory is
+    reported once, not per file inside it. Folders that can't be read on
+    either side are left out of the differences, and listed in errors with
+    the entries and files that vanished or failed to hash.
+    """
+
+    def __init__(self, source, target, use_hash=False):
+        self.source = os.path.normpath(source)
+        self.target = os.path.normpath(target)
+        self.use_hash = use_hash
+        self.differences = []
+        self.errors = []
+        self.progress = {"entries": 0, "hashed": 0, "to_hash": 0, "errors": 0, "error": None, "finished": False}
+        self.cancel_event = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def list_tree(self, root):
+        """Map relative path -> (is_dir, size, mtime) for everything under root; symlinks are not followed
+
+        Returns (entries, unreadable folders). Only an unreadable root raises.
+        """
+        entries = {}
+        unreadable = set()
+        stack = ['']
+        while stack and not self.cancel_event.is_set():
+            relative = stack.pop()
+            try:
+                with os.scandir(os.path.join(root, relative)) as scan:
+                    for entry in scan:
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError as e:
+                            # Gone since the folder was read
+                            self.add_error(entry.path, e)
+                            continue
+                        path = os.path.join(relative, entry.name)
+                        is_dir = stat.S_ISDIR(st.st_mode)
+                        entries[path] = (is_dir, st.st_size, st.st_mtime)
+                        if is_dir:
+                            stack.append(path)
+                        self.progress["entries"] += 1
+            except OSError as e:
+                if not relative:
+                    raise
+                self.add_error(os.path.join(root, relative), e)
+                unreadable.add(relative)
+        return entries, unreadable
+
+    def add_error(self, path, error):
+        self.errors.append(f"{path}: {error.strerror or error}")
+        self.progress["errors"] += 1
+
+    def run(self):
+        try:
+            # Both sides are listed at once; one is often a slow mount
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                source_future = pool.submit(self.list_tree, self.source)
+                target_future = pool.submit(self.list_tree, self.target)
+                (source, source_unreadable), (target, target_unreadable) = (
+                    source_future.result(), target_future.result())
+            # What can't be read on one side mustn't show up as new or extra on the other
+            unreadable = source_unreadable | target_unreadable
+            
+            candidates = []
+            new_dirs = set()
+            for path in sorted(source):
+                if self.cancel_event.is_set():
+                    return
+                if self.is_under(path, new_dirs) or path in unreadable or self.is_under(path, unreadable):
+                    continue
+                src = source[path]
+                dst = target.get(path)
+                if dst is None or src[0] != dst[0]:
+                    self.differences.append((path, 'new' if dst is None else 'changed', src, dst))
+                    if src[0]:
+                        new_dirs.add(path)
+                elif src[0]:
+                    continue
+                elif src[1] != dst[1]:
+                    self.differences.append((path, 'changed', src, dst))
+                elif abs(src[2] - dst[2]) > SYNC_MTIME_WINDOW:
+                    if self.use_hash:
+                        candidates.append((path, src, dst))
+                    else:
+                        self.differences.append((path, 'changed', src, dst))
+            
+            extra_dirs = set()
+            for path in sorted(target.keys() - source.keys()):
+                if self.is_under(path, extra_dirs) or path in unreadable or self.is_under(path, unreadable):
+                    continue
+                self.differences.append((path, 'extra', None, target[path]))
+                if target[path][0]:
+                    extra_dirs.add(path)
+            
+            self.hash_candidates(candidates)
+            self.differences.sort(key=lambda difference: difference[0])
+        except OSError as e:
+            self.progress["error"] = f"{e.filename or ''}: {e.strerror or e}"
+        finally:
+            self.progress["finished"] = True
+
+    @staticmethod
+    def is_under(path, directories):
+        """True if one of the parent directories of path is in directories"""
+        parent = os.path.dirname(path)
+        while parent:
+            if parent in directories:
+                return True
+            parent = os.path.dirname(parent)
+        return False
+
+    def hash_candidates(self, candidates):
+        self.progress["to_hash"] = len(candidates)
+        
+        def compare(candidate):
+            path, src, dst = candidate
+            if self.cancel_event.is_set():
+                return None
+            try:
+                same = file_digest(os.path.join(self.source, path)) == file_digest(os.path.join(self.target, path))
+            except OSError as e:
+                self.add_error(e.filename or path, e)
+                return None
+            self.progress["hashed"] += 1
+            return (path, 'touched' if same else 'changed', src, dst)
+        
+        with ThreadPoolExecutor(max_workers=SYNC_HASH_WORKERS) as pool:
+            for difference in pool.map(compare, candidates):
+                if difference is not None:
+                    self.differences.append(difference)
+
+
+def hash_file(path, partial):
+    """BLAKE2b of a file read through mmap; partial hashes only the first and last blocks"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            if partial and size > 2 * DUPES_PARTIAL_BLOCK:
+                digest.update(view[:DUPES_PARTIAL_BLOCK])
+                digest.update(view[-DUPES_PARTIAL_BLOCK:])
+            else:
+                for offset in range(0, size, SYNC_HASH_CHUNK):
+                    digest.update(view[offset:offset + SYNC_HASH_CHUNK])
+    return digest.digest()
+
+
+def hash_files(paths, partial):
+    """Hash a batch of files in a worker process; unreadable files get None"""
+    results = []
+    for path in paths:
+        try:
+            results.append((path, hash_file(path, partial)))
+        except (OSError, ValueError):
+            results.append((path, None))
+    return results
+
+
+class HashCache:
+    """Persistent file hashes keyed by (device, inode), valid while size and mtime match"""
+
+    def __init__(self, filename=HASH_CACHE_FILE):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.conn = sqlite3.connect(filename, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                device INTEGER NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL, partial BLOB, full BLOB,
+                PRIMARY KEY (device, inode))""")
+
+    def get(self, key, size, mtime_ns, column):
+        row = self.conn.execute(f"SELECT {column} FROM hashes WHERE device = ? AND inode = ? "
+                                "AND size = ? AND mtime_ns = ?", (*key, size, mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, size, mtime_ns, column, digest):
+        # A changed file (new size or mtime) drops its other cached hash too
+        self.conn.execute(f"""
+            INSERT INTO hashes (device, inode, size, mtime_ns, {column}) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (device, inode) DO UPDATE SET
+                partial = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns
+                               THEN partial ELSE NULL END,
+                full = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns
+                            THEN full ELSE NULL END,
+                size = excluded.size, mtime_ns = excluded.mtime_ns, {column} = excluded.{column}""",
+                          (*key, size, mtime_ns, digest))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class DuplicateFinder:
+    """Find files with identical contents under a directory
+
+    Files are grouped by size, then by a hash of their first and last
+    blocks, and only the files still grouped get a full hash, so most
+    bytes are never read. Hashing runs in a process pool over mmap'd
+    files, and every hash lands in HashCache so a re-run only hashes
+    files that changed. Hard links to one inode count as one file.
+    """
+
+    def __init__(self, root, hash_cache_file=HASH_CACHE_FILE, workers=DUPES_WORKERS):
+        self.root = root
+        self.hash_cache_file = hash_cache_file
+        self.workers = workers
+        self.groups = []  # (size, [paths]), most wasted space first
+        self.progress = {"stage": "Scanning", "files": 0, "done": 0, "total": 0, "cached": 0,
+                         "error": None, "finished": False}
+        self.cancel_event = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def scan(self):
+        """Map size -> [(path, (device, inode), mtime_ns)] for regular files, one path per inode"""
+        by_size = {}
+        seen = set()
+        stack = [self.root]
+        while stack and not self.cancel_event.is_set():
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                                continue
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        key = (st.st_dev, st.st_ino)
+                        if st.st_size == 0 or key in seen:
+                            continue
+                        seen.add(key)
+                        by_size.setdefault(st.st_size, []).append((entry.path, key, st.st_mtime_ns))
+                        self.progress["files"] += 1
+            except OSError:
+                continue
+        return by_size
+
+    def run(self):
+        cache = None
+        pool = None
+        try:
+            cache = HashCache(self.hash_cache_file)
+            pool = WorkerPool(self.workers, hash_files)
+            candidates = [(size, members) for size, members in self.scan().items() if len(members) > 1]
+            
+            self.progress["stage"] = "Comparing first and last blocks"
+            groups = self.split_by_hash(pool, cache, candidates, 'partial')
+            
+            # A partial hash of a small file already covers all of it
+            small = [group for group in groups if group[0] <= 2 * DUPES_PARTIAL_BLOCK]
+            large = [group for group in groups if group[0] > 2 * DUPES_PARTIAL_BLOCK]
+            self.progress["stage"] = "Comparing full contents"
+            groups = small + self.split_by_hash(pool, cache, large, 'full')
+            
+            self.groups = sorted(((size, [path for path, _, _ in members]) for size, members in groups),
+                                 key=lambda group: group[0] * (len(group[1]) - 1), reverse=True)
+        except (OSError, sqlite3.Error) as e:
+            self.progress["error"] = str(e)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if cache is not None:
+                cache.close()
+            self.progress["finished"] = True
+
+    def split_by_hash(self, pool, cache, groups, column):
+        """Split each (size, members) group by a hash of its files, keeping subgroups of two or more"""
+        digests = {}
+        to_hash = []
+        for size, members in groups:
+            for path, key, mtime_ns in members:
+                digest = cache.get(key, size, mtime_ns, column)
+                if digest is None:
+                    to_hash.append((path, key, mtime_ns, size))
+                else:
+                    digests[path] = digest
+                    self.progress["cached"] += 1
+        
+        self.progress["done"] = 0
+        self.progress["total"] = len(to_hash)
+        info = {path: (key, mtime_ns, size) for path, key, mtime_ns, size in to_hash}
+        batch, batch_bytes = [], 0
+        for path, _, _, size in to_hash:
+            batch.append(path)
+            batch_bytes += size if column == 'full' else 2 * DUPES_PARTIAL_BLOCK
+            if len(batch) >= DUPES_BATCH_FILES or batch_bytes >= DUPES_BATCH_BYTES:
+                pool.submit(batch, column == 'partial')
+                batch, batch_bytes = [], 0
+        if batch:
+            pool.submit(batch, column == 'partial')
+        
+        while len(pool):
+            if self.cancel_event.is_set():
+                raise OSError(errno.ECANCELED, "Cancelled")
+            for batch, results in pool.wait(timeout=0.2):
+                # A file that crashed its worker (truncated while mapped) is left out like an unreadable one
+                for path, digest in results or [(path, None) for path in batch]:
+                    self.progress["done"] += 1
+                    if digest is None:
+                        continue
+                    digests[path] = digest
+                    key, mtime_ns, size = info[path]
+                    cache.put(key, size, mtime_ns, column, digest)
+            cache.commit()
+        
+        subgroups = []
+        for size, members in groups:
+            by_digest = {}
+            for member in members:
+                if member[0] in digests:
+                    by_digest.setdefault(digests[member[0]], []).append(member)
+            subgroups.extend((size, same) for same in by_digest.values() if len(same) > 1)
+        return subgroups
+
+
+class RenameOperation(BatchOperation):
+    """Apply a list of (directory, old name, new name) renames"""
+
+    def __init__(self, renames):
+        super().__init__(f"Renaming {len(renames)} item(s)")
+        self.renames = list(renames)
+        self.done = 0
+
+    def run(self):
+        groups = OrderedDict()
+        for directory, old, new in self.renames:
+            groups.setdefault(directory, []).append((old, new))
+        
+        for directory, pairs in groups.items():
+            try:
+                dir_fd = open_directory_fd(directory)
+            except OSError as e:
+                self.errors.append(f"{directory}: {e.strerror or e}")
+                continue
+            try:
+                # Skip renames onto an item that stays put; each skipped item stays put too, so repeat
+                while True:
+                    moving = {old for old, _ in pairs}
+                    blocked = [(old, new) for old, new in pairs
+                               if new not in moving and self.target_exists(directory, dir_fd, new)]
+                    if not blocked:
+                        break
+                    for old, new in blocked:
+                        self.errors.append(f"{os.path.join(directory, old)}: {new} already exists")
+                        self.done += 1
+                    pairs = [pair for pair in pairs if pair not in blocked]
+                
+                # When new names reuse old ones (e.g. renumbering), go through temporary names first
+                old_names = {old for old, _ in pairs}
+                if any(new in old_names for _, new in pairs):
+                    staged = []
+                    for i, (old, new) in enumerate(pairs):
+                        temp = f".rename-{os.getpid()}-{i}.tmp"
+                        if self.rename_one(directory, dir_fd, old, temp, count=False):
+                            staged.append((temp, new, old))
+                    for temp, new, old in staged:
+                        if not self.rename_one(directory, dir_fd, temp, new):
+                            # Put the item back under its old name rather than leave the temporary one
+                            self.rename_one(directory, dir_fd, temp, old, count=False)
+                else:
+                    for old, new in pairs:
+                        self.rename_one(directory, dir_fd, old, new)
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
+
+    def rename_one(self, directory, dir_fd, old, new, count=True):
+        try:
+            # os.rename silently replaces an existing target, which may be an item the listing didn't show
+            if self.target_exists(directory, dir_fd, new):
+                raise FileExistsError(errno.EEXIST, f"{new} already exists")
+            if dir_fd is not None:
+                os.rename(old, new, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+            else:
+                os.rename(os.path.join(directory, old), os.path.join(directory, new))
+            return True
+        except OSError as e:
+            self.errors.append(f"{os.path.join(directory, old)}: {e.strerror or e}")
+            return False
+        finally:
+            if count:
+                self.done += 1
+
+    @staticmethod
+    def target_exists(directory, dir_fd, name):
+        try:
+            if dir_fd is not None:
+                os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+            else:
+                os.lstat(os.path.join(directory, name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def progress(self):
+        return self.done, len(self.renames)
+
+
+def archive_kind(path):
+    """'zip' or 'tar' for a name with an archive extension, otherwise None"""
+    name = path.lower()
+    if name.endswith(ZIP_EXTENSIONS):
+        return 'zip'
+    if name.endswith(TAR_EXTENSIONS):
+        return 'tar'
+    return None
+
+
+def archive_stem(name):
+    """Name of an archive without its archive extension, for the folder it extracts into"""
+    lower = name.lower()
+    for extension in ZIP_EXTENSIONS + TAR_EXTENSIONS:
+        if lower.endswith(extension) and len(name) > len(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def split_archive_path(path):
+    """Split a path that leads into an archive into (archive file, member path), or None
+
+    Only components with an archive extension are looked up on disk, so
+    ordinary paths cost no syscalls. The member path is '' for the archive
+    itself and uses '/' separators, as archive member names do.
+    """
+    candidate = os.path.normpath(path)
+    inner = []
+    while True:
+        if archive_kind(candidate) and os.path.isfile(candidate):
+            return candidate, "/".join(reversed(inner))
+        parent, name = os.path.split(candidate)
+        if parent == candidate or not name:
+            return None
+        inner.append(name)
+        candidate = parent
+
+
+def path_inside(path, root):
+    """True if path is root or lies below it (both already resolved)"""
+    return path == root or path.startswith(os.path.join(root, ""))
+
+
+def normalize_member_name(name):
+    """Archive member name as a clean relative path, or None if it would escape the archive"""
+    parts = []
+    for part in name.replace("\\", "/").split("/"):
+        if part == "..":
+            if not parts:
+                return None
+            parts.pop()
+        elif part not in ("", "."):
+            parts.append(part)
+    return "/".join(parts) or None
+
+
+class ArchiveIndex:
+    """Member listing of a zip or tar file, read without extracting anything
+
+    Zip files are listed from their central directory. A tar has no index,
+    so the first open reads through it once (decompressing if need be).
+    Either way the listing is saved as an SQLite file under
+    ARCHIVE_INDEX_DIR, keyed on the archive's size and mtime, and folders
+    are listed from it by query, so opening a 100k-member archive again
+    costs one lookup. For an uncompressed tar the index has each member's
+    data offset, so one member is read with a single seek.
+    """
+
+    def __init__(self, path, index_dir=ARCHIVE_INDEX_DIR):
+        self.path = path
+        self.kind = archive_kind(path)
+        digest = hashlib.sha1(os.fsencode(os.path.abspath(path))).hexdigest()
+        self.index_file = os.path.join(index_dir, f"{digest}.sqlite3")
+        self.compressed = False
+        self.stamp = None  # (size, mtime_ns) of the archive the listing was read from
+        self.lock = threading.Lock()
+        self.conn = None
+        self.zip = None
+
+    def load(self):
+        """Open the saved index if it is current, else build it from the archive"""
+        st = os.stat(self.path)
+        self.stamp = (st.st_size, st.st_mtime_ns)
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            self.conn = sqlite3.connect(self.index_file, timeout=30, check_same_thread=False)
+            self.create_schema()
+        except (OSError, sqlite3.Error):
+            # No usable cache directory; keep this session's index in memory
+            self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self.create_schema()
+        
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        if meta.get("version") == 1 and (meta.get("size"), meta.get("mtime_ns")) == self.stamp:
+            self.compressed = bool(meta["compressed"])
+            return self
+        rows = self.read_zip() if self.kind == 'zip' else self.read_tar()
+        with self.conn:
+            self.conn.execute("DELETE FROM members")
+            self.conn.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self.index_rows(rows))
+            self.conn.execute("DELETE FROM meta")
+            self.conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("version", 1), ("path", self.path), ("size", self.stamp[0]), ("mtime_ns", self.stamp[1]),
+                ("compressed", int(self.compressed))])
+        return self
+
+    def create_schema(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS members (
+                path TEXT PRIMARY KEY, parent TEXT NOT NULL, name TEXT NOT NULL,
+                is_dir INTEGER NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL,
+                data_offset INTEGER, link TEXT, raw_name TEXT)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS members_parent ON members (parent)")
+
+    def read_zip(self):
+        rows = []
+        for info in self.zip_file().infolist():
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            rows.append((info.filename, info.is_dir(), info.file_size, mtime, None, None))
+        return rows
+
+    def read_tar(self):
+        try:
+            tar = tarfile.open(self.path, 'r:')
+        except tarfile.ReadError:
+            # Compressed: members can only be reached by decompressing from the start
+            tar = tarfile.open(self.path, 'r:*')
+            self.compressed = True
+        rows = []
+        with tar:
+            for member in tar:
+                seekable = member.isreg() and not member.issparse() and not self.compressed
+                rows.append((member.name, member.isdir(), member.size, member.mtime,
+                             member.offset_data if seekable else None, self.link_target(member)))
+        return rows
+
+    def link_target(self, member):
+        """Member a tar link reads its data from: None if not a link, '' if it points outside"""
+        if member.islnk():
+            return normalize_member_name(member.linkname) or ""
+        if member.issym():
+            if member.linkname.startswith("/"):
+                return ""
+            return normalize_member_name(f"{os.path.dirname(member.name)}/{member.linkname}") or ""
+        return None
+
+    def index_rows(self, rows):
+        """Normalise member names and make up the directories archives often leave out"""
+        members = {}
+        for raw_name, is_dir, size, mtime, offset, link in rows:
+            name = normalize_member_name(raw_name)
+            if name is None:
+                continue
+            # A name repeated later in a tar replaces the earlier member, as tar does
+            members[name] = (is_dir, 0 if is_dir else size, mtime, offset, link, raw_name)
+            parent = name.rpartition("/")[0]
+            while parent and parent not in members:
+                members[parent] = (True, 0, mtime, None, None, None)
+                parent = parent.rpartition("/")[0]
+        for name, (is_dir, size, mtime, offset, link, raw_name) in members.items():
+            parent, _, base = name.rpartition("/")
+            yield name, parent, base, is_dir, size, mtime, offset, link, raw_name
+
+    def zip_file(self):
+        """The archive's ZipFile, opened once; member reads from several threads may share it"""
+        with self.lock:
+            if self.zip is None:
+                self.zip = zipfile.ZipFile(self.path)
+            return self.zip
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def is_dir(self, name):
+        return not name or bool(self.query("SELECT 1 FROM members WHERE path = ? AND is_dir", (name,)))
+
+    def member(self, name):
+        """Return (is_dir, size, mtime, offset, link, raw name) of a member; raises FileNotFoundError"""
+        rows = self.query("SELECT is_dir, size, mtime, data_offset, link, raw_name FROM members WHERE path = ?",
+                          (name,))
+        if not rows:
+            raise FileNotFoundError(errno.ENOENT, "No such file in archive", f"{self.path}/{name}")
+        is_dir, size, mtime, offset, link, raw_name = rows[0]
+        return bool(is_dir), size, mtime, offset, link, raw_name
+
+    def listing(self, directory):
+        """Return the (name, is_dir, size, mtime) entries of a directory in the archive"""
+        if not self.is_dir(directory):
+            self.member(directory)
+            raise NotADirectoryError(errno.ENOTDIR, "Not a directory", f"{self.path}/{directory}")
+        return [(name, bool(is_dir), size, mtime) for name, is_dir, size, mtime in
+                self.query("SELECT name, is_dir, size, mtime FROM members WHERE parent = ?", (directory,))]
+
+    def subtree_condition(self, names):
+        """SQL condition and parameters for members at or under any of names (all if None)"""
+        if names is None:
+            return "1", ()
+        # '0' sorts right after '/', so the range covers exactly the paths under name/
+        clauses = " OR ".join("path = ? OR (path >= ? AND path < ?)" for _ in names)
+        return f"({clauses})", tuple(value for name in names for value in (name, f"{name}/", f"{name}0"))
+
+    def count_files(self, names):
+        """Number of non-directory members at or under names (all if None)"""
+        condition, params = self.subtree_condition(names)
+        return self.query(f"SELECT COUNT(*) FROM members WHERE NOT is_dir AND {condition}", params)[0][0]
+
+    def link_sources(self, names):
+        """Members that links at or under names read from"""
+        condition, params = self.subtree_condition(names)
+        return {link for link, in self.query(f"SELECT link FROM members WHERE link != '' AND {condition}", params)}
+
+    def selected(self, names):
+        """Predicate for member paths at or under any of names; every member if names is None"""
+        if names is None:
+            return lambda name: True
+        names = set(names)
+        prefixes = tuple(f"{name}/" for name in names)
+        return lambda name: name in names or name.startswith(prefixes)
+
+    def extract_member(self, name, target):
+        """Stream one file member to target without extracting anything else"""
+        is_dir, size, mtime, offset, link, raw_name = self.member(name)
+        if is_dir:
+            raise IsADirectoryError(errno.EISDIR, "Is a directory", f"{self.path}/{name}")
+        if link is not None:
+            if not link:
+                raise OSError(errno.EINVAL, "Link to a file outside the archive", f"{self.path}/{name}")
+            return self.extract_member(link, target)
+        
+        if self.kind == 'zip':
+            with self.zip_file().open(raw_name) as src:
+                self.write_file(src, target, mtime)
+        elif offset is not None:
+            with open(self.path, 'rb') as src:
+                src.seek(offset)
+                self.write_file(src, target, mtime, size)
+        else:
+            with tarfile.open(self.path, 'r|*') as tar:
+                for member in tar:
+                    if member.isreg() and normalize_member_name(member.name) == name:
+                        self.write_file(tar.extractfile(member), target, mtime)
+                        return
+            raise FileNotFoundError(errno.ENOENT, "No such file in archive", f"{self.path}/{name}")
+
+    def extract(self, names, base, destination, operation):
+        """Write the members at or under names (all if None) to destination, named relative to base
+
+        Members are read in archive order in a single pass, so compressed
+        tars are decompressed once. Progress and errors go on operation.
+        """
+        wanted = self.selected(names)
+        prefix = f"{base}/" if base else ""
+        destination = os.path.abspath(destination)
+        
+        def target_of(name):
+            target = os.path.normpath(os.path.join(destination, name[len(prefix):]))
+            # Resolve the parent as it is on disk now, so links extracted earlier can't lead outside
+            if (not target.startswith(os.path.join(destination, ""))
+                    or not path_inside(os.path.realpath(os.path.dirname(target)), os.path.realpath(destination))):
+                raise OSError(errno.EINVAL, "Member path leaves the destination", name)
+            return target
+        
+        def extract_one(name, is_dir, write, mtime):
+            try:
+                target = target_of(name)
+                if is_dir:
+                    os.makedirs(target, exist_ok=True)
+                    return
+                write(target, mtime)
+            except OSError as e:
+                operation.errors.append(f"{name}: {e.strerror or e}")
+            operation.done += 1
+        
+        os.makedirs(destination, exist_ok=True)
+        if self.kind == 'zip':
+            self.extract_zip(wanted, extract_one)
+        else:
+            self.extract_tar(names, wanted, target_of, extract_one, destination)
+
+    def extract_zip(self, wanted, extract_one):
+        zf = self.zip_file()
+        for info in zf.infolist():
+            name = normalize_member_name(info.filename)
+            if name is None or not wanted(name):
+                continue
+            
+            def write(target, mtime, info=info):
+                with zf.open(info) as src:
+                    self.write_file(src, target, mtime)
+            extract_one(name, info.is_dir(), write, time.mktime(info.date_time + (0, 0, -1)))
+
+    def extract_tar(self, names, wanted, target_of, extract_one, destination):
+        # A link carries no data, so a target outside the selection is held until its links are made
+        link_sources = {link for link in self.link_sources(names) if not wanted(link)}
+        held = {}
+        try:
+            self.extract_tar_members(wanted, target_of, extract_one, destination, link_sources, held)
+        finally:
+            for path in held.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def extract_tar_members(self, wanted, target_of, extract_one, destination, link_sources, held):
+        with tarfile.open(self.path, 'r|*' if self.compressed else 'r:') as tar:
+            for member in tar:
+                name = normalize_member_name(member.name)
+                if name is None:
+                    continue
+                if name in link_sources and member.isreg():
+                    fd, held_path = tempfile.mkstemp(dir=destination, prefix=".extract-link-")
+                    os.close(fd)
+                    held[name] = held_path
+                    self.write_file(tar.extractfile(member), held_path, member.mtime)
+                if not wanted(name):
+                    continue
+                
+                def write(target, mtime, member=member):
+                    if member.isreg():
+                        self.write_file(tar.extractfile(member), target, mtime)
+                    elif member.issym():
+                        resolved = os.path.realpath(os.path.join(os.path.realpath(os.path.dirname(target)),
+                                                                 member.linkname))
+                        if os.path.isabs(member.linkname) or not path_inside(resolved, os.path.realpath(destination)):
+                            raise OSError(errno.EINVAL, f"Link to {member.linkname} leaves the destination")
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        if os.path.lexists(target):
+                            os.remove(target)
+                        os.symlink(member.linkname, target)
+                    elif member.islnk():
+                        link = normalize_member_name(member.linkname) or member.linkname
+                        source = held[link] if link in held else target_of(link)
+                        if not path_inside(os.path.realpath(source), os.path.realpath(destination)):
+                            raise OSError(errno.EINVAL, f"Link to {member.linkname} leaves the destination")
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        if os.path.lexists(target):
+                            os.remove(target)
+                        os.link(source, target)
+                    else:
+                        raise OSError(errno.EINVAL, "Not a regular file; skipped")
+                extract_one(name, member.isdir(), write, member.mtime)
+
+    def write_file(self, src, target, mtime, size=None):
+        """Stream src (size bytes of it, or to the end) to target through a temporary name"""
+        directory, name = os.path.split(target)
+        os.makedirs(directory, exist_ok=True)
+        temp = os.path.join(directory, f".{name}.part-{os.getpid()}-{threading.get_ident()}")
+        try:
+            with open(temp, 'wb') as fdst:
+                remaining = size
+                while remaining is None or remaining > 0:
+                    chunk = src.read(BUFFERED_COPY_CHUNK if remaining is None else min(remaining, BUFFERED_COPY_CHUNK))
+                    if not chunk:
+                        break
+                    fdst.write(chunk)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+            os.utime(temp, (mtime, mtime))
+            os.replace(temp, target)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+
+class ExtractOperation(BatchOperation):
+    """Extract a whole archive, or some of its members, in the background"""
+
+    def __init__(self, open_archive, archive_path, names, base, destination):
+        label = os.path.basename(archive_path)
+        if names is not None:
+            label = f"{len(names)} item(s) from {label}"
+        super().__init__(f"Extracting {label}")
+        self.open_archive = open_archive
+        self.archive_path = archive_path
+        self.names = names
+        self.base = base
+        self.destination = destination
+        self.done = 0
+        self.total = 0
+
+    def run(self):
+        # Loading a big tar's listing can take a while, so it happens here rather than on submit
+        archive = self.open_archive(self.archive_path)
+        self.total = archive.count_files(self.names)
+        archive.extract(self.names, self.base, self.destination, self)
+
+    def progress(self):
+        return self.done, self.total
+
+
+class BatchQueue:
+    """Runs BatchOperations one after another on a background thread"""
+
+    def __init__(self):
+        self.operations = queue.Queue()
+        self.lock = threading.Lock()
+        self.batch = []  # Operations submitted since the queue was last idle
+        self.pending = 0
+        self.active = None
+        
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, operation):
+        with self.lock:
+            self.batch.append(operation)
+            self.pending += 1
+        self.operations.put(operation)
+
+    def run(self):
+        while True:
+            operation = self.operations.get()
+            self.active = operation
+            try:
+                operation.run()
+            except Exception as e:
+                operation.errors.append(str(e))
+            finally:
+                self.active = None
+                with self.lock:
+                    self.pending -= 1
+
+    def is_idle(self):
+        return self.pending == 0
+
+    def progress(self):
+        """Aggregate (items done, items total) over the current batch"""
+        with self.lock:
+            operations = list(self.batch)
+        done = total = 0
+        for operation in operations:
+            op_done, op_total = operation.progress()
+            done += op_done
+            total += op_total
+        return done, total
+
+    def take_finished(self):
+        """Return and forget the current batch once everything in it has run"""
+        with self.lock:
+            if self.pending:
+                return None
+            finished, self.batch = self.batch, []
+        return finished
+
+
+class FileManagerCore:
+    """Listing, properties, copy/move and delete with nothing tied to Tk
+
+    FileManager drives one of these from the Tk thread; scripts and the
+    benchmark suite use it directly. Slow work comes back as an object to
+    poll (a TransferJob, a BatchOperation, a progress dict) instead of
+    blocking, and problems are raised for the caller to present.
+    """
+
+    def __init__(self, home_trash=HOME_TRASH_DIR):
+        # Listings of recently visited directories, patched live as they change
+        self.watcher = DirectoryWatcher()
+        self.listing_cache = ListingCache(self.watcher)
+        # Shared so repeated size scans of the same tree reuse unchanged directories
+        self.size_scanner = DirectorySizeScanner()
+        # Copy/move/delete/rename run one after another in the background
+        self.batch_queue = BatchQueue()
+        self.trash = Trash(home_trash)
+        # Archives are browsed as read-only folders through their member listings
+        self.archive_lock = threading.Lock()
+        self.archives = OrderedDict()  # archive path -> ArchiveIndex, least recently used first
+        self.archive_temp = None
+
+    def start(self):
+        """Start background housekeeping (purging what earlier sessions left in the trash)"""
+        self.trash.start()
+
+    # Listing
+    def read_directory(self, path, on_batch=None, cancel=None):
+        """Read path and return (entries, orders), or None if cancelled
+
+        on_batch, if given, receives the entries LOAD_BATCH_SIZE at a time as
+        they are read. The sort orders of every column are computed here too,
+        since sorting a huge listing is the expensive part. Paths inside an
+        archive are listed from its index.
+        """
+        location = split_archive_path(path)
+        if location is not None:
+            entries = self.open_archive(location[0]).listing(location[1])
+            if on_batch is not None:
+                on_batch(entries)
+            return entries, listing_sort_orders(entries)
+        
+        batch = []
+        entries = []
+        for entry in iter_directory(path):
+            if cancel is not None and cancel.is_set():
+                return None
+            batch.append(entry)
+            entries.append(entry)
+            if on_batch is not None and len(batch) >= LOAD_BATCH_SIZE:
+                on_batch(batch)
+                batch = []
+        if on_batch is not None:
+            on_batch(batch)
+        orders = listing_sort_orders(entries)
+        if cancel is not None and cancel.is_set():
+            return None
+        return entries, orders
+
+    def list_directory(self, path, sort_column='name', sort_reverse=False, use_cache=True):
+        """Return a sorted ListingModel of path, from the cache when it is still current"""
+        path = os.path.normpath(path)
+        self.apply_changes()
+        model = self.listing_cache.get(path) if use_cache else None
+        if model is None and split_archive_path(path) is not None:
+            # Archive listings are cached by open_archive instead
+            entries, orders = self.read_directory(path)
+            model = ListingModel(sort_column, sort_reverse)
+            model.append_batch(entries)
+            model.set_orders(orders)
+        elif model is None:
+            # Watch before reading so changes made during the read are not lost
+            mtime = os.stat(path).st_mtime_ns
+            self.watcher.watch(path)
+            try:
+                entries, orders = self.read_directory(path)
+            except OSError:
+                if self.listing_cache.peek(path) is None:
+                    self.watcher.unwatch(path)
+                raise
+            model = ListingModel(sort_column, sort_reverse)
+            model.append_batch(entries)
+            model.set_orders(orders)
+            self.listing_cache.put(path, model, mtime)
+        model.set_filter("")
+        model.sort(sort_column, sort_reverse)
+        return model
+
+    def collect_changes(self):
+        """Drain the watcher into {directory: changed names, or None if it must be re-read}"""
+        changes = {}
+        while True:
+            try:
+                path, names = self.watcher.events.get_nowait()
+            except queue.Empty:
+                return changes
+            if names is None or changes.get(path, set()) is None:
+                changes[path] = None
+            else:
+                changes.setdefault(path, set()).update(names)
+
+    def apply_changes(self):
+        """Bring every cached listing up to date with what the watcher has seen"""
+        for path, names in self.collect_changes().items():
+            self.patch_listing(path, names)
+
+    def patch_listing(self, path, names):
+        """Patch the cached listing of path; returns it, or None if it is not cached or was dropped"""
+        model = self.listing_cache.peek(path)
+        if model is None:
+            return None
+        if names is None or len(names) > PATCH_LIMIT:
+            # Too much changed to patch; the directory is read again on next use
+            self.listing_cache.invalidate(path)
+            return None
+        for name in names:
+            self.patch_entry(model, path, name)
+        return model
+
+    def patch_entry(self, model, path, name):
+        """Bring one entry of a listing in line with the filesystem"""
+        entry = stat_entry(path, name)
+        if entry is None:
+            model.remove(name)
+        else:
+            model.upsert(entry)
+
+    # Properties
+    def properties(self, path):
+        """Describe path from a single stat; raises OSError if it cannot be read"""
+        location = split_archive_path(path)
+        if location is not None and location[1]:
+            is_dir, size, mtime = self.open_archive(location[0]).member(location[1])[:3]
+            return {"name": os.path.basename(path), "location": os.path.dirname(path), "is_dir": is_dir,
+                    "size": None if is_dir else size, "created": mtime, "modified": mtime}
+        st = os.stat(path)
+        is_dir = stat.S_ISDIR(st.st_mode)
+        return {"name": os.path.basename(path), "location": os.path.dirname(path), "is_dir": is_dir,
+                "size": None if is_dir else st.st_size, "created": st.st_ctime, "modified": st.st_mtime}
+
+    def directory_size(self, path, progress=None, cancel=None):
+        """Total the tree under path; see DirectorySizeScanner.scan"""
+        return self.size_scanner.scan(path, progress, cancel)
+
+    # Copy, move and delete
+    def transfer_items(self, src_paths, destination):
+        """Pair each source with its place in destination; raises ValueError if one is its own target"""
+        items = []
+        for src_path in src_paths:
+            dst_path = os.path.join(destination, os.path.basename(src_path))
+            if os.path.abspath(src_path) == os.path.abspath(dst_path):
+                raise ValueError("Source and destination are the same")
+            items.append((src_path, dst_path))
+        return items
+
+    def transfer(self, items, move=False, description=None):
+        """Queue a copy or move of (source, destination) pairs and return its TransferJob"""
+        if description is None:
+            label = os.path.basename(items[0][0]) if len(items) == 1 else f"{len(items)} items"
+            description = f"Moving {label}" if move else f"Copying {label}"
+        job = TransferJob(items, move=move)
+        self.batch_queue.submit(TransferOperation(job, description))
+        return job
+
+    def copy(self, src_paths, destination, overwrite=False):
+        """Queue a copy of src_paths into destination; raises FileExistsError rather than overwrite"""
+        return self.transfer(self.checked_items(src_paths, destination, overwrite))
+
+    def move(self, src_paths, destination, overwrite=False):
+        """Queue a move of src_paths into destination; raises FileExistsError rather than overwrite"""
+        return self.transfer(self.checked_items(src_paths, destination, overwrite), move=True)
+
+    def checked_items(self, src_paths, destination, overwrite):
+        items = self.transfer_items(src_paths, destination)
+        if not overwrite:
+            for _, dst_path in items:
+                if os.path.lexists(dst_path):
+                    raise FileExistsError(errno.EEXIST, "Destination exists", dst_path)
+        return items
+
+    def delete(self, paths, permanent=False):
+        """Queue moving paths to the trash (or deleting them for good) and return the operation"""
+        operation = TrashOperation(self.trash, paths, permanent=permanent)
+        self.batch_queue.submit(operation)
+        return operation
+
+    def restore(self, operation):
+        """Queue putting back what a TrashOperation moved to the trash"""
+        restore = RestoreOperation(self.trash, operation.trashed)
+        self.batch_queue.submit(restore)
+        return restore
+
+    # Archives
+    def open_archive(self, path):
+        """Return the member index of an archive file, read again if the file changed"""
+        st = os.stat(path)
+        with self.archive_lock:
+            archive = self.archives.get(path)
+            if archive is not None and archive.stamp == (st.st_size, st.st_mtime_ns):
+                self.archives.move_to_end(path)
+                return archive
+        archive = ArchiveIndex(path).load()
+        with self.archive_lock:
+            self.archives[path] = archive
+            while len(self.archives) > ARCHIVE_CACHE_SIZE:
+                self.archives.popitem(last=False)
+        return archive
+
+    def is_directory(self, path):
+        """True for directories, archive files and the folders inside archives"""
+        if os.path.isdir(path):
+            return True
+        location = split_archive_path(path)
+        if location is None:
+            return False
+        if not location[1]:
+            return True
+        try:
+            return self.open_archive(location[0]).is_dir(location[1])
+        except (OSError, tarfile.TarError, zipfile.BadZipFile):
+            return False
+
+    def exists(self, path):
+        """os.path.lexists that also sees members of archives"""
+        if os.path.lexists(path):
+            return True
+        location = split_archive_path(path)
+        if location is None:
+            return False
+        try:
+            self.open_archive(location[0]).member(location[1])
+            return True
+        except (OSError, tarfile.TarError, zipfile.BadZipFile):
+            return False
+
+    def extract(self, paths, destination):
+        """Queue extracting archive files (whole) or archive members into destination
+
+        Members keep their names relative to the folder they were picked
+        from. Returns the ExtractOperations, one per archive and folder.
+        """
+        groups = {}
+        for path in paths:
+            archive_path, inner = split_archive_path(path)
+            groups.setdefault((archive_path, inner.rpartition("/")[0]), []).append(inner)
+        operations = []
+        for (archive_path, base), names in groups.items():
+            if "" in names:
+                names, base = None, ""
+            operation = ExtractOperation(self.open_archive, archive_path, names, base, destination)
+            self.batch_queue.submit(operation)
+            operations.append(operation)
+        return operations
+
+    def extract_to_temp(self, path):
+        """Stream one archive member to a private temporary file, for opening; returns its path"""
+        archive_path, inner = split_archive_path(path)
+        archive = self.open_archive(archive_path)
+        mtime = archive.member(inner)[2]
+        with self.archive_lock:
+            if self.archive_temp is None:
+                # Removed when the process exits
+                self.archive_temp = tempfile.TemporaryDirectory(prefix="fm-archive-")
+        digest = hashlib.sha1(os.fsencode(archive_path)).hexdigest()[:16]
+        target = os.path.join(self.archive_temp.name, digest, *inner.split("/"))
+        try:
+            if os.stat(target).st_mtime == mtime:
+                return target
+        except OSError:
+            pass
+        archive.extract_member(inner, target)
+        return target
+
+    def wait(self):
+        """Block until every queued operation has run; returns them"""
+        while True:
+            finished = self.batch_queue.take_finished()
+            if finished is not None:
+                return finished
+            time.sleep(BATCH_POLL_MS / 1000)
+
+
+class TransferDialog(tk.Toplevel):
+    """Progress window for a TransferJob with pause and cancel"""
+
+    def __init__(self, manager, job, title):
+        super().__init__(manager)
+        self.manager = manager
+        self.job = job
+        self.title(title)
+        self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+        
+        frame = ttk.Frame(self, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.current_var = tk.StringVar(value="Preparing...")
+        ttk.Label(frame, textvariable=self.current_var, width=60).pack(fill=tk.X)
+        
+        self.progress = ttk.Progressbar(frame, orient=tk.HORIZONTAL, length=400, mode='determinate')
+        self.progress.pack(fill=tk.X, pady=5)
+        
+        self.detail_var = tk.StringVar()
+        ttk.Label(frame, textvariable=self.detail_var).pack(fill=tk.X)
+        
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons, text="Cancel", command=self.cancel).pack(side=tk.RIGHT, padx=2)
+        self.pause_btn = ttk.Button(buttons, text="Pause", command=self.toggle_pause)
+        self.pause_btn.pack(side=tk.RIGHT, padx=2)
+        
+        self.after(TRANSFER_POLL_MS, self.poll)
+
+    def toggle_pause(self):
+        if self.job.running.is_set():
+            self.job.pause()
+            self.pause_btn.config(text="Resume")
+        else:
+            self.job.resume()
+            self.pause_btn.config(text="Pause")
+
+    def cancel(self):
+        self.job.cancel()
+
+    def poll(self):
+        job = self.job
+        if job.is_finished():
+            self.finish()
+            return
+        
+        fmt = self.manager.get_size_format
+        if job.total_bytes:
+            self.progress["value"] = 100 * job.done_bytes / job.total_bytes
+        if job.status == "pending":
+            self.current_var.set("Waiting for earlier operations...")
+        else:
+            self.current_var.set(os.path.basename(job.current) or job.status.capitalize() + "...")
+        detail = f"{job.done_files:,} of {job.total_files:,} files, {fmt(job.done_bytes)} of {fmt(job.total_bytes)}"
+        detail += f"  |  {fmt(int(job.rate()))}/s"
+        eta = job.eta()
+        if eta is not None and job.running.is_set():
+            detail += f"  |  {int(eta) // 60}:{int(eta) % 60:02d} left"
+        if not job.running.is_set():
+            detail += "  |  Paused"
+        self.detail_var.set(detail)
+        self.after(TRANSFER_POLL_MS, self.poll)
+
+    def finish(self):
+        job = self.job
+        verb = "Moved" if job.move else "Copied"
+        if job.status == "done":
+            self.manager.status_var.set(f"{verb} {len(job.items)} item(s), {self.manager.get_size_format(job.done_bytes)}")
+        elif job.status == "cancelled":
+            self.manager.status_var.set("Transfer cancelled")
+        if job.errors:
+            shown = "\n".join(job.errors[:10])
+            if len(job.errors) > 10:
+                shown += f"\n... and {len(job.errors) - 10} more"
+            messagebox.showerror("Error", f"Operation failed:\n{shown}", parent=self)
+        self.destroy()
+
+
+class ContentSearchView(tk.Toplevel):
+    """Find in Files: matching lines under one directory, grouped by file"""
+
+    def __init__(self, manager, path):
+        super().__init__(manager)
+        self.manager = manager
+        self.root_path = path
+        self.search = None
+        self.result_count = 0
+        self.title(f"Find in Files - {path}")
+        self.geometry("1000x600")
+        
+        # Query bar
+        toolbar = ttk.Frame(self, padding=5)
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+        self.query_var = tk.StringVar()
+        query_entry = ttk.Entry(toolbar, textvariable=self.query_var, width=40)
+        query_entry.pack(side=tk.LEFT, padx=2)
+        self.ignore_case_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="Ignore case", variable=self.ignore_case_var).pack(side=tk.LEFT, padx=2)
+        self.regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="Regular expression", variable=self.regex_var).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Search", command=self.start_search).pack(side=tk.LEFT, padx=2)
+        self.cancel_btn = ttk.Button(toolbar, text="Cancel", command=self.cancel_search, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Results pane
+        tree_frame = ttk.Frame(self)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=('line', 'text'), selectmode='browse')
+        self.tree.heading('#0', text='File')
+        self.tree.heading('line', text='Line')
+        self.tree.heading('text', text='Text')
+        self.tree.column('#0', width=300)
+        self.tree.column('line', width=60, anchor=tk.E)
+        self.tree.column('text', width=600)
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.status_var = tk.StringVar(value="Enter text to search for")
+        ttk.Label(self, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X)
+        
+        query_entry.bind("<Return>", lambda e: self.start_search())
+        self.tree.bind("<Double-1>", self.on_double_click)
+        self.bind("<Destroy>", lambda e: self.cancel_search() if e.widget is self else None)
+        query_entry.focus_set()
+
+    def start_search(self):
+        query = self.query_var.get()
+        if not query:
+            return
+        self.cancel_search()
+        try:
+            search = ContentSearch(self.root_path, query, ignore_case=self.ignore_case_var.get(),
+                                   regex=self.regex_var.get())
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid regular expression: {str(e)}", parent=self)
+            return
+        
+        self.tree.delete(*self.tree.get_children())
+        self.result_count = 0
+        self.search = search
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.status_var.set("Searching...")
+        search.start()
+        self.after(GREP_POLL_MS, self.poll_search, search)
+
+    def cancel_search(self):
+        if self.search is not None:
+            self.search.cancel()
+
+    def poll_search(self, search):
+        if search is not self.search or not self.winfo_exists():
+            return
+        
+        # Insert what arrived, but keep each frame short
+        deadline = time.monotonic() + LOAD_FRAME_BUDGET
+        while time.monotonic() < deadline:
+            try:
+                path, matches = search.results.get_nowait()
+            except queue.Empty:
+                break
+            if path is None:
+                messagebox.showerror("Error", f"Search failed: {matches}", parent=self)
+                continue
+            self.add_file_results(path, matches)
+            if self.result_count >= GREP_MAX_RESULTS:
+                search.cancel()
+                break
+        
+        progress = search.progress
+        status = (f"{self.result_count:,} matching lines | {progress['files']:,} files, "
+                  f"{self.manager.get_size_format(progress['bytes'])} searched at "
+                  f"{self.manager.get_size_format(search.rate())}/s")
+        if progress["binary"]:
+            status += f" | {progress['binary']:,} binary skipped"
+        if progress["errors"]:
+            status += f" | {progress['errors']:,} unreadable"
+        
+        if search.is_finished() and search.results.empty():
+            if search.cancel_event.is_set():
+                status += " (stopped)" if self.result_count < GREP_MAX_RESULTS else " (result limit reached)"
+            self.status_var.set(status)
+            self.cancel_btn.config(state=tk.DISABLED)
+            return
+        self.status_var.set("Searching... " + status)
+        self.after(GREP_POLL_MS, self.poll_search, search)
+
+    def add_file_results(self, path, matches):
+        file_node = self.tree.insert('', 'end', iid=path, text=os.path.relpath(path, self.root_path),
+                                     values=(len(matches), ''), open=True)
+        for line_number, text in matches:
+            self.tree.insert(file_node, 'end', values=(line_number, text))
+        self.result_count += len(matches)
+
+    def on_double_click(self, event):
+        item = self.tree.identify_row(event.y)
+        if not item:
+            return
+        path = item if self.tree.parent(item) == '' else self.tree.parent(item)
+        self.manager.open_file(path)
+
+
+class SyncView(tk.Toplevel):
+    """Compare two directory trees and copy over only what differs"""
+
+    STATUS_LABELS = {'new': "Only in source", 'changed': "Changed", 'touched': "Same contents, newer time",
+                     'extra': "Only in target"}
+
+    def __init__(self, manager, source, target):
+        super().__init__(manager)
+        self.manager = manager
+        self.comparison = None
+        self.title("Compare and Sync")
+        self.geometry("900x550")
+        
+        # Source and target pickers
+        form = ttk.Frame(self, padding=5)
+        form.pack(side=tk.TOP, fill=tk.X)
+        self.source_var = tk.StringVar(value=source)
+        self.target_var = tk.StringVar(value=target)
+        for row, (label, var) in enumerate((("Source:", self.source_var), ("Target:", self.target_var))):
+            ttk.Label(form, text=label).grid(row=row, column=0, sticky=tk.W)
+            ttk.Entry(form, textvariable=var).grid(row=row, column=1, sticky='ew', padx=5)
+            ttk.Button(form, text="Browse...", command=lambda v=var: self.browse(v)).grid(row=row, column=2)
+        form.grid_columnconfigure(1, weight=1)
+        
+        toolbar = ttk.Frame(self, padding=5)
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+        self.hash_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="Compare contents when only the time differs",
+                        variable=self.hash_var).pack(side=tk.LEFT, padx=2)
+        self.mirror_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="Move files only in target to Trash",
+                        variable=self.mirror_var).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Compare", command=self.start_compare).pack(side=tk.LEFT, padx=2)
+        self.sync_btn = ttk.Button(toolbar, text="Sync", command=self.sync, state=tk.DISABLED)
+        self.sync_btn.pack(side=tk.LEFT, padx=2)
+        
+        tree_frame = ttk.Frame(self)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=('path', 'status', 'source', 'target'), show='headings')
+        self.tree.heading('path', text='Path')
+        self.tree.heading('status', text='Difference')
+        self.tree.heading('source', text='Source Size')
+        self.tree.heading('target', text='Target Size')
+        self.tree.column('path', width=420)
+        self.tree.column('status', width=180)
+        self.tree.column('source', width=100, anchor=tk.E)
+        self.tree.column('target', width=100, anchor=tk.E)
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.status_var = tk.StringVar(value="Choose two folders and press Compare")
+        ttk.Label(self, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X)
+        self.bind("<Destroy>", lambda e: self.comparison.cancel() if e.widget is self and self.comparison else None)
+
+    def browse(self, var):
+        path = filedialog.askdirectory(parent=self, initialdir=var.get() or None)
+        if path:
+            var.set(path)
+
+    def start_compare(self):
+        source, target = self.source_var.get(), self.target_var.get()
+        if not os.path.isdir(source) or not os.path.isdir(target):
+            messagebox.showerror("Error", "Both source and target must be existing folders", parent=self)
+            return
+        if os.path.normpath(os.path.abspath(source)) == os.path.normpath(os.path.abspath(target)):
+            messagebox.showerror("Error", "Source and target are the same folder", parent=self)
+            return
+        if self.comparison is not None:
+            self.comparison.cancel()
+        self.comparison = TreeComparison(source, target, use_hash=self.hash_var.get())
+        self.comparison.start()
+        self.sync_btn.config(state=tk.DISABLED)
+        self.tree.delete(*self.tree.get_children())
+        self.after(SYNC_POLL_MS, self.poll_compare, self.comparison)
+
+    def poll_compare(self, comparison):
+        if comparison is not self.comparison or not self.winfo_exists():
+            return
+        progress = comparison.progress
+        if not progress["finished"]:
+            status = f"Comparing... {progress['entries']:,} entries listed"
+            if progress["to_hash"]:
+                status += f", {progress['hashed']:,} of {progress['to_hash']:,} files hashed"
+            self.status_var.set(status)
+            self.after(SYNC_POLL_MS, self.poll_compare, comparison)
+            return
+        if progress["error"]:
+            self.status_var.set(f"Compare failed: {progress['error']}")
+            return
+        self.show_differences(comparison.differences)
+
+    def show_differences(self, differences):
+        fmt = self.manager.get_size_format
+        for path, status, src, dst in differences[:SYNC_DISPLAY_LIMIT]:
+            src_size = fmt(src[1]) if src and not src[0] else ('Folder' if src else '')
+            dst_size = fmt(dst[1]) if dst and not dst[0] else ('Folder' if dst else '')
+            self.tree.insert('', 'end', values=(path, self.STATUS_LABELS[status], src_size, dst_size))
+        
+        counts = Counter(status for _, status, _, _ in differences)
+        errors = self.comparison.progress["errors"]
+        unreadable = f" ({errors:,} unreadable, left out)" if errors else ""
+        if not differences:
+            self.status_var.set(f"The folders are in sync{unreadable}")
+            return
+        summary = ", ".join(f"{count:,} {self.STATUS_LABELS[status].lower()}" for status, count in counts.items())
+        copy_bytes = sum(src[1] for _, status, src, _ in differences if status in ('new', 'changed') and not src[0])
+        status = f"{len(differences):,} differences ({summary}); up to {fmt(copy_bytes)} to copy"
+        if len(differences) > SYNC_DISPLAY_LIMIT:
+            status += f" - showing the first {SYNC_DISPLAY_LIMIT:,}"
+        self.status_var.set(status + unreadable)
+        self.sync_btn.config(state=tk.NORMAL)
+
+    def sync(self):
+        """Queue the copies, timestamp fixes and (optionally) trash moves the comparison found"""
+        comparison = self.comparison
+        if comparison is None or not comparison.progress["finished"]:
+            return
+        source, target = comparison.source, comparison.target
+        copies, touches, extras = [], [], []
+        for path, status, _, _ in comparison.differences:
+            pair = (os.path.join(source, path), os.path.join(target, path))
+            if status in ('new', 'changed'):
+                copies.append(pair)
+            elif status == 'touched':
+                touches.append(pair)
+            elif self.mirror_var.get():
+                extras.append(pair[1])
+        
+        if copies:
+            title = f"Syncing {len(copies)} item(s) to {os.path.basename(target) or target}"
+            # Large changed files are patched in place instead of copied whole
+            job = TransferJob(copies, delta=True)
+            self.manager.submit_batch(TransferOperation(job, title))
+            TransferDialog(self.manager, job, title)
+        if touches:
+            self.manager.submit_batch(TouchOperation(touches))
+        if extras:
+            self.manager.submit_batch(TrashOperation(self.manager.trash, extras))
+        self.sync_btn.config(state=tk.DISABLED)
+        self.status_var.set("Sync queued; compare again once it has finished to check the result")
+
+
+class DuplicatesView(tk.Toplevel):
+    """Groups of identical files under one directory, with batch removal of the extra copies"""
+
+    def __init__(self, manager, path):
+        super().__init__(manager)
+        self.manager = manager
+        self.root_path = path
+        self.finder = None
+        self.title(f"Duplicate Files - {path}")
+        self.geometry("900x550")
+        
+        toolbar = ttk.Frame(self, padding=5)
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+        ttk.Button(toolbar, text="Rescan", command=self.start_scan).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Select Extra Copies", command=self.select_extra_copies).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Move Selected to Trash", command=self.trash_selected).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Show in Folder", command=self.show_in_folder).pack(side=tk.LEFT, padx=2)
+        
+        tree_frame = ttk.Frame(self)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=('size', 'modified'), selectmode='extended')
+        self.tree.heading('#0', text='File')
+        self.tree.heading('size', text='Size')
+        self.tree.heading('modified', text='Modified')
+        self.tree.column('#0', width=560)
+        self.tree.column('size', width=140, anchor=tk.E)
+        self.tree.column('modified', width=150)
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.status_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X)
+        self.tree.bind("<Double-1>", lambda e: self.show_in_folder())
+        self.bind("<Destroy>", lambda e: self.finder.cancel() if e.widget is self and self.finder else None)
+        
+        self.start_scan()
+
+    def start_scan(self):
+        if self.finder is not None:
+            self.finder.cancel()
+        self.finder = DuplicateFinder(self.root_path)
+        self.finder.start()
+        self.tree.delete(*self.tree.get_children())
+        self.after(DUPES_POLL_MS, self.poll_scan, self.finder)
+
+    def poll_scan(self, finder):
+        if finder is not self.finder or not self.winfo_exists():
+            return
+        progress = finder.progress
+        if not progress["finished"]:
+            status = f"{progress['stage']}... {progress['files']:,} files"
+            if progress["total"]:
+                status += f", {progress['done']:,} of {progress['total']:,} hashed"
+            if progress["cached"]:
+                status += f" ({progress['cached']:,} from cache)"
+            self.status_var.set(status)
+            self.after(DUPES_POLL_MS, self.poll_scan, finder)
+            return
+        if progress["error"]:
+            self.status_var.set(f"Scan failed: {progress['error']}")
+            return
+        self.show_groups(finder.groups)
+
+    def show_groups(self, groups):
+        fmt = self.manager.get_size_format
+        wasted = 0
+        for number, (size, paths) in enumerate(groups):
+            wasted += size * (len(paths) - 1)
+            group = self.tree.insert('', 'end', iid=f"group-{number}", open=True,
+                                     text=f"{len(paths)} copies of {os.path.basename(paths[0])}",
+                                     values=(f"{fmt(size * (len(paths) - 1))} extra", ''))
+            for path in sorted(paths):
+                try:
+                    modified = self.manager.format_timestamp(os.stat(path).st_mtime)
+                except OSError:
+                    modified = ''
+                self.tree.insert(group, 'end', iid=path, text=path, values=(fmt(size), modified))
+        if groups:
+            self.status_var.set(f"{len(groups):,} groups of duplicates; {fmt(wasted)} could be freed")
+        else:
+            self.status_var.set("No duplicate files found")
+
+    def select_extra_copies(self):
+        """Select every file except the first of each group"""
+        extra = [child for group in self.tree.get_children() for child in self.tree.get_children(group)[1:]]
+        self.tree.selection_set(extra)
+
+    def trash_selected(self):
+        paths = [iid for iid in self.tree.selection() if self.tree.parent(iid)]
+        if not paths:
+            return
+        # Never let a batch remove every copy of something
+        for group in self.tree.get_children():
+            children = self.tree.get_children(group)
+            if children and all(child in paths for child in children):
+                messagebox.showerror("Error", f"All copies of {os.path.basename(children[0])} are selected; "
+                                     "keep at least one.", parent=self)
+                return
+        self.manager.submit_batch(TrashOperation(self.manager.trash, paths))
+        for path in paths:
+            group = self.tree.parent(path)
+            self.tree.delete(path)
+            if len(self.tree.get_children(group)) < 2:
+                self.tree.delete(group)
+        self.status_var.set(f"Moving {len(paths)} file(s) to Trash")
+
+    def show_in_folder(self):
+        selection = [iid for iid in self.tree.selection() if self.tree.parent(iid)]
+        if selection:
+            self.manager.change_directory(os.path.dirname(selection[0]))
+            self.manager.lift()
+
+
+class TrashView(tk.Toplevel):
+    """Items in the trash, with restore, permanent delete and empty"""
+
+    def __init__(self, manager):
+        super().__init__(manager)
+        self.manager = manager
+        self.trash = manager.trash
+        self.entries = {}
+        self.busy = False
+        self.title("Trash")
+        self.geometry("800x450")
+        
+        toolbar = ttk.Frame(self, padding=5)
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+        ttk.Button(toolbar, text="Restore", command=self.restore_selected).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Delete Permanently", command=self.delete_selected).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Empty Trash", command=self.empty_trash).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Refresh", command=self.load).pack(side=tk.LEFT, padx=2)
+        self.status_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.status_var).pack(side=tk.LEFT, padx=10)
+        
+        tree_frame = ttk.Frame(self)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=('name', 'location', 'deleted'), show='headings',
+                                 selectmode='extended')
+        self.tree.heading('name', text='Name')
+        self.tree.heading('location', text='Original Location')
+        self.tree.heading('deleted', text='Deleted')
+        self.tree.column('name', width=220)
+        self.tree.column('location', width=400)
+        self.tree.column('deleted', width=150)
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.load()
+
+    def load(self):
+        """Read the trash info files in the background"""
+        if self.busy:
+            return
+        self.busy = True
+        self.status_var.set("Reading trash...")
+        result = {}
+        
+        def read():
+            result["entries"] = self.trash.entries()
+        
+        worker = threading.Thread(target=read)
+        worker.daemon = True
+        worker.start()
+        self.after(TRASH_POLL_MS, self.poll_load, worker, result)
+
+    def poll_load(self, worker, result):
+        if not self.winfo_exists():
+            return
+        if worker.is_alive():
+            self.after(TRASH_POLL_MS, self.poll_load, worker, result)
+            return
+        self.busy = False
+        self.tree.delete(*self.tree.get_children())
+        self.entries = {}
+        for entry in sorted(result["entries"], key=lambda e: e["deleted"], reverse=True):
+            iid = self.tree.insert('', 'end', values=(os.path.basename(entry["path"]),
+                                                      os.path.dirname(entry["path"]), entry["deleted"]))
+            self.entries[iid] = entry
+        self.update_status()
+
+    def update_status(self):
+        if not self.winfo_exists():
+            return
+        status = f"{len(self.entries):,} item(s)"
+        if self.trash.purger.busy:
+            status += " | purging deleted items in the background"
+            self.after(TRASH_POLL_MS, self.update_status)
+        self.status_var.set(status)
+
+    def run_action(self, action, entries, description):
+        """Apply action(entry) to entries off the UI thread, then reload"""
+        if self.busy or not entries:
+            return
+        self.busy = True
+        self.status_var.set(f"{description}...")
+        errors = []
+        
+        def work():
+            for entry in entries:
+                try:
+                    action(entry)
+                except OSError as e:
+                    errors.append(f"{entry['path']}: {e.strerror or e}")
+        
+        worker = threading.Thread(target=work)
+        worker.daemon = True
+        worker.start()
+        self.after(TRASH_POLL_MS, self.poll_action, worker, errors)
+
+    def poll_action(self, worker, errors):
+        if not self.winfo_exists():
+            return
+        if worker.is_alive():
+            self.after(TRASH_POLL_MS, self.poll_action, worker, errors)
+            return
+        self.busy = False
+        if errors:
+            messagebox.showerror("Error", "\n".join(errors[:10]), parent=self)
+        self.load()
+
+    def selected_entries(self):
+        return [self.entries[iid] for iid in self.tree.selection() if iid in self.entries]
+
+    def restore_selected(self):
+        self.run_action(lambda e: self.trash.restore(e["trash_dir"], e["name"], e["path"]),
+                        self.selected_entries(), "Restoring")
+
+    def delete_selected(self):
+        entries = self.selected_entries()
+        if entries and messagebox.askyesno("Confirm Delete",
+                                           f"Permanently delete {len(entries)} item(s)?", parent=self):
+            self.run_action(lambda e: self.trash.expunge(e["trash_dir"], e["name"]), entries, "Deleting")
+
+    def empty_trash(self):
+        entries = list(self.entries.values())
+        if entries and messagebox.askyesno("Empty Trash",
+                                           f"Permanently delete all {len(entries)} item(s) in the trash?",
+                                           parent=self):
+            self.run_action(lambda e: self.trash.expunge(e["trash_dir"], e["name"]), entries, "Emptying trash")
+
+
+class DiskUsageView(tk.Toplevel):
+    """Per-directory size rollups and a treemap for the tree under one directory"""
+
+    def __init__(self, manager, path):
+        super().__init__(manager)
+        self.manager = manager
+        self.root_path = path
+        self.scanner = manager.size_scanner
+        self.totals = {}
+        self.focus_path = path
+        self.progress = {}
+        self.cancel = threading.Event()
+        self.title(f"Disk Usage - {path}")
+        self.geometry("1000x600")
+        
+        # Toolbar
+        toolbar = ttk.Frame(self, padding=5)
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+        ttk.Button(toolbar, text="Rescan", command=self.start_scan).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Up", command=self.focus_parent).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Open in File Manager", command=self.open_in_manager).pack(side=tk.LEFT, padx=2)
+        self.status_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.status_var).pack(side=tk.LEFT, padx=10)
+        
+        # Rollup tree on the left, treemap on the right
+        panes = ttk.PanedWindow(self, orient=tk.HORIZONTAL)
+        panes.pack(fill=tk.BOTH, expand=True)
+        
+        tree_frame = ttk.Frame(panes)
+        self.tree = ttk.Treeview(tree_frame, columns=('size', 'percent'), selectmode='browse')
+        self.tree.heading('#0', text='Directory')
+        self.tree.heading('size', text='Size')
+        self.tree.heading('percent', text='% of parent')
+        self.tree.column('#0', width=260)
+        self.tree.column('size', width=90, anchor=tk.E)
+        self.tree.column('percent', width=80, anchor=tk.E)
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        panes.add(tree_frame, weight=1)
+        
+        self.canvas = tk.Canvas(panes, background="#ffffff", highlightthickness=0)
+        panes.add(self.canvas, weight=2)
+        
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.canvas.bind("<Configure>", lambda e: self.draw_treemap())
+        self.canvas.bind("<Button-1>", self.on_treemap_click)
+        self.bind("<Destroy>", lambda e: self.cancel.set() if e.widget is self else None)
+        
+        self.start_scan()
+
+    def start_scan(self):
+        """Scan in the background; directories with an unchanged mtime read recently are not re-read"""
+        if self.progress and not self.progress.get("done") and not self.progress.get("cancelled"):
+            return
+        self.progress = {}
+        self.status_var.set("Scanning...")
+        
+        def scan():
+            if not self.scanner.index_loaded:
+                self.scanner.load()
+            self.scanner.scan(self.root_path, self.progress, self.cancel)
+            if self.progress["cancelled"]:
+                return
+            self.progress["totals"] = self.scanner.rollup(self.root_path)
+            try:
+                self.scanner.save()
+            except OSError as e:
+                self.progress["error_samples"].append(f"Could not save size index: {e}")
+            self.progress["finished"] = True
+        
+        worker = threading.Thread(target=scan)
+        worker.daemon = True
+        worker.start()
+        self.after(SIZE_POLL_MS, self.poll_scan)
+
+    def poll_scan(self):
+        if not self.winfo_exists():
+            return
+        progress = self.progress
+        if progress.get("finished"):
+            self.totals = progress["totals"]
+            total = self.totals.get(self.root_path, 0)
+            status = f"{self.manager.get_size_format(total)} in {progress['files']:,} files, {progress['dirs']:,} folders"
+            if progress["errors"]:
+                status += f" ({progress['errors']:,} unreadable)"
+            self.status_var.set(status)
+            self.build_tree()
+            return
+        if progress:
+            self.status_var.set(f"Scanning... {progress['dirs']:,} folders, "
+                                f"{self.manager.get_size_format(progress['bytes'])}")
+        self.after(SIZE_POLL_MS, self.poll_scan)
+
+    def children_by_size(self, path):
+        """Subdirectories of path as (size, full path), largest first"""
+        with self.scanner.lock:
+            record = self.scanner.cache.get(path)
+        if record is None:
+            return []
+        children = [(self.totals.get(os.path.join(path, name), 0), os.path.join(path, name))
+                    for name in record["subdirs"]]
+        children.sort(reverse=True)
+        return children
+
+    def build_tree(self):
+        self.tree.delete(*self.tree.get_children())
+        total = self.totals.get(self.root_path, 0)
+        self.insert_node('', self.root_path, self.root_path, total, total)
+        self.tree.item(self.root_path, open=True)
+        self.fill_node(self.root_path)
+        if not self.tree.exists(self.focus_path):
+            self.focus_path = self.root_path
+        self.tree.selection_set(self.focus_path)
+        self.draw_treemap()
+
+    def insert_node(self, parent, path, text, size, parent_size):
+        percent = f"{100 * size / parent_size:.1f}%" if parent_size else ""
+        self.tree.insert(parent, 'end', iid=path, text=text,
+                         values=(self.manager.get_size_format(size), percent))
+        with self.scanner.lock:
+            record = self.scanner.cache.get(path)
+        if record and record["subdirs"]:
+            # Placeholder so the node can be expanded; real children are added on open
+            self.tree.insert(path, 'end', iid=path + "\0placeholder", text="...")
+
+    def fill_node(self, path):
+        """Insert the children of a tree node, sorted by size"""
+        placeholder = path + "\0placeholder"
+        if not self.tree.exists(placeholder):
+            return
+        self.tree.delete(placeholder)
+        size = self.totals.get(path, 0)
+        for child_size, child in self.children_by_size(path):
+            self.insert_node(path, child, os.path.basename(child), child_size, size)
+        own = self.scanner.own_bytes(path)
+        if own:
+            percent = f"{100 * own / size:.1f}%" if size else ""
+            self.tree.insert(path, 'end', iid=path + "\0files", text="(files)",
+                             values=(self.manager.get_size_format(own), percent))
+
+    def on_tree_open(self, event):
+        self.fill_node(self.tree.focus())
+
+    def on_tree_select(self, event):
+        selection = self.tree.selection()
+        if not selection or "\0" in selection[0]:
+            return
+        if selection[0] != self.focus_path:
+            self.focus_path = selection[0]
+            self.draw_treemap()
+
+    def focus_parent(self):
+        if self.focus_path != self.root_path:
+            self.select_path(os.path.dirname(self.focus_path))
+
+    def select_path(self, path):
+        """Expand the tree down to path and select it"""
+        chain = []
+        current = path
+        while current != self.root_path and current != os.path.dirname(current):
+            chain.append(current)
+            current = os.path.dirname(current)
+        for ancestor in [self.root_path] + chain[::-1]:
+            self.fill_node(ancestor)
+            if ancestor != path:
+                self.tree.item(ancestor, open=True)
+        if self.tree.exists(path):
+            self.tree.selection_set(path)
+            self.tree.see(path)
+
+    def open_in_manager(self):
+        self.manager.change_directory(self.focus_path)
+        self.manager.lift()
+
+    def draw_treemap(self):
+        """Draw the children of the focused directory as a squarified treemap"""
+        self.canvas.delete("all")
+        self.treemap_rects = []
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if not self.totals or width < 10 or height < 10:
+            return
+        
+        items = [(size, path) for size, path in self.children_by_size(self.focus_path) if size > 0]
+        own = self.scanner.own_bytes(self.focus_path)
+        if own:
+            items.append((own, None))
+            items.sort(key=lambda item: item[0], reverse=True)
+        if len(items) > TREEMAP_MAX_ITEMS:
+            # Fold the long tail into one block so the map stays readable
+            rest = sum(size for size, _ in items[TREEMAP_MAX_ITEMS - 1:])
+            items = items[:TREEMAP_MAX_ITEMS - 1] + [(rest, "")]
+            items.sort(key=lambda item: item[0], reverse=True)
+        if not items:
+            return
+        
+        rects = squarify([size for size, _ in items], 0, 0, width, height)
+        for i, ((size, path), (x, y, w, h)) in enumerate(zip(items, rects)):
+            red, green, blue = colorsys.hsv_to_rgb((i * 0.618) % 1.0, 0.35, 0.95)
+            color = f"#{int(red * 255):02x}{int(green * 255):02x}{int(blue * 255):02x}"
+            self.canvas.create_rectangle(x, y, x + w, y + h, fill=color, outline="#555555")
+            if path is None:
+                label = "(files)"
+            elif path == "":
+                label = "(other)"
+            else:
+                label = os.path.basename(path)
+            if w > 60 and h > 30:
+                self.canvas.create_text(x + 4, y + 4, anchor=tk.NW, width=w - 8,
+                                        text=f"{label}\n{self.manager.get_size_format(size)}")
+            self.treemap_rects.append((x, y, w, h, path))
+
+    def on_treemap_click(self, event):
+        """Drill into the directory under the mouse"""
+        for x, y, w, h, path in getattr(self, "treemap_rects", []):
+            if x <= event.x < x + w and y <= event.y < y + h:
+                if path:
+                    self.select_path(path)
+                return
+
 
 class FileManager(tk.Tk):
     def __init__(self):
@@ -10,8 +4296,54 @@ class FileManager(tk.Tk):
         self.geometry("900x600")
         self.minsize(800, 500)
         
-        # Current directory
+        # Current directory and the back/forward history of the active tab
         self.current_path = os.path.expanduser("~")
+        self.history = []
+        self.future = []
+        # Tab frame name -> saved state of the inactive tabs
+        self.panes = {}
+        self.active_pane = None
+        self.drag_start = None
+        self.dragging = False
+        
+        # Background listing state; bumping the generation cancels stale loads
+        self.load_generation = 0
+        self.load_cancel = None
+        self.load_path = None
+        self.load_mtime = None
+        self.load_pending_changes = set()
+        
+        # Listing, size, copy/move and delete logic; the names below are its parts
+        self.core = FileManagerCore()
+        self.core.start()
+        self.watcher = self.core.watcher
+        self.listing_cache = self.core.listing_cache
+        self.size_scanner = self.core.size_scanner
+        self.batch_queue = self.core.batch_queue
+        self.trash = self.core.trash
+        
+        # Filename index of the home directory, built and kept current in the background
+        self.search_query = None
+        self.filename_index = FilenameIndex(os.path.expanduser("~"))
+        self.filename_index.start()
+        
+        # The listing lives in a model; the Treeview only holds the visible rows
+        self.sort_column = 'name'
+        self.sort_reverse = False
+        self.model = ListingModel()
+        self.has_parent_row = False
+        self.view_top = 0
+        self.view_rows = DEFAULT_VIEW_ROWS
+        self.view_pool = []
+        # The cursor row plus the set of selected names (which survives scrolling and re-sorting)
+        self.selected_name = None
+        self.selected_position = None
+        self.selected_names = set()
+        self.anchor_position = None
+        
+        # Batch operations are polled while the queue is busy; the last trashing can be undone
+        self.batch_polling = False
+        self.last_trash_operation = None
         
         # Create main frame
         self.main_frame = ttk.Frame(self)
@@ -23,6 +4355,9 @@ class FileManager(tk.Tk):
         # Create path entry
         self.create_path_entry()
         
+        # Create tab bar
+        self.create_tab_bar()
+        
         # Create file browser
         self.create_file_browser()
         
@@ -36,13 +4371,22 @@ class FileManager(tk.Tk):
         
         # Bind right-click menu
         self.create_context_menu()
+        
+        # Apply directory change notifications on the Tk thread
+        self.after(WATCH_POLL_MS, self.poll_directory_changes)
 
     def create_toolbar(self):
         toolbar = ttk.Frame(self.main_frame)
         toolbar.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
         
-        # Back button
-        self.back_btn = ttk.Button(toolbar, text="Back", command=self.go_back)
+        # History buttons
+        self.history_back_btn = ttk.Button(toolbar, text="Back", command=self.history_back)
+        self.history_back_btn.pack(side=tk.LEFT, padx=2)
+        self.history_forward_btn = ttk.Button(toolbar, text="Forward", command=self.history_forward)
+        self.history_forward_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Up button
+        self.back_btn = ttk.Button(toolbar, text="Up", command=self.go_back)
         self.back_btn.pack(side=tk.LEFT, padx=2)
         
         # Home button
@@ -56,35 +4400,259 @@ class FileManager(tk.Tk):
         # New folder button
         self.new_folder_btn = ttk.Button(toolbar, text="New Folder", command=self.create_new_folder)
         self.new_folder_btn.pack(side=tk.LEFT, padx=2)
+        
+        # New tab button
+        self.new_tab_btn = ttk.Button(toolbar, text="New Tab", command=self.new_tab)
+        self.new_tab_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Disk usage button
+        self.disk_usage_btn = ttk.Button(toolbar, text="Disk Usage", command=self.show_disk_usage)
+        self.disk_usage_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Trash button
+        self.trash_btn = ttk.Button(toolbar, text="Trash", command=lambda: TrashView(self))
+        self.trash_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Compare/sync button
+        self.compare_btn = ttk.Button(toolbar, text="Compare", command=self.show_sync)
+        self.compare_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Duplicate finder button
+        self.duplicates_btn = ttk.Button(toolbar, text="Duplicates", command=self.show_duplicates)
+        self.duplicates_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Content search button
+        self.find_in_files_btn = ttk.Button(toolbar, text="Find in Files", command=self.show_content_search)
+        self.find_in_files_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Search box (filename index, current directory and below)
+        self.search_btn = ttk.Button(toolbar, text="Search", command=self.run_search)
+        self.search_btn.pack(side=tk.RIGHT, padx=2)
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(toolbar, textvariable=self.search_var, width=30)
+        self.search_entry.pack(side=tk.RIGHT, padx=2)
+        self.search_entry.bind("<Return>", lambda e: self.run_search())
+        self.search_entry.bind("<Escape>", lambda e: self.clear_search())
+
+    def create_path_entry(self):
+        path_frame = ttk.Frame(self.main_frame)
+        path_frame.pack(side=tk.TOP, fill=tk.X, pady=5)
+        
+        path_label = ttk.Label(path_frame, text="Path:")
+        path_label.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.path_var = tk.StringVar(value=self.current_path)
+        self.path_entry = ttk.Entry(path_frame, textvariable=self.path_var)
+        self.path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.path_entry.bind("<Return>", self.navigate_to_path)
+        
+        go_btn = ttk.Button(path_frame, text="Go", command=self.navigate_to_path)
+        go_btn.pack(side=tk.LEFT, padx=(5, 0))
+        
+        # Filter box: narrows the listing as you type
+        ttk.Label(path_frame, text="Filter:").pack(side=tk.LEFT, padx=(10, 5))
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *args: self.apply_filter())
+        filter_entry = ttk.Entry(path_frame, textvariable=self.filter_var, width=20)
+        filter_entry.pack(side=tk.LEFT)
+        filter_entry.bind("<Escape>", lambda e: self.filter_var.set(""))
+
+    def create_tab_bar(self):
+        # Only the tab strip is used; every tab shares the file list below it
+        self.tab_bar = ttk.Notebook(self.main_frame)
+        self.tab_bar.pack(side=tk.TOP, fill=tk.X)
+        self.active_pane = self.add_tab_page()
+        self.tab_bar.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.tab_bar.bind("<Button-2>", self.on_tab_middle_click)
+        self.bind("<Control-t>", lambda e: self.new_tab())
+        self.bind("<Control-w>", lambda e: self.close_tab())
+        self.bind("<Alt-Left>", lambda e: self.history_back())
+        self.bind("<Alt-Right>", lambda e: self.history_forward())
+
+    def add_tab_page(self):
+        page = ttk.Frame(self.tab_bar, height=1)
+        self.tab_bar.add(page, text=self.tab_title())
+        return str(page)
+
+    def tab_title(self):
+        if self.search_query is not None:
+            return f"Search: {self.search_query}"
+        return os.path.basename(os.path.normpath(self.current_path)) or self.current_path
+
+    def update_tab_title(self):
+        if self.active_pane is not None:
+            self.tab_bar.tab(self.active_pane, text=self.tab_title())
+
+    def new_tab(self, path=None):
+        """Open a tab on path (default: the current directory) and switch to it"""
+        path = path or self.current_path
+        page = self.add_tab_page()
+        self.panes[page] = {'current_path': path, 'history': [], 'future': [], 'model': None,
+                            'has_parent_row': False, 'view_top': 0, 'selected_name': None,
+                            'selected_position': None, 'selected_names': set(),
+                            'anchor_position': None, 'search_query': None}
+        self.tab_bar.select(page)
+
+    def close_tab(self):
+        """Close the active tab, unless it is the last one"""
+        tabs = self.tab_pages()
+        if len(tabs) < 2:
+            return
+        page = self.active_pane
+        # Selecting another tab first stops this tab's work and saves its state; then drop it
+        index = tabs.index(page)
+        self.tab_bar.select(tabs[index + 1] if index + 1 < len(tabs) else tabs[index - 1])
+        self.tab_bar.forget(page)
+        self.panes.pop(page, None)
+
+    def tab_pages(self):
+        return [str(tab) for tab in self.tab_bar.tabs()]
+
+    def on_tab_middle_click(self, event):
+        try:
+            index = self.tab_bar.index(f"@{event.x},{event.y}")
+        except tk.TclError:
+            return
+        self.tab_bar.select(index)
+        self.close_tab()
+
+    def pane_state(self):
+        return {key: getattr(self, key) for key in PANE_STATE_KEYS}
+
+    def save_pane_state(self):
+        """Stop work that belongs to the active tab before its state is put away"""
+        if self.load_cancel is None:
+            return
+        self.load_cancel.set()
+        self.load_cancel = None
+        self.load_generation += 1
+        if self.load_path is not None and self.listing_cache.peek(self.load_path) is None:
+            self.watcher.unwatch(self.load_path)
+        # Half-loaded listings and searches start over when the tab comes back
+        self.model = None
+
+    def on_tab_changed(self, event=None):
+        page = str(self.tab_bar.select())
+        if not page or page == self.active_pane:
+            return
+        if self.active_pane in self.tab_pages():
+            self.save_pane_state()
+            self.panes[self.active_pane] = self.pane_state()
+        self.active_pane = page
+        self.restore_pane_state(self.panes.pop(page))
+
+    def restore_pane_state(self, state):
+        """Show a tab again from its saved state; a cached listing makes this instant"""
+        for key in PANE_STATE_KEYS:
+            setattr(self, key, state[key])
+        self.path_var.set(self.current_path)
+        self.has_parent_row = (os.path.dirname(self.current_path) != self.current_path
+                               and self.search_query is None)
+        
+        if self.search_query is not None:
+            self.search_var.set(self.search_query)
+            if self.model is None:
+                self.run_search(self.search_query)
+                return
+        else:
+            self.search_var.set("")
+            cached = self.listing_cache.get(os.path.normpath(self.current_path))
+            if cached is None:
+                self.populate_file_list()
+                return
+            self.model = cached
+        
+        self.filter_var.set("")
+        self.model.set_filter("")
+        self.model.sort(self.sort_column, self.sort_reverse)
+        self.update_headings()
+        self.follow_cursor()
+        self.update_status_counts()
+        self.schedule_preview()
+
+    def change_directory(self, path):
+        """Navigate the active tab to path, remembering where it was"""
+        if os.path.normpath(path) != os.path.normpath(self.current_path) or self.search_query is not None:
+            self.history.append(self.current_path)
+            self.future = []
+        self.current_path = path
+        self.populate_file_list()
+
+    def history_back(self):
+        if not self.history:
+            return
+        self.future.append(self.current_path)
+        self.current_path = self.history.pop()
+        self.populate_file_list()
+
+    def history_forward(self):
+        if not self.future:
+            return
+        self.history.append(self.current_path)
+        self.current_path = self.future.pop()
+        self.populate_file_list()
+
+    def on_drag_motion(self, event):
+        """Start dragging the selection once the pointer has moved far enough"""
+        if self.drag_start is None or not self.selected_names - {'..'}:
+            return
+        if not self.dragging:
+            x, y = self.drag_start
+            if abs(event.x - x) < DRAG_THRESHOLD and abs(event.y - y) < DRAG_THRESHOLD:
+                return
+            self.dragging = True
+            self.tree.config(cursor="hand2")
+        widget = self.winfo_containing(event.x_root, event.y_root)
+        target = self.drop_target(event) if widget is self.tab_bar else None
+        self.status_var.set(f"Drop on a tab to copy {len(self.get_selected_paths())} item(s) there "
+                            f"(Shift to move)" if target is None else f"Drop to copy into {target}")
+
+    def on_drag_release(self, event):
+        pending = self.drag_start
+        self.drag_start = None
+        if not self.dragging:
+            # A plain click on a row of a multi-selection selects just that row on release
+            if pending is not None and len(pending) == 3:
+                self.select_position(pending[2])
+            return
+        self.dragging = False
+        self.tree.config(cursor="")
+        self.update_status_counts()
+        if self.winfo_containing(event.x_root, event.y_root) is not self.tab_bar:
+            return
+        destination = self.drop_target(event)
+        if destination is not None:
+            self.transfer_paths(self.get_selected_paths(), destination, move=bool(event.state & 0x0001))
 
-    def create_path_entry(self):
-        path_frame = ttk.Frame(self.main_frame)
-        path_frame.pack(side=tk.TOP, fill=tk.X, pady=5)
-        
-        path_label = ttk.Label(path_frame, text="Path:")
-        path_label.pack(side=tk.LEFT, padx=(0, 5))
-        
-        self.path_var = tk.StringVar(value=self.current_path)
-        self.path_entry = ttk.Entry(path_frame, textvariable=self.path_var)
-        self.path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        self.path_entry.bind("<Return>", self.navigate_to_path)
-        
-        go_btn = ttk.Button(path_frame, text="Go", command=self.navigate_to_path)
-        go_btn.pack(side=tk.LEFT, padx=(5, 0))
+    def drop_target(self, event):
+        """Directory of the tab under the pointer, or None for the active tab or no tab"""
+        x = event.x_root - self.tab_bar.winfo_rootx()
+        y = event.y_root - self.tab_bar.winfo_rooty()
+        try:
+            page = self.tab_pages()[self.tab_bar.index(f"@{x},{y}")]
+        except (tk.TclError, IndexError):
+            return None
+        if page == self.active_pane:
+            return None
+        return self.panes[page]['current_path']
 
     def create_file_browser(self):
-        browser_frame = ttk.Frame(self.main_frame)
-        browser_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        # File list on the left, preview pane on the right
+        panes = ttk.PanedWindow(self.main_frame, orient=tk.HORIZONTAL)
+        panes.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        browser_frame = ttk.Frame(panes)
+        panes.add(browser_frame, weight=3)
+        self.create_preview_pane(panes)
         
         # Create Treeview
         columns = ('name', 'size', 'type', 'modified')
-        self.tree = ttk.Treeview(browser_frame, columns=columns, show='headings')
+        # Selection is tracked by name in the model, so Tk's own selection handling is off
+        self.tree = ttk.Treeview(browser_frame, columns=columns, show='headings', selectmode='none')
         
-        # Define headings
-        self.tree.heading('name', text='Name')
-        self.tree.heading('size', text='Size')
-        self.tree.heading('type', text='Type')
-        self.tree.heading('modified', text='Modified')
+        # Define headings (clicking one sorts by it, clicking again reverses)
+        for column in SORT_COLUMNS:
+            self.tree.heading(column, command=lambda c=column: self.sort_by(c))
+        self.update_headings()
         
         # Define columns
         self.tree.column('name', width=300)
@@ -92,14 +4660,14 @@ class FileManager(tk.Tk):
         self.tree.column('type', width=100)
         self.tree.column('modified', width=150)
         
-        # Add scrollbars
-        vsb = ttk.Scrollbar(browser_frame, orient="vertical", command=self.tree.yview)
+        # Add scrollbars (the vertical one scrolls through the model, not the widget)
+        self.vsb = ttk.Scrollbar(browser_frame, orient="vertical", command=self.on_virtual_scroll)
         hsb = ttk.Scrollbar(browser_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+        self.tree.configure(xscrollcommand=hsb.set)
         
         # Grid layout
         self.tree.grid(column=0, row=0, sticky='nsew')
-        vsb.grid(column=1, row=0, sticky='ns')
+        self.vsb.grid(column=1, row=0, sticky='ns')
         hsb.grid(column=0, row=1, sticky='ew')
         
         browser_frame.grid_columnconfigure(0, weight=1)
@@ -107,6 +4675,135 @@ class FileManager(tk.Tk):
         
         # Bind double-click event
         self.tree.bind("<Double-1>", self.on_item_double_click)
+        
+        # Virtual list bindings
+        self.tree.bind("<Configure>", self.on_tree_configure)
+        self.tree.bind("<Button-1>", self.on_tree_click)
+        self.tree.bind("<B1-Motion>", self.on_drag_motion)
+        self.tree.bind("<ButtonRelease-1>", self.on_drag_release)
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_view(-WHEEL_SCROLL_ROWS))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_view(WHEEL_SCROLL_ROWS))
+        self.tree.bind("<Control-Button-1>", lambda e: self.on_tree_click(e, mode='toggle'))
+        self.tree.bind("<Shift-Button-1>", lambda e: self.on_tree_click(e, mode='extend'))
+        self.tree.bind("<Up>", lambda e: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self.move_selection(1))
+        self.tree.bind("<Shift-Up>", lambda e: self.move_selection(-1, mode='extend'))
+        self.tree.bind("<Shift-Down>", lambda e: self.move_selection(1, mode='extend'))
+        self.tree.bind("<Control-a>", lambda e: self.select_all())
+        self.tree.bind("<Control-c>", lambda e: self.copy_selected())
+        self.tree.bind("<Control-x>", lambda e: self.cut_selected())
+        self.tree.bind("<Control-v>", lambda e: self.paste_item())
+        self.tree.bind("<Delete>", lambda e: self.delete_selected())
+        self.tree.bind("<Shift-Delete>", lambda e: self.delete_selected(permanent=True))
+        self.tree.bind("<Control-z>", lambda e: self.undo_trash())
+        self.tree.bind("<Prior>", lambda e: self.move_selection(-self.view_rows))
+        self.tree.bind("<Next>", lambda e: self.move_selection(self.view_rows))
+        self.tree.bind("<Home>", lambda e: self.move_selection(-self.display_count()))
+        self.tree.bind("<End>", lambda e: self.move_selection(self.display_count()))
+        self.tree.bind("<Return>", lambda e: self.open_selected())
+        self.bind("<Control-f>", lambda e: self.search_entry.focus_set())
+
+    def create_preview_pane(self, panes):
+        self.preview_loader = PreviewLoader()
+        self.preview_images = OrderedDict()  # (path, mtime) -> tk.PhotoImage
+        self.preview_after_id = None
+        self.preview_key = None
+        
+        preview_frame = ttk.Frame(panes, padding=5)
+        panes.add(preview_frame, weight=1)
+        self.preview_title_var = tk.StringVar()
+        ttk.Label(preview_frame, textvariable=self.preview_title_var, font=('TkDefaultFont', 10, 'bold'),
+                  anchor=tk.W).pack(side=tk.TOP, fill=tk.X)
+        self.preview_image_label = ttk.Label(preview_frame, anchor=tk.CENTER)
+        self.preview_text = tk.Text(preview_frame, wrap=tk.NONE, font=('Courier', 9), width=40,
+                                    state=tk.DISABLED)
+
+    def schedule_preview(self):
+        """Preview the cursor row once it has stayed put for a moment"""
+        if self.preview_after_id is not None:
+            self.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.after(PREVIEW_DEBOUNCE_MS, self.update_preview)
+
+    def update_preview(self):
+        self.preview_after_id = None
+        self.preview_key = None
+        position = self.selected_position
+        if position is None or self.selected_name in (None, '..') or position >= self.display_count():
+            self.show_preview(None, None)
+            return
+        
+        # Size and mtime come from the model, so nothing here touches the disk
+        name, is_dir, size, mtime = self.display_row(position)
+        path = os.path.join(self.current_path, name)
+        self.preview_title_var.set(os.path.basename(name))
+        if is_dir:
+            self.show_preview(None, ('message', "Folder"))
+            return
+        
+        if split_archive_path(path) is not None:
+            self.show_preview(None, ('message', f"{self.get_size_format(size)} in archive"))
+            return
+        
+        key = (path, mtime)
+        self.preview_key = key
+        preview = self.preview_loader.get(path, mtime)
+        if preview is not None:
+            self.show_preview(key, preview)
+            return
+        self.show_preview(None, ('message', "Loading preview..."))
+        future = self.preview_loader.request(path, mtime, size)
+        self.after(PREVIEW_POLL_MS, self.poll_preview, key, future)
+
+    def poll_preview(self, key, future):
+        if key != self.preview_key:
+            return
+        if not future.done():
+            self.after(PREVIEW_POLL_MS, self.poll_preview, key, future)
+            return
+        self.show_preview(key, future.result())
+
+    def show_preview(self, key, preview):
+        self.preview_image_label.pack_forget()
+        self.preview_text.pack_forget()
+        if preview is None:
+            self.preview_key = None
+            self.preview_title_var.set("")
+            return
+        
+        kind, content = preview
+        if kind == 'image':
+            image = self.preview_image(key, content)
+            if image is not None:
+                self.preview_image_label.config(image=image)
+                self.preview_image_label.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+                return
+            kind, content = 'message', "Could not display this image"
+        
+        self.preview_text.config(state=tk.NORMAL)
+        self.preview_text.delete('1.0', tk.END)
+        self.preview_text.insert('1.0', content)
+        self.preview_text.config(state=tk.DISABLED)
+        self.preview_text.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+    def preview_image(self, key, image_path):
+        """Return a Tk image for a thumbnail, keeping recently shown ones decoded"""
+        image = self.preview_images.get(key)
+        if image is not None:
+            self.preview_images.move_to_end(key)
+            return image
+        try:
+            image = tk.PhotoImage(file=image_path)
+        except tk.TclError:
+            return None
+        # Only originals shown without Pillow can be larger than a thumbnail
+        factor = -(-max(image.width(), image.height()) // THUMBNAIL_SIZE)
+        if factor > 1:
+            image = image.subsample(factor)
+        self.preview_images[key] = image
+        while len(self.preview_images) > PREVIEW_IMAGE_CACHE_SIZE:
+            self.preview_images.popitem(last=False)
+        return image
 
     def create_context_menu(self):
         self.context_menu = tk.Menu(self, tearoff=0)
@@ -115,106 +4812,502 @@ class FileManager(tk.Tk):
         self.context_menu.add_command(label="Cut", command=self.cut_selected)
         self.context_menu.add_command(label="Paste", command=self.paste_item)
         self.context_menu.add_separator()
-        self.context_menu.add_command(label="Delete", command=self.delete_selected)
+        self.context_menu.add_command(label="Move to Trash", command=self.delete_selected)
+        self.context_menu.add_command(label="Delete Permanently",
+                                      command=lambda: self.delete_selected(permanent=True))
         self.context_menu.add_command(label="Rename", command=self.rename_selected)
+        self.context_menu.add_command(label="Rename with Pattern...", command=self.rename_with_pattern)
+        self.context_menu.add_separator()
+        self.context_menu.add_command(label="Extract Here", command=self.extract_selected)
+        self.context_menu.add_command(label="Extract To...", command=lambda: self.extract_selected(ask=True))
+        self.context_menu.add_separator()
+        self.context_menu.add_command(label="Select All", command=self.select_all)
         self.context_menu.add_separator()
         self.context_menu.add_command(label="Properties", command=self.show_properties)
         
         self.tree.bind("<Button-3>", self.show_context_menu)
         
         # Clipboard variable for copy/cut operations
-        self.clipboard = {"action": None, "path": None}
+        self.clipboard = {"action": None, "paths": []}
 
-    def populate_file_list(self):
-        # Clear the treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def populate_file_list(self, use_cache=True):
+        """Show the current directory from the cache, or start loading it in the background"""
+        # Cancel a listing that is still streaming in for the previous directory
+        if self.load_cancel is not None:
+            self.load_cancel.set()
+            self.load_cancel = None
+            if self.listing_cache.peek(self.load_path) is None:
+                self.watcher.unwatch(self.load_path)
+        self.load_generation += 1
+        generation = self.load_generation
+        
+        self.view_top = 0
+        self.selected_name = None
+        self.selected_position = None
+        self.selected_names = set()
+        self.anchor_position = None
+        self.search_query = None
+        self.filter_var.set("")
+        self.schedule_preview()
+        
+        # Show a parent directory entry if not at root
+        self.has_parent_row = os.path.dirname(self.current_path) != self.current_path
+        self.path_var.set(self.current_path)
+        self.update_tab_title()
         
+        path = os.path.normpath(self.current_path)
+        cached = self.listing_cache.get(path) if use_cache else None
+        if cached is not None:
+            self.model = cached
+            cached.set_filter("")
+            cached.sort(self.sort_column, self.sort_reverse)
+            self.render_view()
+            self.update_status_counts()
+            return
+        
+        # Start from an empty model; the view keeps its pool of row items
+        self.model = ListingModel(self.sort_column, self.sort_reverse)
+        self.render_view()
+        self.status_var.set("Loading...")
+        
+        # Watch before reading so changes made during the scan are not lost
+        cancel = threading.Event()
+        results = queue.Queue()
+        self.load_cancel = cancel
+        self.load_path = path
+        self.load_pending_changes = set()
+        try:
+            self.load_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self.load_mtime = None
+        self.watcher.watch(path)
+        
+        worker = threading.Thread(target=self.load_directory_worker, args=(self.current_path, results, cancel))
+        worker.daemon = True
+        worker.start()
+        self.after(LOAD_POLL_MS, self.poll_directory_load, generation, results)
+
+    def load_directory_worker(self, path, results, cancel):
+        """Enumerate path off the UI thread and hand entries back in batches"""
         try:
-            # Get and sort directories and files
-            items = os.listdir(self.current_path)
-            dirs = []
-            files = []
+            listing = self.core.read_directory(path, lambda batch: results.put(("batch", batch)), cancel)
+            if listing is not None:
+                results.put(("done", listing[1]))
+        except Exception as e:
+            results.put(("error", e))
+
+    def poll_directory_load(self, generation, results):
+        """Insert the batches the worker has produced so far"""
+        if generation != self.load_generation:
+            return  # Navigated elsewhere; this listing was cancelled
+        
+        deadline = time.perf_counter() + LOAD_FRAME_BUDGET
+        received = False
+        while time.perf_counter() < deadline:
+            try:
+                kind, payload = results.get_nowait()
+            except queue.Empty:
+                break
             
-            for item in items:
-                item_path = os.path.join(self.current_path, item)
-                if os.path.isdir(item_path):
-                    dirs.append(item)
-                else:
-                    files.append(item)
-            
-            # Sort alphabetically
-            dirs.sort(key=str.lower)
-            files.sort(key=str.lower)
-            
-            # Add parent directory entry if not at root
-            if os.path.dirname(self.current_path) != self.current_path:
-                self.tree.insert('', 'end', values=('..', '', 'Directory', ''), tags=('directory',))
-            
-            # Add directories
-            for directory in dirs:
-                full_path = os.path.join(self.current_path, directory)
-                modified_time = self.get_modified_time(full_path)
-                self.tree.insert('', 'end', values=(directory, '', 'Directory', modified_time), tags=('directory',))
-            
-            # Add files
-            for file in files:
-                full_path = os.path.join(self.current_path, file)
-                size = self.get_size_format(os.path.getsize(full_path))
-                file_type = self.get_file_type(file)
-                modified_time = self.get_modified_time(full_path)
-                self.tree.insert('', 'end', values=(file, size, file_type, modified_time), tags=('file',))
-            
-            # Update path entry and status bar
-            self.path_var.set(self.current_path)
-            item_count = len(dirs) + len(files)
-            self.status_var.set(f"{item_count} items | {len(dirs)} directories, {len(files)} files")
+            if kind == "error":
+                self.load_cancel = None
+                self.watcher.unwatch(self.load_path)
+                messagebox.showerror("Error", f"Could not access directory: {str(payload)}")
+                self.go_back()
+                return
             
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not access directory: {str(e)}")
-            self.go_back()
+            if kind == "done":
+                self.finish_directory_load(payload)
+                return
+            
+            self.model.append_batch(payload)
+            received = True
+        
+        # Only the rows inside the viewport are touched, however many arrived
+        if received:
+            self.render_view()
+        self.status_var.set(f"Loading {len(self.model)} items...")
+        self.after(LOAD_POLL_MS, self.poll_directory_load, generation, results)
+
+    def finish_directory_load(self, orders):
+        """Switch the model to the sorted order the worker computed"""
+        self.load_cancel = None
+        self.model.set_orders(orders)
+        
+        # Catch up with changes reported while the directory was being read
+        for name in self.load_pending_changes:
+            self.core.patch_entry(self.model, self.load_path, name)
+        self.load_pending_changes = set()
+        self.listing_cache.put(self.load_path, self.model, self.load_mtime)
+        
+        # Positions changed with the new order; follow the selected name if there is one
+        self.follow_cursor()
+        self.update_status_counts()
+
+    def run_search(self, query=None):
+        """Stream index matches under the current directory into the list"""
+        query = (query if query is not None else self.search_var.get()).strip()
+        if not query:
+            self.clear_search()
+            return
+        
+        if self.load_cancel is not None:
+            self.load_cancel.set()
+        self.load_generation += 1
+        generation = self.load_generation
+        cancel = threading.Event()
+        self.load_cancel = cancel
+        self.load_path = None
+        
+        # Result names are relative to the current directory, so the usual path joins still work
+        self.search_query = query
+        self.filter_var.set("")
+        self.model = ListingModel(self.sort_column, self.sort_reverse)
+        self.has_parent_row = False
+        self.view_top = 0
+        self.selected_name = None
+        self.selected_position = None
+        self.selected_names = set()
+        self.anchor_position = None
+        self.render_view()
+        self.schedule_preview()
+        self.update_tab_title()
+        self.status_var.set(f"Searching for '{query}'...")
+        
+        results = queue.Queue()
+        worker = threading.Thread(target=self.search_worker, args=(query, self.current_path, results, cancel))
+        worker.daemon = True
+        worker.start()
+        self.after(LOAD_POLL_MS, self.poll_search_results, generation, results)
+
+    def search_worker(self, query, under, results, cancel):
+        try:
+            base = os.path.normpath(under)
+            for batch in self.filename_index.search(query, under=base, cancel=cancel):
+                results.put(("batch", [(os.path.relpath(path, base), is_dir, size, mtime)
+                                       for path, is_dir, size, mtime in batch]))
+            results.put(("done", None))
+        except sqlite3.Error as e:
+            results.put(("error", e))
+
+    def poll_search_results(self, generation, results):
+        if generation != self.load_generation:
+            return
+        
+        received = False
+        finished = False
+        while True:
+            try:
+                kind, payload = results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "error":
+                self.load_cancel = None
+                messagebox.showerror("Error", f"Search failed: {str(payload)}")
+                return
+            if kind == "done":
+                finished = True
+                break
+            self.model.append_batch(payload)
+            received = True
+        
+        if received:
+            self.render_view()
+        count = len(self.model)
+        if not finished:
+            self.status_var.set(f"Searching for '{self.search_query}'... {count:,} matches")
+            self.after(LOAD_POLL_MS, self.poll_search_results, generation, results)
+            return
+        
+        self.load_cancel = None
+        self.model.apply_view()
+        self.render_view()
+        status = f"{count:,} matches for '{self.search_query}'"
+        if count >= SEARCH_RESULT_LIMIT:
+            status += " (limit reached)"
+        index = self.filename_index
+        if index.status != "ready":
+            status += f" | index {index.status}: {index.indexed_dirs:,} folders so far"
+        self.status_var.set(status)
+
+    def clear_search(self):
+        """Leave search results and show the current directory again"""
+        self.search_var.set("")
+        if self.search_query is not None:
+            self.populate_file_list()
+
+    def update_status_counts(self):
+        """Show the item counts of the current listing in the status bar"""
+        item_count = self.model.total_count()
+        dir_count = self.model.dir_count()
+        file_count = item_count - dir_count
+        status = f"{item_count} items | {dir_count} directories, {file_count} files"
+        if self.model.filter_text:
+            status = f"{len(self.model)} of " + status
+        self.status_var.set(status)
+
+    def update_headings(self):
+        """Label the columns, marking the one the list is sorted by"""
+        titles = {'name': 'Name', 'size': 'Size', 'type': 'Type', 'modified': 'Modified'}
+        for column in SORT_COLUMNS:
+            text = titles[column]
+            if column == self.sort_column:
+                text += " \u25bc" if self.sort_reverse else " \u25b2"
+            self.tree.heading(column, text=text)
+
+    def sort_by(self, column):
+        """Sort the listing by a column; the same column again reverses it"""
+        if column == self.sort_column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        self.model.sort(self.sort_column, self.sort_reverse)
+        self.update_headings()
+        self.follow_cursor()
+
+    def apply_filter(self):
+        """Narrow the listing to names containing the filter text"""
+        self.model.set_filter(self.filter_var.get())
+        self.follow_cursor()
+        if self.load_cancel is None:
+            self.update_status_counts()
+
+    def follow_cursor(self):
+        """Re-find the cursor row after the display order changed, keeping it in view"""
+        self.selected_position = None
+        if self.selected_name == '..':
+            self.selected_position = 0
+        elif self.selected_name is not None:
+            position = self.model.position_of(self.selected_name)
+            if position is not None:
+                self.selected_position = position + (1 if self.has_parent_row else 0)
+        if self.selected_position is None:
+            self.view_top = 0
+        elif not self.view_top <= self.selected_position < self.view_top + self.view_rows:
+            self.view_top = max(0, self.selected_position - self.view_rows // 2)
+        self.render_view()
+
+    def poll_directory_changes(self):
+        """Patch cached listings with the changes the watcher has seen"""
+        for path, names in self.core.collect_changes().items():
+            self.apply_directory_changes(path, names)
+        self.after(WATCH_POLL_MS, self.poll_directory_changes)
+
+    def apply_directory_changes(self, path, names):
+        is_current = path == os.path.normpath(self.current_path) and self.search_query is None
+        
+        # A listing still streaming in gets the changes once it is complete
+        if self.load_cancel is not None and path == self.load_path:
+            if names is not None:
+                self.load_pending_changes.update(names)
+            return
+        
+        was_cached = self.listing_cache.peek(path) is not None
+        model = self.core.patch_listing(path, names)
+        if model is None:
+            # Too much changed to patch; read the directory again
+            if was_cached and is_current:
+                self.populate_file_list()
+            return
+        
+        if is_current and model is self.model:
+            # Only the changed rows move; the view re-renders its visible slots
+            self.selected_names = {name for name in self.selected_names
+                                   if name == '..' or model.find(name) is not None}
+            if self.selected_name is not None and self.selected_name != '..':
+                position = model.position_of(self.selected_name)
+                if position is None:
+                    self.selected_name = None
+                    self.selected_position = None
+                else:
+                    self.selected_position = position + (1 if self.has_parent_row else 0)
+            self.render_view()
+            self.update_status_counts()
+
+    def display_count(self):
+        """Number of rows in the list, including the '..' entry"""
+        return len(self.model) + (1 if self.has_parent_row else 0)
+
+    def display_row(self, position):
+        """Return (name, is_dir, size, mtime) for a row of the list"""
+        if self.has_parent_row:
+            if position == 0:
+                return '..', True, None, None
+            position -= 1
+        return self.model.row(position)
+
+    def format_row(self, name, is_dir, size, mtime):
+        """Build the Treeview values for one row"""
+        modified_time = self.format_timestamp(mtime) if mtime is not None else ''
+        if is_dir:
+            return (name, '', 'Directory', modified_time)
+        return (name, self.get_size_format(size), self.get_file_type(name), modified_time)
+
+    def render_view(self):
+        """Show the rows inside the viewport, reusing a fixed pool of Treeview items"""
+        total = self.display_count()
+        self.view_top = max(0, min(self.view_top, total - self.view_rows))
+        visible = min(self.view_rows, total - self.view_top)
+        
+        # Grow or shrink the item pool to the viewport size
+        while len(self.view_pool) < visible:
+            self.view_pool.append(self.tree.insert('', 'end'))
+        if len(self.view_pool) > visible:
+            self.tree.delete(*self.view_pool[visible:])
+            del self.view_pool[visible:]
+        
+        selected = []
+        for slot, iid in enumerate(self.view_pool):
+            position = self.view_top + slot
+            name, is_dir, size, mtime = self.display_row(position)
+            tag = 'directory' if is_dir else 'file'
+            self.tree.item(iid, values=self.format_row(name, is_dir, size, mtime), tags=(tag,))
+            if name in self.selected_names:
+                selected.append(iid)
+        self.tree.selection_set(selected)
+        
+        if total:
+            self.vsb.set(self.view_top / total, (self.view_top + visible) / total)
+        else:
+            self.vsb.set(0, 1)
+
+    def on_tree_configure(self, event):
+        """Resize the row pool to the number of rows that fit in the widget"""
+        row_height = 20
+        header_height = 25
+        if self.view_pool:
+            bbox = self.tree.bbox(self.view_pool[0])
+            if bbox:
+                header_height, row_height = bbox[1], bbox[3]
+        rows = max(1, (event.height - header_height) // max(1, row_height))
+        if rows != self.view_rows:
+            self.view_rows = rows
+            self.render_view()
+
+    def on_virtual_scroll(self, *args):
+        """Scrollbar command: move the viewport through the model"""
+        if args[0] == 'moveto':
+            self.view_top = int(float(args[1]) * self.display_count())
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.view_rows
+            self.view_top += amount
+        self.render_view()
+
+    def scroll_view(self, rows):
+        self.view_top += rows
+        self.render_view()
+        return "break"
+
+    def on_mouse_wheel(self, event):
+        return self.scroll_view(-WHEEL_SCROLL_ROWS if event.delta > 0 else WHEEL_SCROLL_ROWS)
+
+    def position_at(self, y):
+        """Map a y coordinate in the Treeview to a row of the list"""
+        iid = self.tree.identify_row(y)
+        if iid in self.view_pool:
+            return self.view_top + self.view_pool.index(iid)
+        return None
+
+    def select_position(self, position, mode='replace'):
+        """Move the cursor to a row and scroll it into view
+
+        mode 'replace' selects only that row, 'toggle' adds or removes it
+        (Ctrl+click), and 'extend' selects the range from the anchor row.
+        """
+        total = self.display_count()
+        if not total:
+            return
+        position = max(0, min(position, total - 1))
+        name = self.display_row(position)[0]
+        self.selected_position = position
+        self.selected_name = name
+        
+        if mode == 'toggle':
+            if name in self.selected_names:
+                self.selected_names.discard(name)
+            else:
+                self.selected_names.add(name)
+            self.anchor_position = position
+        elif mode == 'extend' and self.anchor_position is not None:
+            low, high = min(self.anchor_position, position), max(self.anchor_position, position)
+            high = min(high, total - 1)
+            self.selected_names = {self.display_row(p)[0] for p in range(low, high + 1)}
+        else:
+            self.selected_names = {name}
+            self.anchor_position = position
+        
+        if position < self.view_top:
+            self.view_top = position
+        elif position >= self.view_top + self.view_rows:
+            self.view_top = position - self.view_rows + 1
+        self.render_view()
+        self.schedule_preview()
+
+    def on_tree_click(self, event, mode='replace'):
+        position = self.position_at(event.y)
+        self.drag_start = (event.x, event.y)
+        if (mode == 'replace' and position is not None and len(self.selected_names) > 1
+                and self.display_row(position)[0] in self.selected_names):
+            # Might be the start of a drag of the whole selection; decide on release
+            self.drag_start = (event.x, event.y, position)
+            self.tree.focus_set()
+            return "break"
+        if position is None:
+            if mode == 'replace':
+                self.selected_name = None
+                self.selected_position = None
+                self.selected_names = set()
+                self.render_view()
+        else:
+            self.select_position(position, mode)
+        if mode != 'replace':
+            self.tree.focus_set()
+            return "break"
+
+    def move_selection(self, delta, mode='replace'):
+        if self.selected_position is None:
+            self.select_position(self.view_top, mode)
+        else:
+            self.select_position(self.selected_position + delta, mode)
+        return "break"
+
+    def select_all(self):
+        """Select every entry of the current directory"""
+        self.selected_names = {self.model.names[index] for index in self.model.order}
+        self.render_view()
+        self.status_var.set(f"{len(self.selected_names)} items selected")
+        return "break"
 
     def get_size_format(self, size_bytes):
         """Convert size in bytes to human-readable format"""
-        if size_bytes < 1024:
-            return f"{size_bytes} B"
-        elif size_bytes < 1024 ** 2:
-            return f"{size_bytes / 1024:.1f} KB"
-        elif size_bytes < 1024 ** 3:
-            return f"{size_bytes / (1024 ** 2):.1f} MB"
-        else:
-            return f"{size_bytes / (1024 ** 3):.1f} GB"
+        return format_size(size_bytes)
 
     def get_file_type(self, filename):
         """Get file type from extension"""
-        extension = os.path.splitext(filename)[1]
-        if not extension:
-            return "File"
-        return extension[1:].upper() + " File"
+        return format_file_type(os.path.splitext(filename)[1])
 
     def get_modified_time(self, path):
         """Get last modified time of a file or directory"""
         try:
-            mtime = os.path.getmtime(path)
-            return self.format_timestamp(mtime)
+            return self.format_timestamp(os.stat(path).st_mtime)
         except:
             return ""
 
     def format_timestamp(self, timestamp):
         """Format timestamp to human-readable format"""
-        import datetime
-        dt = datetime.datetime.fromtimestamp(timestamp)
-        return dt.strftime("%Y-%m-%d %H:%M:%S")
+        # Floor to the second shown, so the cache keys on what is displayed
+        return format_seconds(int(timestamp // 1))
 
     def on_item_double_click(self, event):
         """Handle double-click on an item"""
-        selected_item = self.tree.selection()[0]
-        item_values = self.tree.item(selected_item, 'values')
-        
-        if not item_values:
+        position = self.position_at(event.y)
+        if position is None:
             return
         
-        item_name = item_values[0]
+        item_name = self.display_row(position)[0]
         
         # Handle parent directory (..)
         if item_name == '..':
@@ -223,16 +5316,18 @@ class FileManager(tk.Tk):
         
         item_path = os.path.join(self.current_path, item_name)
         
-        if os.path.isdir(item_path):
-            # It's a directory, navigate into it
-            self.current_path = item_path
-            self.populate_file_list()
+        if self.core.is_directory(item_path):
+            # It's a directory or an archive, navigate into it
+            self.change_directory(item_path)
         else:
             # It's a file, try to open it
             self.open_file(item_path)
 
     def open_file(self, file_path):
         """Open a file with the default application"""
+        if split_archive_path(file_path) is not None:
+            self.open_archive_member(file_path)
+            return
         try:
             import platform
             import subprocess
@@ -246,34 +5341,103 @@ class FileManager(tk.Tk):
         except Exception as e:
             messagebox.showerror("Error", f"Could not open file: {str(e)}")
 
+    def open_archive_member(self, path):
+        """Stream one archive member to a temporary file in the background, then open it"""
+        self.status_var.set(f"Extracting {os.path.basename(path)}...")
+        result = queue.Queue()
+        
+        def worker():
+            try:
+                result.put(self.core.extract_to_temp(path))
+            except Exception as e:
+                result.put(e)
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        self.after(LOAD_POLL_MS, self.poll_archive_member, result)
+
+    def poll_archive_member(self, result):
+        try:
+            temp_path = result.get_nowait()
+        except queue.Empty:
+            self.after(LOAD_POLL_MS, self.poll_archive_member, result)
+            return
+        if isinstance(temp_path, Exception):
+            messagebox.showerror("Error", f"Could not extract file: {str(temp_path)}")
+            return
+        self.update_status_counts()
+        self.open_file(temp_path)
+
+    def check_writable(self, path=None):
+        """False, after saying why, if path (by default the current folder) is inside an archive"""
+        if split_archive_path(path or self.current_path) is None:
+            return True
+        messagebox.showinfo("Info", "Archives are read-only. Copy items out of them or use Extract.")
+        return False
+
+    def extract_selected(self, ask=False):
+        """Extract the selected archives, or the selected members of the open archive, in the background"""
+        selected_paths = self.get_selected_paths()
+        inside = split_archive_path(self.current_path) is not None
+        archives = selected_paths if inside else [path for path in selected_paths if archive_kind(path)
+                                                  and os.path.isfile(path)]
+        if not archives:
+            messagebox.showinfo("Info", "Select archives to extract")
+            return
+        
+        if ask or inside:
+            start = split_archive_path(self.current_path)[0] if inside else self.current_path
+            destination = filedialog.askdirectory(title="Extract To", initialdir=os.path.dirname(start))
+            if not destination:
+                return
+        else:
+            destination = self.current_path
+        
+        if inside:
+            self.core.extract(archives, destination)
+        else:
+            # Each archive gets a folder of its own, named after it
+            targets = [os.path.join(destination, archive_stem(os.path.basename(path))) for path in archives]
+            existing = [os.path.basename(target) for target in targets if os.path.lexists(target)]
+            if existing and not messagebox.askyesno(
+                    "Confirm", f"{', '.join(existing[:5])} already exist(s). Extract into it anyway?"):
+                return
+            for path, target in zip(archives, targets):
+                self.core.extract([path], target)
+        self.watch_batch_queue()
+
     def go_back(self):
         """Navigate to the parent directory"""
         parent_dir = os.path.dirname(self.current_path)
         if parent_dir != self.current_path:  # Not at root
-            self.current_path = parent_dir
-            self.populate_file_list()
+            self.change_directory(parent_dir)
 
     def go_home(self):
         """Navigate to the home directory"""
-        self.current_path = os.path.expanduser("~")
-        self.populate_file_list()
+        self.change_directory(os.path.expanduser("~"))
 
     def refresh(self):
         """Refresh the current directory"""
-        self.populate_file_list()
+        if self.search_query is not None:
+            self.run_search(self.search_query)
+            return
+        # Watched listings are already current; anything else is read again
+        path = os.path.normpath(self.current_path)
+        self.populate_file_list(use_cache=self.watcher.is_live(path))
 
     def navigate_to_path(self, event=None):
         """Navigate to the path entered in the path entry"""
         new_path = self.path_var.get()
-        if os.path.exists(new_path) and os.path.isdir(new_path):
-            self.current_path = new_path
-            self.populate_file_list()
+        if self.core.is_directory(new_path):
+            self.change_directory(new_path)
         else:
             messagebox.showerror("Error", "Invalid directory path")
             self.path_var.set(self.current_path)
 
     def create_new_folder(self):
         """Create a new folder in the current directory"""
+        if not self.check_writable():
+            return
         folder_name = tk.simpledialog.askstring("New Folder", "Enter folder name:")
         if folder_name:
             try:
@@ -285,18 +5449,23 @@ class FileManager(tk.Tk):
 
     def show_context_menu(self, event):
         """Show context menu on right-click"""
-        # Select the item under cursor
-        item = self.tree.identify_row(event.y)
-        if item:
-            self.tree.selection_set(item)
+        # Select the item under cursor, keeping a multi-selection it belongs to
+        position = self.position_at(event.y)
+        if position is not None:
+            if self.display_row(position)[0] in self.selected_names:
+                self.selected_position = position
+                self.selected_name = self.display_row(position)[0]
+            else:
+                self.select_position(position)
         # Display context menu
         self.context_menu.post(event.x_root, event.y_root)
 
     def get_selected_path(self):
         """Get the full path of the selected item"""
         try:
-            selected_item = self.tree.selection()[0]
-            item_name = self.tree.item(selected_item, 'values')[0]
+            item_name = self.selected_name
+            if item_name is None:
+                return None
             
             if item_name == '..':
                 return os.path.dirname(self.current_path)
@@ -309,90 +5478,192 @@ class FileManager(tk.Tk):
         """Open the selected item"""
         selected_path = self.get_selected_path()
         if selected_path:
-            if os.path.isdir(selected_path):
-                self.current_path = selected_path
-                self.populate_file_list()
+            if self.core.is_directory(selected_path):
+                self.change_directory(selected_path)
             else:
                 self.open_file(selected_path)
 
+    def get_selected_paths(self):
+        """Get the full paths of all selected items, in display order"""
+        names = [name for name in self.selected_names if name != '..']
+        if len(names) > 1:
+            # Display order, so pattern numbering follows what the user sees
+            positions = self.model.positions()
+            rows = {name: self.model.find(name) for name in names}
+            names = sorted((name for name in names if rows[name] in positions),
+                           key=lambda name: positions[rows[name]])
+        return [os.path.join(self.current_path, name) for name in names]
+
     def copy_selected(self):
-        """Copy the selected item to clipboard"""
-        selected_path = self.get_selected_path()
-        if selected_path:
-            self.clipboard["action"] = "copy"
-            self.clipboard["path"] = selected_path
-            self.status_var.set(f"Selected item ready to copy: {os.path.basename(selected_path)}")
+        """Copy the selected items to clipboard"""
+        selected_paths = self.get_selected_paths()
+        if selected_paths:
+            self.clipboard = {"action": "copy", "paths": selected_paths}
+            self.status_var.set(f"{len(selected_paths)} item(s) ready to copy")
 
     def cut_selected(self):
-        """Cut the selected item to clipboard"""
-        selected_path = self.get_selected_path()
-        if selected_path:
-            self.clipboard["action"] = "cut"
-            self.clipboard["path"] = selected_path
-            self.status_var.set(f"Selected item ready to move: {os.path.basename(selected_path)}")
+        """Cut the selected items to clipboard"""
+        selected_paths = self.get_selected_paths()
+        if selected_paths and self.check_writable():
+            self.clipboard = {"action": "cut", "paths": selected_paths}
+            self.status_var.set(f"{len(selected_paths)} item(s) ready to move")
 
     def paste_item(self):
-        """Paste the item from clipboard to current directory"""
-        if not self.clipboard["path"] or not self.clipboard["action"]:
+        """Paste the items from clipboard to current directory"""
+        if not self.clipboard["paths"] or not self.clipboard["action"]:
             messagebox.showinfo("Info", "Nothing to paste")
             return
-            
-        src_path = self.clipboard["path"]
-        src_name = os.path.basename(src_path)
-        dst_path = os.path.join(self.current_path, src_name)
         
-        # Check if source still exists
-        if not os.path.exists(src_path):
-            messagebox.showerror("Error", "Source item no longer exists")
-            self.clipboard = {"action": None, "path": None}
+        # Check if sources still exist
+        src_paths = [path for path in self.clipboard["paths"] if self.core.exists(path)]
+        if not src_paths:
+            messagebox.showerror("Error", "Source items no longer exist")
+            self.clipboard = {"action": None, "paths": []}
             return
-            
-        # Check for existing destination
-        if os.path.exists(dst_path):
-            overwrite = messagebox.askyesno("Confirm", f"{src_name} already exists. Overwrite?")
+        
+        move = self.clipboard["action"] == "cut"
+        if self.transfer_paths(src_paths, self.current_path, move) and move:
+            self.clipboard = {"action": None, "paths": []}
+
+    def transfer_paths(self, src_paths, destination, move=False):
+        """Copy or move paths into destination in the background; False if nothing was started"""
+        if not src_paths or not self.check_writable(destination):
+            return False
+        try:
+            items = self.core.transfer_items(src_paths, destination)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return False
+        
+        # Check for existing destinations once for the whole batch
+        existing = [os.path.basename(dst) for _, dst in items if os.path.lexists(dst)]
+        if existing:
+            names = ", ".join(existing[:5]) + (f" and {len(existing) - 5} more" if len(existing) > 5 else "")
+            overwrite = messagebox.askyesno("Confirm", f"{names} already exist(s). Overwrite?")
             if not overwrite:
-                return
+                return False
+        
+        # Items inside an archive are extracted; the archive itself stays as it is
+        if split_archive_path(src_paths[0]) is not None:
+            self.core.extract(src_paths, destination)
+            self.watch_batch_queue()
+            return True
+        
+        # Copy or move in the background with a progress window
+        label = os.path.basename(src_paths[0]) if len(src_paths) == 1 else f"{len(src_paths)} items"
+        title = f"Moving {label}" if move else f"Copying {label}"
+        job = self.core.transfer(items, move=move, description=title)
+        self.watch_batch_queue()
+        TransferDialog(self, job, title)
+        return True
+
+    def delete_selected(self, permanent=False):
+        """Move the selected items to the trash, or delete them for good"""
+        selected_paths = self.get_selected_paths()
+        if not selected_paths or not self.check_writable():
+            return
+        
+        if not permanent:
+            # Restorable (Ctrl+Z), so no confirmation
+            self.last_trash_operation = self.core.delete(selected_paths)
+            self.watch_batch_queue()
+            return
+        
+        if len(selected_paths) == 1:
+            prompt = f"Are you sure you want to permanently delete '{os.path.basename(selected_paths[0])}'?"
+        else:
+            prompt = f"Are you sure you want to permanently delete these {len(selected_paths)} items?"
+        if messagebox.askyesno("Confirm Delete", prompt):
+            self.core.delete(selected_paths, permanent=True)
+            self.watch_batch_queue()
+
+    def undo_trash(self):
+        """Restore what the last Move to Trash moved"""
+        operation = self.last_trash_operation
+        if operation is None or not self.batch_queue.is_idle() or not operation.trashed:
+            return
+        self.last_trash_operation = None
+        self.core.restore(operation)
+        self.watch_batch_queue()
+
+    def rename_with_pattern(self):
+        """Rename the selected items from a pattern such as photo_{n:03}{ext}"""
+        selected_paths = self.get_selected_paths()
+        if not selected_paths or not self.check_writable():
+            return
+        
+        pattern = tk.simpledialog.askstring(
+            "Rename with Pattern",
+            "Pattern fields: {name}, {stem}, {ext}, {n}\nExample: photo_{n:03}{ext}",
+            initialvalue="{stem}{ext}")
+        if not pattern:
+            return
         
+        renames = []
         try:
-            if self.clipboard["action"] == "copy":
-                if os.path.isdir(src_path):
-                    shutil.copytree(src_path, dst_path)
-                else:
-                    shutil.copy2(src_path, dst_path)
-                self.status_var.set(f"Copied: {src_name}")
-            elif self.clipboard["action"] == "cut":
-                shutil.move(src_path, dst_path)
-                self.status_var.set(f"Moved: {src_name}")
-                self.clipboard = {"action": None, "path": None}
-            
-            self.refresh()
-        except Exception as e:
-            messagebox.showerror("Error", f"Operation failed: {str(e)}")
+            for n, path in enumerate(selected_paths, start=1):
+                directory, name = os.path.split(path)
+                stem, ext = os.path.splitext(name)
+                new_name = pattern.format(name=name, stem=stem, ext=ext, n=n)
+                if not new_name or os.sep in new_name or new_name in ('.', '..'):
+                    raise ValueError(f"Invalid name produced: '{new_name}'")
+                if new_name != name:
+                    renames.append((directory, name, new_name))
+        except (KeyError, IndexError, ValueError) as e:
+            messagebox.showerror("Error", f"Invalid pattern: {str(e)}")
+            return
+        
+        # Refuse patterns that would make two items share a name or clobber an unselected one. Items
+        # can come from several folders (search results), and the listing may be stale, so ask the disk
+        counts = Counter((directory, new) for directory, _, new in renames)
+        renamed = {(directory, old) for directory, old, _ in renames}
+        clashes = {target for target, count in counts.items() if count > 1}
+        clashes |= {target for target in counts
+                    if target not in renamed and os.path.lexists(os.path.join(*target))}
+        if clashes:
+            names = sorted(new for _, new in clashes)
+            messagebox.showerror("Error", f"Pattern produces duplicate names: {', '.join(names[:5])}")
+            return
+        if renames:
+            self.submit_batch(RenameOperation(renames))
 
-    def delete_selected(self):
-        """Delete the selected item"""
-        selected_path = self.get_selected_path()
-        if not selected_path:
+    def submit_batch(self, operation):
+        """Queue an operation and track the queue's progress in the status bar"""
+        self.batch_queue.submit(operation)
+        self.watch_batch_queue()
+
+    def watch_batch_queue(self):
+        """Track the batch queue's progress in the status bar until it is idle"""
+        if not self.batch_polling:
+            self.batch_polling = True
+            self.after(BATCH_POLL_MS, self.poll_batch_queue)
+
+    def poll_batch_queue(self):
+        finished = self.batch_queue.take_finished()
+        if finished is None:
+            done, total = self.batch_queue.progress()
+            active = self.batch_queue.active
+            label = active.description if active else "Working"
+            self.status_var.set(f"{label}... {done:,} of {total:,} items")
+            self.after(BATCH_POLL_MS, self.poll_batch_queue)
             return
-            
-        item_name = os.path.basename(selected_path)
-        confirm = messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete '{item_name}'?")
         
-        if confirm:
-            try:
-                if os.path.isdir(selected_path):
-                    shutil.rmtree(selected_path)
-                else:
-                    os.remove(selected_path)
-                self.status_var.set(f"Deleted: {item_name}")
-                self.refresh()
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not delete item: {str(e)}")
+        # One refresh for the whole batch instead of one per item
+        self.batch_polling = False
+        self.refresh()
+        errors = [error for operation in finished if operation.report_errors for error in operation.errors]
+        if errors:
+            shown = "\n".join(errors[:10])
+            if len(errors) > 10:
+                shown += f"\n... and {len(errors) - 10} more"
+            messagebox.showerror("Error", f"Some operations failed:\n{shown}")
+        elif finished:
+            self.status_var.set(f"Finished: {', '.join(operation.description for operation in finished[:3])}")
 
     def rename_selected(self):
         """Rename the selected item"""
         selected_path = self.get_selected_path()
-        if not selected_path:
+        if not selected_path or not self.check_writable():
             return
             
         old_name = os.path.basename(selected_path)
@@ -415,48 +5686,330 @@ class FileManager(tk.Tk):
             return
             
         try:
-            name = os.path.basename(selected_path)
-            location = os.path.dirname(selected_path)
+            info = self.core.properties(selected_path)
+            name = info["name"]
+            location = info["location"]
+            is_dir = info["is_dir"]
             
-            if os.path.isdir(selected_path):
+            if is_dir:
                 type_str = "Directory"
-                size = self.get_directory_size(selected_path)
+                size_str = "Calculating..."
             else:
                 type_str = self.get_file_type(name)
-                size = os.path.getsize(selected_path)
+                size = info["size"]
+                size_str = f"{self.get_size_format(size)} ({size:,} bytes)"
                 
-            size_str = self.get_size_format(size)
-            created = self.format_timestamp(os.path.getctime(selected_path))
-            modified = self.format_timestamp(os.path.getmtime(selected_path))
-            
-            info = f"Name: {name}\n"
-            info += f"Type: {type_str}\n"
-            info += f"Location: {location}\n"
-            info += f"Size: {size_str}\n"
-            info += f"Created: {created}\n"
-            info += f"Modified: {modified}"
-            
-            messagebox.showinfo("Properties", info)
+            created = self.format_timestamp(info["created"])
+            modified = self.format_timestamp(info["modified"])
             
         except Exception as e:
             messagebox.showerror("Error", f"Could not get properties: {str(e)}")
+            return
+        
+        window = tk.Toplevel(self)
+        window.title("Properties")
+        window.resizable(False, False)
+        window.transient(self)
+        
+        frame = ttk.Frame(window, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        size_var = tk.StringVar(value=size_str)
+        contents_var = tk.StringVar()
+        rows = [("Name:", name), ("Type:", type_str), ("Location:", location), ("Size:", size_var)]
+        if is_dir:
+            rows.append(("Contains:", contents_var))
+        rows += [("Created:", created), ("Modified:", modified)]
+        
+        for row, (label, value) in enumerate(rows):
+            ttk.Label(frame, text=label).grid(row=row, column=0, sticky=tk.W, padx=(0, 10), pady=2)
+            if isinstance(value, tk.StringVar):
+                ttk.Label(frame, textvariable=value).grid(row=row, column=1, sticky=tk.W, pady=2)
+            else:
+                ttk.Label(frame, text=value).grid(row=row, column=1, sticky=tk.W, pady=2)
+        
+        ttk.Button(frame, text="Close", command=window.destroy).grid(
+            row=len(rows), column=1, sticky=tk.E, pady=(10, 0))
+        
+        if is_dir:
+            # Scan in the background and keep the dialog updated while it runs
+            progress = {}
+            cancel = threading.Event()
+            window.bind("<Destroy>", lambda e: cancel.set() if e.widget is window else None)
+            
+            worker = threading.Thread(target=self.core.directory_size, args=(selected_path, progress, cancel))
+            worker.daemon = True
+            worker.start()
+            self.after(SIZE_POLL_MS, self.poll_properties_scan, window, progress, size_var, contents_var)
+
+    def poll_properties_scan(self, window, progress, size_var, contents_var):
+        """Copy the running size scan into the Properties dialog"""
+        if not window.winfo_exists():
+            return
+        if not progress:
+            self.after(SIZE_POLL_MS, self.poll_properties_scan, window, progress, size_var, contents_var)
+            return
+        
+        size = progress["bytes"]
+        size_str = f"{self.get_size_format(size)} ({size:,} bytes)"
+        # The scanned directory itself is not one of its own folders
+        contents = f"{progress['files']:,} files, {max(0, progress['dirs'] - 1):,} folders"
+        if progress["errors"]:
+            contents += f", {progress['errors']:,} unreadable"
+        
+        if progress["done"]:
+            size_var.set(size_str)
+            contents_var.set(contents)
+            if progress["error_samples"]:
+                ttk.Label(window, text="\n".join(progress["error_samples"]), foreground="red",
+                          padding=(10, 0, 10, 10)).pack(fill=tk.X)
+        else:
+            size_var.set(f"Calculating... {size_str}")
+            contents_var.set(contents)
+            self.after(SIZE_POLL_MS, self.poll_properties_scan, window, progress, size_var, contents_var)
+
+    def show_disk_usage(self):
+        """Open the disk usage analyzer for the selected directory or the current one"""
+        selected_path = self.get_selected_path()
+        if not selected_path or not os.path.isdir(selected_path):
+            selected_path = self.current_path
+        DiskUsageView(self, os.path.normpath(selected_path))
+
+    def show_sync(self):
+        """Compare the current folder with the folder open in the next tab, if there is one"""
+        other_paths = [state['current_path'] for state in self.panes.values()
+                       if os.path.normpath(state['current_path']) != os.path.normpath(self.current_path)]
+        SyncView(self, self.current_path, other_paths[0] if other_paths else "")
+
+    def show_duplicates(self):
+        """Open the duplicate finder for the selected directory or the current one"""
+        selected_path = self.get_selected_path()
+        if not selected_path or not os.path.isdir(selected_path):
+            selected_path = self.current_path
+        DuplicatesView(self, os.path.normpath(selected_path))
+
+    def show_content_search(self):
+        """Open Find in Files for the selected directory or the current one"""
+        selected_path = self.get_selected_path()
+        if not selected_path or not os.path.isdir(selected_path):
+            selected_path = self.current_path
+        ContentSearchView(self, os.path.normpath(selected_path))
 
     def get_directory_size(self, path):
         """Get the size of a directory including all its contents"""
-        total_size = 0
-        
+        return self.core.directory_size(path)["bytes"]
+
+def legacy_listing(path):
+    """The pre-scandir listing: isdir, then getsize and getmtime per entry"""
+    rows = []
+    for name in os.listdir(path):
+        full_path = os.path.join(path, name)
+        if os.path.isdir(full_path):
+            rows.append((name, True, 0, os.path.getmtime(full_path)))
+        else:
+            rows.append((name, False, os.path.getsize(full_path), os.path.getmtime(full_path)))
+    return rows
+
+
+def count_filesystem_calls(function, *args):
+    """Run function and count stat-family calls (os.stat/os.lstat and DirEntry.stat) and directory reads"""
+    counter = {"stat": 0, "dir_reads": 0}
+    real_stat, real_lstat, real_scandir, real_listdir = os.stat, os.lstat, os.scandir, os.listdir
+
+    class CountingEntry:
+        def __init__(self, entry):
+            self.entry = entry
+            self.name = entry.name
+            self.path = entry.path
+
+        def stat(self, follow_symlinks=True):
+            counter["stat"] += 1
+            return self.entry.stat(follow_symlinks=follow_symlinks)
+
+        def __getattr__(self, name):
+            # is_dir/is_file/is_symlink answer from d_type without a syscall
+            return getattr(self.entry, name)
+
+    class CountingScandir:
+        def __init__(self, scan_path):
+            counter["dir_reads"] += 1
+            self.iterator = real_scandir(scan_path)
+
+        def __enter__(self):
+            return (CountingEntry(entry) for entry in self.iterator)
+
+        def __exit__(self, *exc):
+            self.iterator.close()
+
+    def counting_stat(*args, **kwargs):
+        counter["stat"] += 1
+        return real_stat(*args, **kwargs)
+
+    def counting_lstat(*args, **kwargs):
+        counter["stat"] += 1
+        return real_lstat(*args, **kwargs)
+
+    def counting_listdir(*args, **kwargs):
+        counter["dir_reads"] += 1
+        return real_listdir(*args, **kwargs)
+
+    os.stat, os.lstat, os.scandir, os.listdir = counting_stat, counting_lstat, CountingScandir, counting_listdir
+    try:
+        function(*args)
+    finally:
+        os.stat, os.lstat, os.scandir, os.listdir = real_stat, real_lstat, real_scandir, real_listdir
+    return counter
+
+
+def make_benchmark_tree(root, entries, shape):
+    """Fill root with entries synthetic files and folders; returns every directory in the tree
+
+    A wide tree is one directory holding everything (every tenth entry a
+    folder). A deep tree gives each directory BENCHMARK_DEEP_FILES files and
+    BENCHMARK_DEEP_FANOUT subdirectories, breadth first, until entries are made.
+    """
+    def write_file(path, i):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
         try:
-            for dirpath, dirnames, filenames in os.walk(path):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    # Skip symbolic links
-                    if not os.path.islink(fp):
-                        total_size += os.path.getsize(fp)
-        except:
-            pass
-            
-        return total_size
+            os.write(fd, b"x" * (i % BENCHMARK_FILE_BYTES))
+        finally:
+            os.close(fd)
+
+    directories = [root]
+    if shape == "wide":
+        for i in range(entries):
+            if i % 10 == 0:
+                os.mkdir(os.path.join(root, f"dir_{i:07d}"))
+                directories.append(os.path.join(root, f"dir_{i:07d}"))
+            else:
+                write_file(os.path.join(root, f"file_{i:07d}.txt"), i)
+        return directories
+    
+    made = 0
+    pending = deque([root])
+    while made < entries:
+        directory = pending.popleft()
+        for i in range(min(BENCHMARK_DEEP_FILES, entries - made)):
+            write_file(os.path.join(directory, f"file_{made:07d}.txt"), made)
+            made += 1
+        for i in range(BENCHMARK_DEEP_FANOUT):
+            if made >= entries:
+                break
+            subdir = os.path.join(directory, f"dir_{made:07d}")
+            os.mkdir(subdir)
+            directories.append(subdir)
+            pending.append(subdir)
+            made += 1
+    return directories
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_tree(core, root, entries, shape, repeat):
+    """Print listing, size-scan and copy figures for one synthetic tree"""
+    data = os.path.join(root, "data")
+    os.mkdir(data)
+    start = time.perf_counter()
+    directories = make_benchmark_tree(data, entries, shape)
+    print(f"\n{shape} tree, {entries:,} entries in {len(directories):,} directories "
+          f"(created in {time.perf_counter() - start:.1f}s)")
+    
+    # Listing: every directory of the tree read once, as a user browsing all of it would
+    def list_all(listing):
+        for directory in directories:
+            listing(directory)
+    
+    print(f"  {'listing':<10} {'ms/dir':>10} {'us/entry':>10} {'stat/entry':>11} {'dir reads':>10}")
+    for label, listing in (("listdir", legacy_listing), ("scandir", scan_directory),
+                           ("sorted", core.read_directory)):
+        elapsed = best_time(lambda: list_all(listing), repeat)
+        calls = count_filesystem_calls(list_all, listing)
+        print(f"  {label:<10} {elapsed * 1000 / len(directories):>10.3f} {elapsed * 1e6 / entries:>10.2f} "
+              f"{calls['stat'] / entries:>11.2f} {calls['dir_reads']:>10,}")
+    
+    # The cached model of the largest directory, as revisiting it costs
+    core.list_directory(data)
+    elapsed = best_time(lambda: core.list_directory(data), repeat)
+    print(f"  {'cached':<10} {elapsed * 1000:>10.3f}")
+    
+    # Size scan: cold with a fresh scanner, then warm with every directory's record cached
+    calls = count_filesystem_calls(DirectorySizeScanner().scan, data)
+    scanner = DirectorySizeScanner()
+    start = time.perf_counter()
+    progress = scanner.scan(data)
+    cold = time.perf_counter() - start
+    warm = best_time(lambda: scanner.scan(data), repeat)
+    print(f"  size scan  cold {cold:.3f}s ({progress['files'] / cold:,.0f} files/s, "
+          f"{progress['bytes'] / cold / 1e6:,.1f} MB/s, {calls['stat']:,} stat calls), warm {warm:.3f}s")
+    
+    # Copy the whole tree through the same queue and TransferJob the UI uses
+    target = os.path.join(root, "copy")
+    os.mkdir(target)
+    job = core.copy([data], target)
+    core.wait()
+    # The job's own stamps, so the queue's poll interval isn't counted
+    elapsed = job.finished - job.started
+    status = job.status if not job.errors else f"{job.status}, {len(job.errors)} errors"
+    print(f"  copy       {elapsed:.3f}s ({job.done_files / elapsed:,.0f} files/s, "
+          f"{job.done_bytes / elapsed / 1e6:,.1f} MB/s) {status}")
+
+
+def benchmark_large_copy(core, root):
+    """Print the copy rate of one large file, where per-file overhead doesn't count"""
+    source = os.path.join(root, "large.bin")
+    chunk = os.urandom(BUFFERED_COPY_CHUNK)
+    with open(source, "wb") as f:
+        for _ in range(BENCHMARK_LARGE_FILE_MB * 1024 * 1024 // len(chunk)):
+            f.write(chunk)
+    target = os.path.join(root, "copy")
+    os.mkdir(target)
+    job = core.copy([source], target)
+    core.wait()
+    elapsed = job.finished - job.started
+    print(f"\nlarge file, {BENCHMARK_LARGE_FILE_MB} MiB: copied in {elapsed:.3f}s "
+          f"({job.done_bytes / elapsed / 1e6:,.1f} MB/s) {job.status}")
+
+
+def run_benchmarks(args, repeat=3):
+    """Benchmark the headless core on synthetic trees
+
+    args are sizes (1k, 100k, 1m or a number of entries) and shapes (wide,
+    deep); the default is 1k and 100k in both shapes. Trees are made under
+    the temporary directory, so set TMPDIR to measure another filesystem.
+    """
+    sizes = []
+    shapes = []
+    for arg in args:
+        if arg in ("wide", "deep"):
+            shapes.append(arg)
+        elif arg.lower() in BENCHMARK_SIZES:
+            sizes.append(BENCHMARK_SIZES[arg.lower()])
+        else:
+            sizes.append(int(arg))
+    sizes = sizes or [BENCHMARK_SIZES["1k"], BENCHMARK_SIZES["100k"]]
+    shapes = shapes or ["wide", "deep"]
+    
+    core = FileManagerCore()
+    print(f"Python {sys.version.split()[0]}, {os.cpu_count()} CPUs, inotify {INOTIFY_AVAILABLE}, "
+          f"best of {repeat}, under {tempfile.gettempdir()}")
+    for shape in shapes:
+        for entries in sizes:
+            with tempfile.TemporaryDirectory(prefix="fm-bench-") as root:
+                benchmark_tree(core, root, entries, shape, repeat)
+    with tempfile.TemporaryDirectory(prefix="fm-bench-") as root:
+        benchmark_large_copy(core, root)
 
 if __name__ == "__main__":
-    app = FileManager()
-    app.mainloop()
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        run_benchmarks(sys.argv[2:])
+    else:
+        app = FileManager()
+        app.mainloop()
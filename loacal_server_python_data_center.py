@@ -1,12 +1,347 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template_string
+from flask import Flask, Request, Response, request, jsonify, render_template
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote
+import base64
+import bisect
+import hashlib
+import heapq
+import json
+import mimetypes
 import os
+import re
+import secrets
+import select
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import wsgiref.util
 
-app = Flask(__name__)
+# Locks resumable upload state across worker processes; Windows only has the in-process lock
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# inotify keeps the search index current with changes made outside this server; it is reached through
+# libc with ctypes, and other platforms only see the changes made through the upload and delete handlers
+try:
+    import ctypes
+    if not sys.platform.startswith('linux'):
+        raise ImportError("inotify is Linux only")
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.inotify_init1
+    INOTIFY_AVAILABLE = True
+except (ImportError, OSError, AttributeError):
+    INOTIFY_AVAILABLE = False
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+SEARCH_WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVE_SELF
 
 # Default directory to store files
 UPLOAD_FOLDER = './custom_files'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Uploads stream into a hidden folder on the same filesystem and are renamed into place when complete
+UPLOAD_TEMP_FOLDER = os.path.join(UPLOAD_FOLDER, '.uploads')
+os.makedirs(UPLOAD_TEMP_FOLDER, exist_ok=True)
+MAX_UPLOAD_SIZE = 20 * 1024 ** 3  # 20 GiB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+STALE_UPLOAD_AGE = 24 * 3600  # Seconds
+
+# Resumable uploads: a sparse file of the final size plus a JSON sidecar of the byte ranges received
+RESUMABLE_FOLDER = os.path.join(UPLOAD_TEMP_FOLDER, 'resumable')
+os.makedirs(RESUMABLE_FOLDER, exist_ok=True)
+RESUMABLE_EXPIRY = 7 * 24 * 3600  # Seconds an unfinished upload is kept
+RESUMABLE_FINISH_TIMEOUT = 30 * 60  # Seconds after which a finish that never completed (killed worker) is retried
+UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+resumable_lock = threading.Lock()
+
+# Downloads: whole files and single ranges go through wsgi.file_wrapper, which gunicorn and uWSGI send with
+# os.sendfile; the development server falls back to reading DOWNLOAD_CHUNK_SIZE blocks
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# File wrappers that read to end of file instead of stopping at the Content-Length, as PEP 3333 allows
+LENGTH_UNAWARE_FILE_WRAPPERS = (wsgiref.util.FileWrapper,)
+MAX_DOWNLOAD_RANGES = 64  # More ranges than this (after merging overlaps) are answered with the whole file
+BYTE_RANGE_PATTERN = re.compile(r'\s*(\d*)-(\d*)\s*', re.ASCII)
+
+# Filename search
+SEARCH_DEFAULT_LIMIT = 100
+SEARCH_MAX_LIMIT = 1000
+
+# Folder listings: cached per folder until its mtime changes, and served a page at a time
+BROWSE_PAGE_SIZE = 200
+BROWSE_MAX_PAGE_SIZE = 1000
+BROWSE_CACHE_SIZE = 32  # Folders
+BROWSE_RESTAT_INTERVAL = 30  # Seconds; files rewritten in place don't change their folder's mtime
+BROWSE_SORTS = ('name', 'size', 'mtime')
+# real path -> (st_ino, st_mtime_ns, digest of the entries, entries, {sort: (keys, entries)})
+listing_cache = OrderedDict()
+listing_checked = {}  # real path -> time.monotonic() of the last scan
+listing_restats = set()  # Real paths being rescanned in the background
+listing_lock = threading.Lock()
+
+class HashingFile:
+    """
+    Temporary upload file that counts and SHA-256 hashes the bytes written to it.
+    """
+    def __init__(self):
+        self.file = tempfile.NamedTemporaryFile(dir=UPLOAD_TEMP_FOLDER, prefix='upload-', delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.started = time.monotonic()
+        self.done = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        # Werkzeug also seeks and reads the stream it was given
+        return getattr(self.file, name)
+
+    def commit(self, path):
+        """
+        Move the finished upload to path in one atomic rename.
+        """
+        self.file.close()
+        os.replace(self.file.name, path)
+        self.done = True
+
+    def discard(self):
+        """
+        Remove the temporary file unless it was committed.
+        """
+        if not self.done:
+            self.file.close()
+            try:
+                os.remove(self.file.name)
+            except FileNotFoundError:
+                pass
+            self.done = True
+
+class StreamingRequest(Request):
+    """
+    Request that writes uploaded files straight to a HashingFile instead of a spooled temporary file,
+    so the body only reaches the disk once and is hashed on the way.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload = HashingFile()
+        self.__dict__.setdefault('uploads', []).append(upload)
+        return upload
+
+class SearchIndex:
+    """
+    In-memory trigram index of the names of every file and folder under root.
+    Queries of three or more characters only check the names holding all of the query's trigrams;
+    shorter ones scan the names, which still stays in memory.
+    """
+    def __init__(self, root, skip):
+        self.root = os.path.realpath(root)
+        self.skip = os.path.realpath(skip)
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.ids = {}  # relative path -> id
+        self.paths = {}  # id -> relative path
+        self.names = {}  # id -> lower-cased name
+        self.children = {'': set()}  # relative folder path -> ids of its entries
+        self.grams = {}  # trigram -> ids of the names containing it
+        self.next_id = 0
+        self.fd = None
+        self.watched = {}  # inotify watch descriptor -> relative folder path
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        if INOTIFY_AVAILABLE:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+        # Folders are watched before they are listed, so changes made during the build queue up as events
+        self.add_tree('')
+        self.ready.set()
+        app.logger.info("Search index ready: %d names", len(self.ids))
+        while self.fd is not None:
+            select.select([self.fd], [], [])
+            self.read_events()
+
+    def add_tree(self, relative_dir):
+        """
+        Index everything below relative_dir, watching each folder on the way.
+        """
+        stack = [relative_dir]
+        while stack:
+            folder = stack.pop()
+            full_path = os.path.join(self.root, folder)
+            self.watch(folder)
+            try:
+                with os.scandir(full_path) as it:
+                    entries = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+            except OSError:
+                continue
+            with self.lock:
+                for name, is_dir in entries:
+                    path = os.path.join(folder, name)
+                    if is_dir and os.path.join(self.root, path) == self.skip:
+                        continue
+                    self.insert(path)
+                    if is_dir:
+                        self.children.setdefault(path, set())
+                        stack.append(path)
+
+    def watch(self, relative_dir):
+        if self.fd is None:
+            return
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(self.root, relative_dir)), SEARCH_WATCH_MASK)
+        if wd >= 0:
+            # A folder moved within the tree keeps its watch descriptor, which now names the new path
+            self.watched[wd] = relative_dir
+
+    def insert(self, path):
+        """
+        Add path to the index; the caller holds the lock.
+        """
+        if path in self.ids:
+            return
+        parent = os.path.dirname(path)
+        if parent not in self.children:
+            self.insert(parent)
+            self.children[parent] = set()
+        name = os.path.basename(path).lower()
+        entry_id = self.next_id
+        self.next_id += 1
+        self.ids[path] = entry_id
+        self.paths[entry_id] = path
+        self.names[entry_id] = name
+        self.children[parent].add(entry_id)
+        for gram in {name[i:i + 3] for i in range(len(name) - 2)}:
+            self.grams.setdefault(gram, set()).add(entry_id)
+
+    def add(self, path):
+        """
+        Add a file and any folders above it that are not indexed yet.
+        """
+        with self.lock:
+            self.insert(os.path.normpath(path))
+
+    def remove(self, path):
+        """
+        Remove path and, for a folder, everything below it.
+        """
+        with self.lock:
+            path = os.path.normpath(path)
+            entry_id = self.ids.get(path)
+            if entry_id is None:
+                return
+            self.children[os.path.dirname(path)].discard(entry_id)
+            stack = [entry_id]
+            while stack:
+                entry_id = stack.pop()
+                path = self.paths.pop(entry_id)
+                del self.ids[path]
+                name = self.names.pop(entry_id)
+                for gram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                    ids = self.grams[gram]
+                    ids.discard(entry_id)
+                    if not ids:
+                        del self.grams[gram]
+                stack.extend(self.children.pop(path, ()))
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+            offset += 16 + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: index the whole tree again
+                self.remove_all()
+                self.add_tree('')
+                continue
+            folder = self.watched.get(wd)
+            if mask & IN_IGNORED:
+                self.watched.pop(wd, None)
+                continue
+            # Events from a folder that was moved out of the tree or not indexed yet are ignored
+            if folder is None or (folder and folder not in self.ids):
+                if mask & IN_MOVE_SELF and folder is not None:
+                    libc.inotify_rm_watch(self.fd, wd)
+                    self.watched.pop(wd, None)
+                continue
+            if not name:
+                continue
+
+            path = os.path.join(folder, name)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.remove(path)
+            elif mask & IN_ISDIR:
+                if os.path.join(self.root, path) != self.skip:
+                    self.add(path)
+                    self.add_tree(path)
+            else:
+                self.add(path)
+
+    def remove_all(self):
+        with self.lock:
+            self.ids.clear()
+            self.paths.clear()
+            self.names.clear()
+            self.grams.clear()
+            self.children = {'': set()}
+
+    def search(self, query, offset, limit):
+        """
+        Return the number of names containing query (case-insensitive) and the paths of one page of them.
+        """
+        query = query.lower()
+        with self.lock:
+            if len(query) >= 3:
+                postings = sorted((self.grams.get(query[i:i + 3], set()) for i in range(len(query) - 2)), key=len)
+                candidates = set.intersection(*postings)
+            else:
+                candidates = self.names.keys()
+            if len(query) == 3:
+                matches = [self.paths[entry_id] for entry_id in candidates]
+            else:
+                matches = [self.paths[entry_id] for entry_id in candidates if query in self.names[entry_id]]
+        # Only the requested page is put in order, not every match
+        return len(matches), heapq.nsmallest(offset + limit, matches)[offset:]
+
+app = Flask(__name__)
+app.request_class = StreamingRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+
+# Temporary files of uploads interrupted by an earlier crash; recent ones may belong to another worker
+for name in os.listdir(UPLOAD_TEMP_FOLDER):
+    temp_path = os.path.join(UPLOAD_TEMP_FOLDER, name)
+    if name.startswith('upload-') and os.path.getmtime(temp_path) < time.time() - STALE_UPLOAD_AGE:
+        os.remove(temp_path)
+
+search_index = SearchIndex(UPLOAD_FOLDER, UPLOAD_TEMP_FOLDER)
+search_index.start()
+
 # HTML template for the file system, upload, download, and search bar
 HTML_TEMPLATE = """
 <!doctype html>
@@ -45,6 +380,13 @@ HTML_TEMPLATE = """
 
     <!-- File System View -->
     <h2>File System</h2>
+    <p>
+        Sort by:
+        {% for key, label in [('name', 'Name'), ('size', 'Size'), ('mtime', 'Modified')] %}
+            <a href="{{ url_for('browse', path=current_folder, sort=key, order='desc' if sort == key and order == 'asc' else 'asc') }}">{{ label }}{% if sort == key %} {{ '▲' if order == 'asc' else '▼' }}{% endif %}</a>
+        {% endfor %}
+        | {{ files_and_folders|length }} of {{ total }} items
+    </p>
     <ul>
         {% if parent_folder %}
             <li><a href="/browse?path={{ parent_folder }}">⬆️ Go Back</a></li>
@@ -57,90 +399,772 @@ HTML_TEMPLATE = """
             {% endif %}
         {% endfor %}
     </ul>
+    {% if cursor %}
+        <a href="{{ url_for('browse', path=current_folder, sort=sort, order=order, limit=limit) }}">⏮ First page</a>
+    {% endif %}
+    {% if next_cursor %}
+        <a href="{{ url_for('browse', path=current_folder, sort=sort, order=order, limit=limit, cursor=next_cursor) }}">Next page ➡️</a>
+    {% endif %}
 </body>
 </html>
 """
+# Compiled once; render_template_string would parse the template again on every request
+BROWSE_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+def scan_listing(full_path, stat):
+    """
+    Read a folder's entries and return them as (st_ino, st_mtime_ns, digest, entries, {}).
+    The digest covers every entry's name, type, size and mtime.
+    """
+    root = os.path.realpath(UPLOAD_FOLDER)
+    temp_root = os.path.realpath(UPLOAD_TEMP_FOLDER)
+    prefix = '' if full_path == root else os.path.join(os.path.relpath(full_path, root), '')
+    entries = []
+    with os.scandir(full_path) as it:
+        for entry in it:
+            if entry.path == temp_root:
+                continue
+            try:
+                is_folder = entry.is_dir()
+                entry_stat = entry.stat()
+            except OSError:
+                # Broken symlink
+                is_folder = False
+                entry_stat = entry.stat(follow_symlinks=False)
+            entries.append({
+                "name": entry.name,
+                "path": prefix + entry.name,
+                "is_folder": is_folder,
+                "size": 0 if is_folder else entry_stat.st_size,
+                "mtime": entry_stat.st_mtime,
+            })
+    digest = hashlib.sha256(json.dumps(
+        [[entry['name'], entry['is_folder'], entry['size'], entry['mtime']] for entry in entries]).encode())
+    return (stat.st_ino, stat.st_mtime_ns, digest.hexdigest()[:16], entries, {})
+
+def restat_listing(full_path):
+    """
+    Rescan a cached folder in the background and replace its listing if an entry changed in place.
+    """
+    try:
+        cached = scan_listing(full_path, os.stat(full_path))
+    except OSError:
+        cached = None
+    with listing_lock:
+        listing_restats.discard(full_path)
+        current = listing_cache.get(full_path)
+        # A folder that changed meanwhile was rescanned by the request that noticed
+        if cached is not None and current is not None and current[:2] == cached[:2]:
+            listing_checked[full_path] = time.monotonic()
+            if current[2] != cached[2]:
+                listing_cache[full_path] = cached
+
+def read_listing(full_path):
+    """
+    Return a folder's stat result and its listing as (st_ino, st_mtime_ns, digest, entries, sorted orders),
+    from the cache while the folder's inode and mtime are unchanged.
+    Entries are added, removed and renamed through the folder, which updates its mtime; a file
+    rewritten in place doesn't, so cached folders are rescanned in the background at most once
+    per BROWSE_RESTAT_INTERVAL, and the next request sees the change.
+    """
+    stat = os.stat(full_path)
+    now = time.monotonic()
+    with listing_lock:
+        cached = listing_cache.get(full_path)
+        if cached is not None and cached[:2] == (stat.st_ino, stat.st_mtime_ns):
+            listing_cache.move_to_end(full_path)
+            if now - listing_checked[full_path] >= BROWSE_RESTAT_INTERVAL and full_path not in listing_restats:
+                listing_restats.add(full_path)
+                threading.Thread(target=restat_listing, args=(full_path,), daemon=True).start()
+            return stat, cached
+
+    cached = scan_listing(full_path, stat)
+    with listing_lock:
+        listing_cache[full_path] = cached
+        listing_cache.move_to_end(full_path)
+        listing_checked[full_path] = now
+        while len(listing_cache) > BROWSE_CACHE_SIZE:
+            evicted, _ = listing_cache.popitem(last=False)
+            del listing_checked[evicted]
+    return stat, cached
+
+def sort_key(entry, sort):
+    """
+    Unique key of entry in a listing sorted by sort; folders come first in ascending order.
+    """
+    if sort == 'name':
+        return (not entry['is_folder'], entry['name'].lower(), entry['name'])
+    return (not entry['is_folder'], entry[sort], entry['name'].lower(), entry['name'])
+
+def sorted_listing(cached, sort):
+    """
+    Return the (keys, entries) of a cached listing in ascending sort order, sorting it once per listing.
+    """
+    orders = cached[4]
+    if sort not in orders:
+        keyed = sorted(((sort_key(entry, sort), entry) for entry in cached[3]), key=lambda pair: pair[0])
+        orders[sort] = ([key for key, _ in keyed], [entry for _, entry in keyed])
+    return orders[sort]
+
+def encode_cursor(sort, key):
+    return base64.urlsafe_b64encode(json.dumps([sort, key]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort):
+    """
+    Return the sort key a cursor points after. Raises ValueError for cursors this server did not make
+    and for cursors made for another sort, whose keys would compare but point at the wrong place.
+    """
+    try:
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError(cursor)
+    if cursor_sort != sort or not isinstance(key, list):
+        raise ValueError(cursor)
+    return tuple(key)
+
+def listing_page(keys, entries, sort, order, cursor, limit):
+    """
+    Return the page of entries after cursor and the cursor of the page after it, or None on the last page.
+    The cursor holds the sort key of the last entry sent, so pages stay consistent while the folder changes.
+    """
+    if order == 'asc':
+        start = 0 if cursor is None else bisect.bisect_right(keys, cursor)
+        page = entries[start:start + limit]
+        more = start + limit < len(entries)
+        last = start + len(page) - 1
+    else:
+        end = len(entries) if cursor is None else bisect.bisect_left(keys, cursor)
+        page = entries[max(end - limit, 0):end][::-1]
+        more = end - limit > 0
+        last = max(end - limit, 0)
+    return page, encode_cursor(sort, keys[last]) if more else None
+
+def resolve_path(relative_path):
+    """
+    Return the absolute path of relative_path inside UPLOAD_FOLDER, or None if it points outside it
+    or into UPLOAD_TEMP_FOLDER, which holds other clients' uploads in progress.
+    """
+    root = os.path.realpath(UPLOAD_FOLDER)
+    temp_root = os.path.realpath(UPLOAD_TEMP_FOLDER)
+    full_path = os.path.realpath(os.path.join(root, relative_path))
+    if full_path != root and not full_path.startswith(root + os.sep):
+        return None
+    if full_path == temp_root or full_path.startswith(temp_root + os.sep):
+        return None
+    return full_path
 
-def get_file_system(path):
+def finish_upload(upload, file_path, expected_sha256=None):
     """
-    Retrieve the list of files and folders in the specified path.
+    Verify an upload's checksum if the client sent one, move it into place and report its throughput.
     """
-    items = []
-    for item in os.listdir(path):
-        item_path = os.path.join(path, item)
-        items.append({
-            "name": item,
-            "path": os.path.relpath(item_path, UPLOAD_FOLDER),
-            "is_folder": os.path.isdir(item_path),
+    digest = upload.sha256.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != digest:
+        upload.discard()
+        return jsonify({"error": "Checksum mismatch", "sha256": digest}), 400
+    upload.commit(file_path)
+    relative_path = os.path.relpath(file_path, os.path.realpath(UPLOAD_FOLDER))
+    search_index.add(relative_path)
+
+    seconds = max(time.monotonic() - upload.started, 1e-6)
+    rate = upload.size / seconds / 1e6
+    app.logger.info("Uploaded %s: %d bytes in %.2fs (%.1f MB/s)", relative_path, upload.size, seconds, rate)
+    return jsonify({
+        "message": f"File {relative_path} uploaded successfully",
+        "size": upload.size,
+        "sha256": digest,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(rate, 1),
+    }), 200
+
+def resumable_paths(upload_id):
+    """
+    Return the (data file, sidecar) paths of a resumable upload.
+    """
+    base = os.path.join(RESUMABLE_FOLDER, upload_id)
+    return base + '.part', base + '.json'
+
+@contextmanager
+def resumable_state(upload_id):
+    """
+    Lock a resumable upload's sidecar and yield its state, which is saved back on exit.
+    Raises FileNotFoundError for unknown or finished uploads.
+    """
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        raise FileNotFoundError(upload_id)
+    _, sidecar = resumable_paths(upload_id)
+    with resumable_lock, open(sidecar, 'r+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        state = json.load(f)
+        yield state
+        f.seek(0)
+        f.truncate()
+        json.dump(state, f)
+
+def add_range(ranges, start, end):
+    """
+    Merge [start, end) into a sorted list of disjoint [start, end] byte ranges.
+    """
+    merged = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+def contiguous_offset(state):
+    """
+    Bytes received without a gap from the start of the file, which is where a single client resumes.
+    """
+    ranges = state['ranges']
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+def resumable_status(upload_id, state, status=200):
+    """
+    Response carrying an upload's progress in tus-style headers, and as JSON unless status is 204.
+    """
+    if status == 204:
+        response = app.response_class(status=204)
+    else:
+        response = jsonify({
+            "id": upload_id,
+            "path": state['path'],
+            "length": state['length'],
+            "offset": contiguous_offset(state),
+            "ranges": state['ranges'],
         })
-    return items
+        response.status_code = status
+    response.headers['Upload-Offset'] = str(contiguous_offset(state))
+    response.headers['Upload-Length'] = str(state['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def expire_resumable_uploads():
+    """
+    Remove unfinished resumable uploads nobody has touched for RESUMABLE_EXPIRY seconds.
+    """
+    cutoff = time.time() - RESUMABLE_EXPIRY
+    for name in os.listdir(RESUMABLE_FOLDER):
+        path = os.path.join(RESUMABLE_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def finish_resumable(upload_id, state):
+    """
+    Check the assembled file against the expected checksum and move it into place.
+    """
+    part, sidecar = resumable_paths(upload_id)
+    sha256 = hashlib.sha256()
+    with open(part, 'rb') as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    digest = sha256.hexdigest()
+
+    file_path = resolve_path(state['path'])
+    if state['sha256'] and state['sha256'] != digest:
+        error, status = {"error": "Checksum mismatch; upload discarded", "sha256": digest}, 400
+    elif file_path is None or os.path.isdir(file_path):
+        error, status = {"error": "Invalid path"}, 400
+    else:
+        error = None
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(part, file_path)
+        search_index.add(os.path.relpath(file_path, os.path.realpath(UPLOAD_FOLDER)))
+    for path in (part, sidecar):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if error:
+        return jsonify(error), status
+
+    seconds = max(time.time() - state['created'], 1e-6)
+    app.logger.info("Resumable upload %s finished: %d bytes in %.2fs", state['path'], state['length'], seconds)
+    return jsonify({
+        "message": f"File {state['path']} uploaded successfully",
+        "size": state['length'],
+        "sha256": digest,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(state['length'] / seconds / 1e6, 1),
+    }), 200
+
+def file_etag(stat):
+    """
+    Strong validator for a file that changes whenever it is replaced or rewritten, without reading it.
+    """
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def if_range_matches(etag, last_modified):
+    """
+    Whether the client's If-Range validator still matches, so its Range header may be honoured.
+    """
+    if 'If-Range' not in request.headers:
+        return True
+    if_range = parse_if_range_header(request.headers['If-Range'])
+    if if_range.etag is not None:
+        return not request.headers['If-Range'].startswith('W/') and if_range.etag == etag
+    if if_range.date is not None:
+        return int(if_range.date.timestamp()) == int(last_modified)
+    return False
+
+def requested_ranges(size):
+    """
+    Return the satisfiable (start, stop) byte ranges of the Range header, sorted with overlaps merged.
+    None means the header is absent, malformed or asks for too many ranges and the whole file is sent;
+    an empty list means no range is satisfiable.
+    """
+    units, _, spec = request.headers.get('Range', '').partition('=')
+    if units.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for item in spec.split(','):
+        match = BYTE_RANGE_PATTERN.fullmatch(item)
+        if not match or not any(match.groups()):
+            return None
+        first, last = match.groups()
+        if not first:
+            start, stop = max(size - int(last), 0), size
+        elif last and int(last) < int(first):
+            return None
+        else:
+            start, stop = int(first), size if not last else min(int(last) + 1, size)
+        if start < stop:
+            ranges.append((start, stop))
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    if len(merged) > MAX_DOWNLOAD_RANGES:
+        return None
+    return merged
+
+def read_chunks(f, length):
+    """
+    Yield up to length bytes from the current position of f.
+    """
+    while length > 0:
+        chunk = f.read(min(length, DOWNLOAD_CHUNK_SIZE))
+        if not chunk:
+            break
+        length -= len(chunk)
+        yield chunk
+
+def stream_file(f, length):
+    """
+    Yield up to length bytes from the current position of f, then close it.
+    """
+    with f:
+        yield from read_chunks(f, length)
+
+def file_body(f, start, length):
+    """
+    Response body for length bytes of f from start. The server's wsgi.file_wrapper sends it from the
+    file's current offset (with sendfile where it has one) and stops at the Content-Length; wrappers
+    in LENGTH_UNAWARE_FILE_WRAPPERS are only given whole files, and ranges are streamed instead.
+    """
+    f.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is None:
+        return stream_file(f, length)
+    if file_wrapper in LENGTH_UNAWARE_FILE_WRAPPERS and start + length != os.fstat(f.fileno()).st_size:
+        return stream_file(f, length)
+    return file_wrapper(f, DOWNLOAD_CHUNK_SIZE)
+
+def part_header(boundary, content_type, start, stop, size):
+    """
+    Header of one multipart/byteranges part, including the boundary line before it.
+    """
+    return (f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode()
+
+def multipart_body(f, ranges, boundary, content_type, size):
+    """
+    Yield a multipart/byteranges body with one part per range, then close f.
+    """
+    with f:
+        for start, stop in ranges:
+            yield part_header(boundary, content_type, start, stop, size)
+            f.seek(start)
+            yield from read_chunks(f, stop - start)
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+def attachment_disposition(name):
+    """
+    Content-Disposition header options for downloading name, with an RFC 5987 fallback for non-ASCII names.
+    """
+    try:
+        name.encode('ascii')
+        return {"filename": name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        return {"filename": simple, "filename*": "UTF-8''" + quote(name, safe="!#$&+^`|~")}
+
+@app.teardown_request
+def discard_unfinished_uploads(error=None):
+    """
+    Remove the temporary files of uploads that were not committed (rejected or interrupted).
+    """
+    for upload in request.__dict__.get('uploads', ()):
+        upload.discard()
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error):
+    return jsonify({"error": f"Upload exceeds the {app.config['MAX_CONTENT_LENGTH']} byte limit"}), 413
 
 @app.route('/')
 @app.route('/browse')
 def browse():
     """
-    Show the file system starting from the upload folder.
+    Show the file system starting from the upload folder, one page at a time.
+    Answers with JSON for format=json or a client that prefers it, and with 304 when the client's
+    ETag shows it already has this page.
     """
     browse_path = request.args.get('path', '')
-    full_path = os.path.join(UPLOAD_FOLDER, browse_path)
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    cursor = request.args.get('cursor') or None
+    if sort not in BROWSE_SORTS or order not in ('asc', 'desc'):
+        return jsonify({"error": f"sort must be one of {', '.join(BROWSE_SORTS)} and order asc or desc"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', BROWSE_PAGE_SIZE)), 1), BROWSE_MAX_PAGE_SIZE)
+        cursor_key = None if cursor is None else decode_cursor(cursor, sort)
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    as_json = request.args.get('format') == 'json' or (
+        request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json')
 
     # Validate the path
-    if not os.path.exists(full_path):
+    full_path = resolve_path(browse_path)
+    if full_path is None:
+        return jsonify({"error": "Path not found"}), 404
+    try:
+        stat, cached = read_listing(full_path)
+    except (FileNotFoundError, NotADirectoryError):
         return jsonify({"error": "Path not found"}), 404
+    except PermissionError:
+        return jsonify({"error": "Permission denied"}), 403
+
+    # The page only depends on the folder's contents and the request's paging options
+    options = json.dumps([browse_path, sort, order, cursor, limit, as_json])
+    etag = f"{stat.st_ino:x}-{cached[2]}-{hashlib.sha256(options.encode()).hexdigest()[:16]}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
 
     # Get parent folder for navigation
-    parent_folder = os.path.relpath(os.path.dirname(full_path), UPLOAD_FOLDER) if browse_path else None
+    root = os.path.realpath(UPLOAD_FOLDER)
+    parent_folder = os.path.relpath(os.path.dirname(full_path), root) if full_path != root else None
 
-    # Get file and folder structure
-    files_and_folders = get_file_system(full_path)
-    return render_template_string(HTML_TEMPLATE, files_and_folders=files_and_folders, current_folder=browse_path, parent_folder=parent_folder)
+    keys, entries = sorted_listing(cached, sort)
+    try:
+        page, next_cursor = listing_page(keys, entries, sort, order, cursor_key, limit)
+    except TypeError:
+        # A forged cursor whose key doesn't compare with this sort's keys
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    if as_json:
+        response = jsonify({
+            "path": os.path.relpath(full_path, root),
+            "parent": parent_folder,
+            "entries": page,
+            "total": len(entries),
+            "sort": sort,
+            "order": order,
+            "limit": limit,
+            "next_cursor": next_cursor,
+        })
+    else:
+        response = app.make_response(render_template(
+            BROWSE_TEMPLATE, files_and_folders=page, current_folder=browse_path, parent_folder=parent_folder,
+            total=len(entries), sort=sort, order=order, limit=limit, cursor=cursor, next_cursor=next_cursor))
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """
     Upload a file to the current folder.
+    The file part is streamed to disk as it arrives; an optional sha256 field is checked against it.
     """
     current_folder = request.form.get('current_folder', '')
-    upload_path = os.path.join(UPLOAD_FOLDER, current_folder)
+    upload_path = resolve_path(current_folder)
+    if upload_path is None:
+        return jsonify({"error": "Invalid path"}), 400
 
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
 
     file = request.files['file']
-    if file.filename == '':
+    filename = os.path.basename(file.filename or '')
+    if filename in ('', '.', '..'):
         return jsonify({"error": "No selected file"}), 400
 
-    file_path = os.path.join(upload_path, file.filename)
+    file_path = os.path.join(upload_path, filename)
+    if os.path.isdir(file_path):
+        return jsonify({"error": "Invalid path"}), 400
+
     os.makedirs(upload_path, exist_ok=True)
-    file.save(file_path)
-    return jsonify({"message": f"File {file.filename} uploaded successfully to {current_folder}"}), 200
+    return finish_upload(file.stream, file_path, request.form.get('sha256'))
+
+@app.route('/upload/<path:filename>', methods=['PUT'])
+def put_file(filename):
+    """
+    Upload the raw request body as a file, with no multipart encoding to parse.
+    An X-Checksum-Sha256 header, if sent, is checked against the received data.
+    """
+    file_path = resolve_path(filename)
+    if file_path is None or file_path == os.path.realpath(UPLOAD_FOLDER) or os.path.isdir(file_path):
+        return jsonify({"error": "Invalid path"}), 400
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    upload = HashingFile()
+    request.__dict__.setdefault('uploads', []).append(upload)
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        upload.write(chunk)
+    return finish_upload(upload, file_path, request.headers.get('X-Checksum-Sha256'))
+
+@app.route('/uploads', methods=['POST'])
+def create_resumable_upload():
+    """
+    Start a resumable upload. The JSON body gives the destination path, the length in bytes
+    and optionally the sha256 the assembled file must have.
+    """
+    expire_resumable_uploads()
+    params = request.get_json(silent=True) or {}
+    relative_path = str(params.get('path', ''))
+    file_path = resolve_path(relative_path)
+    if file_path is None or file_path == os.path.realpath(UPLOAD_FOLDER) or os.path.isdir(file_path):
+        return jsonify({"error": "Invalid path"}), 400
+    try:
+        length = int(params.get('length', request.headers.get('Upload-Length')))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Upload length required"}), 400
+    if not 0 <= length <= app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({"error": f"Upload exceeds the {app.config['MAX_CONTENT_LENGTH']} byte limit"}), 413
+
+    upload_id = secrets.token_hex(16)
+    part, sidecar = resumable_paths(upload_id)
+    # Sparse: no blocks are allocated until chunks are written into it
+    with open(part, 'wb') as f:
+        f.truncate(length)
+    state = {
+        "path": os.path.relpath(file_path, os.path.realpath(UPLOAD_FOLDER)),
+        "length": length,
+        "sha256": str(params.get('sha256') or '').lower(),
+        "ranges": [],
+        "created": time.time(),
+        "finishing": False,
+    }
+    with open(sidecar, 'w') as f:
+        json.dump(state, f)
+    if length == 0:
+        return finish_resumable(upload_id, state)
+
+    response = resumable_status(upload_id, state, 201)
+    response.headers['Location'] = f"/uploads/{upload_id}"
+    return response
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def resumable_upload_status(upload_id):
+    """
+    Report how much of a resumable upload has arrived (HEAD gives just the Upload-Offset header).
+    """
+    try:
+        with resumable_state(upload_id) as state:
+            return resumable_status(upload_id, state)
+    except FileNotFoundError:
+        return jsonify({"error": "Upload not found"}), 404
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def patch_resumable_upload(upload_id):
+    """
+    Write the request body at the Upload-Offset header's position. Chunks may arrive in any order
+    and over parallel connections; the last missing one completes the upload.
+    """
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "Upload-Offset header required"}), 400
+    try:
+        with resumable_state(upload_id) as state:
+            length = state['length']
+    except FileNotFoundError:
+        return jsonify({"error": "Upload not found"}), 404
+    if not 0 <= offset <= length:
+        return jsonify({"error": "Upload-Offset outside the file"}), 400
+
+    # Written outside the lock: parallel chunks cover different bytes of the file
+    part, _ = resumable_paths(upload_id)
+    try:
+        fd = os.open(part, os.O_WRONLY)
+    except FileNotFoundError:
+        # Finished or cancelled since the state was read
+        return jsonify({"error": "Upload not found"}), 404
+    written = 0
+    overrun = False
+    try:
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if offset + written + len(chunk) > length:
+                overrun = True
+                break
+            view = memoryview(chunk)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                view = view[count:]
+                written += count
+    finally:
+        # Whatever arrived before a dropped connection counts, once it is on disk
+        if written:
+            os.fsync(fd)
+        os.close(fd)
+        if written:
+            try:
+                with resumable_state(upload_id) as state:
+                    state['ranges'] = add_range(state['ranges'], offset, offset + written)
+            except FileNotFoundError:
+                pass
+    if overrun:
+        return jsonify({"error": "Chunk runs past the upload length"}), 400
+
+    try:
+        with resumable_state(upload_id) as state:
+            # finishing holds the time another request started the finish; a stale one was interrupted
+            finish = (state['ranges'] == [[0, length]]
+                      and time.time() - (state['finishing'] or 0) > RESUMABLE_FINISH_TIMEOUT)
+            if finish:
+                state['finishing'] = time.time()
+    except FileNotFoundError:
+        return jsonify({"error": "Upload not found"}), 404
+    if finish:
+        try:
+            return finish_resumable(upload_id, state)
+        except BaseException:
+            # Let the next PATCH try again rather than wait out the timeout
+            try:
+                with resumable_state(upload_id) as state:
+                    state['finishing'] = False
+            except FileNotFoundError:
+                pass
+            raise
+    return resumable_status(upload_id, state, 204)
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_resumable_upload(upload_id):
+    """
+    Abandon a resumable upload and free its space.
+    """
+    try:
+        with resumable_state(upload_id):
+            pass
+    except FileNotFoundError:
+        return jsonify({"error": "Upload not found"}), 404
+    for path in resumable_paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return jsonify({"message": f"Upload {upload_id} cancelled"}), 200
 
 @app.route('/files/<path:filename>', methods=['GET'])
 def get_file(filename):
     """
     Download a file from the server.
+    Answers conditional requests with 304 and Range requests with one range or multipart/byteranges.
     """
+    file_path = resolve_path(filename)
+    if file_path is None:
+        return jsonify({"error": "File not found"}), 404
     try:
-        directory = os.path.join(UPLOAD_FOLDER, os.path.dirname(filename))
-        return send_from_directory(directory, os.path.basename(filename), as_attachment=True)
-    except FileNotFoundError:
+        f = open(file_path, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
         return jsonify({"error": "File not found"}), 404
+    stat = os.fstat(f.fileno())
+    size = stat.st_size
+    etag = file_etag(stat)
+    content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+    response = Response(status=200, direct_passthrough=True)
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.cache_control.no_cache = True
+    response.accept_ranges = 'bytes'
+    response.headers.set('Content-Disposition', 'attachment', **attachment_disposition(os.path.basename(file_path)))
+
+    if not is_resource_modified(request.environ, etag, last_modified=http_date(stat.st_mtime)):
+        f.close()
+        response.status_code = 304
+        return response
+
+    ranges = requested_ranges(size) if if_range_matches(etag, stat.st_mtime) else None
+    if ranges == []:
+        f.close()
+        response.status_code = 416
+        response.headers['Content-Range'] = f"bytes */{size}"
+        return response
+    response.call_on_close(f.close)
+
+    if ranges is None:
+        response.content_type = content_type
+        response.content_length = size
+        response.response = file_body(f, 0, size)
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        response.status_code = 206
+        response.content_type = content_type
+        response.content_length = stop - start
+        response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+        response.response = file_body(f, start, stop - start)
+    else:
+        boundary = secrets.token_hex(16)
+        response.status_code = 206
+        response.content_type = f"multipart/byteranges; boundary={boundary}"
+        response.content_length = sum(
+            len(part_header(boundary, content_type, start, stop, size)) + stop - start for start, stop in ranges
+        ) + len(f"\r\n--{boundary}--\r\n")
+        response.response = multipart_body(f, ranges, boundary, content_type, size)
+    return response
 
 @app.route('/search', methods=['GET'])
 def search():
     """
     Search for files and folders across the file system.
+    Results come from the in-memory index in path order, limit at a time from offset.
     """
-    query = request.args.get('query', '').lower()
-    matches = []
-
-    for root, dirs, files in os.walk(UPLOAD_FOLDER):
-        for name in dirs + files:
-            if query in name.lower():
-                relative_path = os.path.relpath(os.path.join(root, name), UPLOAD_FOLDER)
-                matches.append(relative_path)
+    query = request.args.get('query', '')
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
 
-    return jsonify({"matches": matches}), 200
+    search_index.ready.wait()
+    total, matches = search_index.search(query, offset, limit)
+    return jsonify({
+        "matches": matches,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + limit if offset + limit < total else None,
+    }), 200
 
 @app.route('/delete', methods=['GET'])
 def delete_file():
@@ -148,13 +1172,22 @@ def delete_file():
     Delete a file or folder.
     """
     path = request.args.get('path', '')
-    full_path = os.path.join(UPLOAD_FOLDER, path)
+    # The folder is resolved but not the name, so deleting a symlink removes the link, not its target
+    folder, name = os.path.split(os.path.normpath(path))
+    folder_path = resolve_path(folder)
+    if folder_path is None or name in ('', '.', '..'):
+        return jsonify({"error": "File not found"}), 404
+    full_path = os.path.join(folder_path, name)
+    # Still refuse the upload staging folder itself
+    if resolve_path(full_path) is None and not os.path.islink(full_path):
+        return jsonify({"error": "File not found"}), 404
 
     if os.path.isdir(full_path):
         return jsonify({"error": "Cannot delete folders"}), 400
 
     try:
         os.remove(full_path)
+        search_index.remove(os.path.relpath(full_path, os.path.realpath(UPLOAD_FOLDER)))
         return jsonify({"message": f"Deleted {path}"}), 200
     except FileNotFoundError:
         return jsonify({"error": "File not found"}), 404